@@ -0,0 +1,458 @@
+#-------------------------------------------------------------------------------
+# Name:        CaveFormat.py
+# Purpose: To store caves in a compact binary .cave format, with 2 bits per cell
+#          (3 if the cave has path markers, 'X', in it) instead of the 1-2 bytes
+#          per cell of the .txt format. The cells are stored in fixed-size tiles
+#          found through an offset table, so any tile or region of the cave can
+#          be read (or rewritten) without decoding the rest. Also converts caves
+#          between .txt and .cave.
+#
+# Author:      odanielb (Bridget O'Daniel)
+#
+# Usage:   python CaveFormat.py [--tile ROWSxCOLS] IN OUT
+#               Converts IN to OUT, each a .txt or .cave file (the format of IN
+#               is worked out from its contents).
+#
+# File layout: a header (MAGIC, version, rows, cols, tile rows, tile cols, bits
+#              per cell, bytes per treasure, start row, start col, number of
+#              treasures), the treasure index (each treasure as row*cols+col, in 4
+#              bytes, or 8 for caves of 2**32 cells or more), the offset table
+#              (where each tile starts in the file, tile after tile along each
+#              row of tiles, then where the last tile ends) and then the tiles.
+#              Each tile holds its cells row after row, packed low bits first.
+#
+# Uses NumPy to pack and unpack 2 bit cells if it is installed, otherwise falls
+# back to plain Python.
+#-------------------------------------------------------------------------------
+import argparse
+import mmap
+import struct
+import sys
+from array import array
+from GridMap import GridMap
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+MAGIC = b'CAVEBIN1'
+VERSION = 1
+HEADER = struct.Struct('<8sHIIHHBBIIQ')                                         #Magic, version, rows, cols, tile rows, tile cols, bits, bytes per treasure, start row, start col, treasures
+NO_START = 0xFFFFFFFF                                                           #Start row and col of a cave with no explorer in it
+TILE_SIZE = 128                                                                 #Rows and columns in a tile, unless asked for otherwise (a 4KB page, at 2 bits per cell)
+MAX_TILE_SIZE = 0xFFFF                                                          #Tile rows and columns are stored in 2 bytes each
+INDEX_TYPES = {4: 'I', 8: 'Q'}                                                  #Bytes per treasure -> array type
+CODES = {2: b'W.TM', 3: b'W.TMX'}                                               #Bits per cell -> the contents each code stands for
+_TO_CODE = dict((bits, bytes.maketrans(contents, bytes(range(len(contents))))) for bits, contents in CODES.items())
+_FROM_CODE = dict((bits, bytes.maketrans(bytes(range(len(contents))), contents)) for bits, contents in CODES.items())
+_UNPACK_2 = [bytes((byte >> shift) & 3 for shift in (0, 2, 4, 6)) for byte in range(256)]   #The four codes in each byte of 2 bit cells
+_PACK_2 = dict((int.from_bytes(codes, sys.byteorder), byte) for byte, codes in enumerate(_UNPACK_2))   #Four codes, read as a native 32 bit int -> their byte
+_UNPACK_3 = [bytes((bits >> shift) & 7 for shift in (0, 3, 6, 9)) for bits in range(4096)]   #The four codes in every 12 bits of 3 bit cells
+_PACK_3 = dict((int.from_bytes(codes, sys.byteorder), bits) for bits, codes in enumerate(_UNPACK_3))   #Four codes, read as a native 32 bit int -> their 12 bits
+
+
+def is_cave_file(buf):
+    """Returns True if buf (the start of a file, or all of it) is in .cave format."""
+    return buf[:len(MAGIC)] == MAGIC
+
+
+
+class CaveFile(object):
+
+    def __init__(self, buf, file_name='The cave'):
+        """Reads the header and offset table of the .cave held in buf, without
+        decoding any tiles or reading the treasure index.
+        pre: buf is a bytes-like object (like an mmap) holding a .cave file, and
+        must be writable for write_tile to be used. file_name is used in errors.
+        post: Creates a CaveFile. Raises ValueError if buf does not hold a .cave
+        file."""
+        if len(buf) < HEADER.size or not is_cave_file(buf):
+            raise ValueError(file_name+" is not a .cave file!")
+        (magic, version, self.rows, self.cols, self.tile_rows, self.tile_cols, self.bits,
+         width, start_row, start_col, count) = HEADER.unpack_from(buf, 0)
+        if version != VERSION or self.bits not in CODES or width not in INDEX_TYPES or self.tile_rows < 1 or self.tile_cols < 1:
+            raise ValueError(file_name+" is a .cave file this version can't read!")
+        self.buf = buf
+        self.file = None
+        self.start = None if start_row == NO_START else (start_row, start_col)
+        self.tiles_down = -(-self.rows // self.tile_rows)
+        self.tiles_across = -(-self.cols // self.tile_cols)
+        self.index_width = width                                                #The treasure index is only read if asked for (see get_treasures)
+        self.treasure_count = count
+        at = HEADER.size + width * count
+        tiles = self.tiles_down * self.tiles_across
+        self.offsets = array('Q', bytes(buf[at:at + 8 * (tiles + 1)]))
+        if len(self.offsets) != tiles + 1 or self.offsets[0] != at + 8 * (tiles + 1) or self.offsets[-1] != len(buf):
+            raise ValueError(file_name+" is cut short or damaged!")
+
+
+    @classmethod
+    def open(cls, file_name, writable=False):
+        """Opens the .cave file called file_name, memory-mapping it so tiles are
+        only read from disk when they are asked for. If writable is True, tiles
+        can be rewritten in place with write_tile.
+        post: returns a CaveFile; close it when done. Raises IOError if the file
+        can't be opened and ValueError if it is not a .cave file."""
+        open_file = open(file_name, 'r+b' if writable else 'rb')
+        try:
+            buf = mmap.mmap(open_file.fileno(), 0, access=mmap.ACCESS_WRITE if writable else mmap.ACCESS_READ)
+        except ValueError:
+            open_file.close()
+            raise ValueError(file_name+" is empty!")
+        try:
+            cave = cls(buf, file_name)
+        except ValueError:
+            buf.close()
+            open_file.close()
+            raise
+        cave.file = open_file
+        return cave
+
+
+    def close(self):
+        """Closes the file, writing any rewritten tiles back to it."""
+        if self.file is not None:
+            self.buf.close()
+            self.file.close()
+            self.file = None
+
+
+    def read_treasure_index(self):
+        """Reads the treasure index from the file.
+        post: returns row*cols+col of every treasure when the cave was saved, in
+        order, as an array."""
+        at = HEADER.size
+        return array(INDEX_TYPES[self.index_width], bytes(self.buf[at:at + self.index_width * self.treasure_count]))
+
+
+    def get_treasures(self):
+        """Returns the positions of the treasure when the cave was saved, as a
+        tuple of (row, col) tuples."""
+        return tuple(divmod(index, self.cols) for index in self.read_treasure_index())
+
+
+    def get_tile_shape(self, tile_row, tile_col):
+        """Returns the number of rows and columns in a tile (tiles on the bottom
+        and right edges of the cave may be smaller)."""
+        rows = min(self.tile_rows, self.rows - tile_row * self.tile_rows)
+        cols = min(self.tile_cols, self.cols - tile_col * self.tile_cols)
+        return rows, cols
+
+
+    def read_tile(self, tile_row, tile_col):
+        """Returns the cells of one tile as a bytearray, row after row, one byte
+        (like GridMap's) per cell.
+        pre: 0 <= tile_row < tiles_down and 0 <= tile_col < tiles_across."""
+        tile = tile_row * self.tiles_across + tile_col
+        rows, cols = self.get_tile_shape(tile_row, tile_col)
+        packed = self.buf[self.offsets[tile]:self.offsets[tile + 1]]
+        return bytearray(_unpack(packed, rows * cols, self.bits).translate(_FROM_CODE[self.bits]))
+
+
+    def prefetch_tile(self, tile_row, tile_col):
+        """Asks the operating system to start reading a tile from disk in the
+        background, so read_tile won't have to wait for it (where memory-mapped
+        files support this; otherwise does nothing)."""
+        if self.file is None or not hasattr(mmap, 'MADV_WILLNEED'):
+            return
+        tile = tile_row * self.tiles_across + tile_col
+        start = self.offsets[tile] - self.offsets[tile] % mmap.PAGESIZE         #madvise needs a page-aligned start
+        self.buf.madvise(mmap.MADV_WILLNEED, start, self.offsets[tile + 1] - start)
+
+
+    def write_tile(self, tile_row, tile_col, cells):
+        """Rewrites one tile in place with cells, laid out as read_tile returns
+        them. The treasure index is left as it was when the cave was saved.
+        pre: the CaveFile was opened writable.
+        post: raises ValueError if some cell can't be stored in this file's bits
+        per cell."""
+        tile = tile_row * self.tiles_across + tile_col
+        self.buf[self.offsets[tile]:self.offsets[tile + 1]] = _pack(_to_codes(cells, self.bits), self.bits)
+
+
+    def read_region(self, top, left, rows, cols):
+        """Returns the cells of the rows x cols region of the cave whose top left
+        cell is (top, left) as a GridMap, decoding only the tiles it covers.
+        pre: the region lies inside the cave."""
+        region = bytearray(rows * cols)
+        if numpy is not None:
+            block = numpy.frombuffer(region, dtype=numpy.uint8).reshape(rows, cols)   #Writes straight into region
+        for tile_row in range(top // self.tile_rows, (top + rows - 1) // self.tile_rows + 1):
+            for tile_col in range(left // self.tile_cols, (left + cols - 1) // self.tile_cols + 1):
+                tile = self.read_tile(tile_row, tile_col)
+                tile_height, tile_width = self.get_tile_shape(tile_row, tile_col)
+                first_row, first_col = tile_row * self.tile_rows, tile_col * self.tile_cols
+                start_row, end_row = max(top, first_row), min(top + rows, first_row + tile_height)
+                start_col, end_col = max(left, first_col), min(left + cols, first_col + tile_width)
+                if numpy is not None:                                           #Copy the overlap in one go
+                    cells = numpy.frombuffer(tile, dtype=numpy.uint8).reshape(tile_height, tile_width)
+                    block[start_row - top:end_row - top, start_col - left:end_col - left] = \
+                        cells[start_row - first_row:end_row - first_row, start_col - first_col:end_col - first_col]
+                    continue
+                for row in range(start_row, end_row):
+                    at = (row - first_row) * tile_width
+                    region[(row - top) * cols + start_col - left:(row - top) * cols + end_col - left] = \
+                        tile[at + start_col - first_col:at + end_col - first_col]
+        return GridMap(rows, cols, region)
+
+
+    def read_all(self):
+        """Returns the whole cave as a GridMap, with its start and treasures set."""
+        grid = self.read_region(0, 0, self.rows, self.cols) if self.rows and self.cols else GridMap(self.rows, self.cols)
+        grid.start = self.start
+        grid.treasures = array('Q', self.read_treasure_index())
+        return grid
+
+
+def save_cave(grid, file_name, tile_rows=TILE_SIZE, tile_cols=TILE_SIZE):
+    """Writes grid to file_name in .cave format, in tiles of tile_rows x
+    tile_cols cells, writing each tile as soon as it is packed.
+    pre: grid is a GridMap holding only 'W', '.', 'T', 'M' and 'X' cells.
+    post: writes the file. Raises ValueError, before writing anything, if grid
+    holds anything else or the tiles are not from 1 to MAX_TILE_SIZE cells on
+    each side."""
+    check_tile_size(tile_rows, tile_cols)
+    cells = bytes(grid.cells)
+    _check_contents(cells, 3)
+    bits = 2 if b'X' not in cells else 3
+    rows, cols = grid.rows, grid.cols
+    start = cells.find(b'M')
+    width = 4 if rows * cols <= 0xFFFFFFFF else 8
+    treasures = array(INDEX_TYPES[width], find_treasures(cells))
+
+    with open(file_name, 'wb') as cave_file:
+        _write_layout(cave_file, rows, cols, tile_rows, tile_cols, bits, width,
+                      divmod(start, cols) if start != -1 else None, len(treasures))
+        cave_file.seek(HEADER.size)
+        cave_file.write(treasures.tobytes())
+        cave_file.seek(_tiles_start(rows, cols, tile_rows, tile_cols, width, len(treasures)))
+        for first_row in range(0, rows, tile_rows):
+            for tile in _pack_band(cells[first_row * cols:min(first_row + tile_rows, rows) * cols], cols, tile_cols, bits):
+                cave_file.write(tile)
+
+
+def load_cave(file_name):
+    """Loads the .cave file called file_name into a GridMap.
+    post: returns a GridMap with its start and treasures set. Raises IOError if
+    the file can't be opened and ValueError if it is not a .cave file."""
+    cave = CaveFile.open(file_name)
+    try:
+        return cave.read_all()
+    finally:
+        cave.close()
+
+
+def parse_cave(buf, file_name):
+    """Returns the .cave held in buf (the contents of file_name) as a GridMap."""
+    return CaveFile(buf, file_name).read_all()
+
+
+def txt_to_cave(txt_name, cave_name, tile_rows=TILE_SIZE, tile_cols=TILE_SIZE):
+    """Converts the cave in the .txt file txt_name to the .cave file cave_name,
+    reading it one band of tile_rows rows at a time, so caves too big to load
+    whole can be converted. The .txt file is read twice: once to check it and
+    find the start, the number of treasures and whether it has path markers,
+    and once to write it, band by band.
+    post: writes the file. Raises IOError if txt_name can't be opened and
+    ValueError, before writing anything, if it does not hold a map of the size
+    in its first line, holds cells other than 'W', '.', 'T', 'M' and 'X', or
+    the tiles are not from 1 to MAX_TILE_SIZE cells on each side."""
+    from MapLoader import read_rows                                             #MapLoader uses this module to read .cave files
+    check_tile_size(tile_rows, tile_cols)
+    with open(txt_name, 'rb') as txt_file:
+        try:
+            buf = mmap.mmap(txt_file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            raise ValueError(txt_name+" is empty!")
+        try:
+            if is_cave_file(buf):                                               #Already a .cave, so only the tiles change
+                save_cave(parse_cave(buf, txt_name), cave_name, tile_rows, tile_cols)
+                return
+            rows, cols, lines = read_rows(buf, txt_name)
+            bits, start, count = 2, None, 0
+            for row, line in enumerate(lines):
+                _check_contents(line, 3)
+                if bits == 2 and b'X' in line:
+                    bits = 3
+                if start is None and b'M' in line:
+                    start = (row, line.find(b'M'))
+                count += line.count(b'T')
+            width = 4 if rows * cols <= 0xFFFFFFFF else 8
+
+            with open(cave_name, 'wb') as cave_file:
+                _write_layout(cave_file, rows, cols, tile_rows, tile_cols, bits, width, start, count)
+                index_at = HEADER.size
+                tiles_at = _tiles_start(rows, cols, tile_rows, tile_cols, width, count)
+                band = []
+                first_row = 0
+                for line in read_rows(buf, txt_name)[2]:
+                    band.append(line)
+                    if len(band) < tile_rows and first_row + len(band) < rows:
+                        continue
+                    cells = b''.join(band)
+                    cave_file.seek(index_at)
+                    index_at += cave_file.write(array(INDEX_TYPES[width], find_treasures(cells, first_row * cols)).tobytes())
+                    cave_file.seek(tiles_at)
+                    for tile in _pack_band(cells, cols, tile_cols, bits):
+                        tiles_at += cave_file.write(tile)
+                    first_row += len(band)
+                    band = []
+        finally:
+            buf.close()
+
+
+def cave_to_txt(cave_name, txt_name):
+    """Converts the cave in the .cave file cave_name to the .txt file txt_name,
+    in the 'rows cols' header format, one row of cells per line."""
+    grid = load_cave(cave_name)
+    with open(txt_name, 'w') as txt_file:
+        txt_file.write(str(grid.rows)+" "+str(grid.cols)+"\n")
+        for row in range(grid.rows):
+            txt_file.write(grid.get_row_string(row)+"\n")
+
+
+def check_tile_size(tile_rows, tile_cols):
+    """Checks that tiles of tile_rows x tile_cols cells can be stored in a .cave
+    file.
+    post: raises ValueError if either is not from 1 to MAX_TILE_SIZE."""
+    if not (1 <= tile_rows <= MAX_TILE_SIZE and 1 <= tile_cols <= MAX_TILE_SIZE):
+        raise ValueError("Tiles must be from 1 to "+str(MAX_TILE_SIZE)+" cells on each side, not "+str(tile_rows)+"x"+str(tile_cols)+"!")
+
+
+def find_treasures(cells, first=0):
+    """Returns row*cols+col of every treasure ('T') in cells (a map's cells, row
+    after row, the first of them at row*cols+col first), in order, as an
+    array('Q')."""
+    if numpy is not None:
+        treasures = array('Q')
+        found = numpy.flatnonzero(numpy.frombuffer(cells, dtype=numpy.uint8) == ord('T'))
+        if first:
+            found += first
+        treasures.frombytes(memoryview(found.astype(numpy.int64, copy=False)).cast('B'))  #Copied once, straight from NumPy's indices
+        return treasures
+    treasures = array('Q')
+    index = cells.find(b'T')
+    while index != -1:
+        treasures.append(first + index)
+        index = cells.find(b'T', index + 1)
+    return treasures
+
+
+def _write_layout(cave_file, rows, cols, tile_rows, tile_cols, bits, width, start, count):
+    """Writes the header and offset table of a .cave file to cave_file, leaving
+    room between them for count treasures in the index. The size of every tile
+    follows from its shape, so the tiles can then be written one after another
+    as they are packed, without keeping them.
+    pre: start is the (row, col) of the explorer, or None."""
+    start_row, start_col = start if start is not None else (NO_START, NO_START)
+    cave_file.write(HEADER.pack(MAGIC, VERSION, rows, cols, tile_rows, tile_cols, bits,
+                                width, start_row, start_col, count))
+    offsets = array('Q', [_tiles_start(rows, cols, tile_rows, tile_cols, width, count)])
+    for first_row in range(0, rows, tile_rows):
+        height = min(tile_rows, rows - first_row)
+        for first_col in range(0, cols, tile_cols):
+            offsets.append(offsets[-1] + (height * min(tile_cols, cols - first_col) * bits + 7) // 8)
+    cave_file.seek(HEADER.size + width * count)
+    cave_file.write(offsets.tobytes())
+
+
+def _tiles_start(rows, cols, tile_rows, tile_cols, width, count):
+    """Returns where the first tile starts in a .cave file."""
+    tiles = -(-rows // tile_rows) * -(-cols // tile_cols)
+    return HEADER.size + width * count + 8 * (tiles + 1)
+
+
+def _pack_band(band, cols, tile_cols, bits):
+    """Yields the packed tiles of band (whole rows of a map's cells, as many as
+    a tile has), from left to right."""
+    rows = len(band) // cols
+    for first_col in range(0, cols, tile_cols):
+        last_col = min(first_col + tile_cols, cols)
+        tile = b''.join(band[row * cols + first_col:row * cols + last_col] for row in range(rows))
+        yield _pack(_to_codes(tile, bits), bits)
+
+
+def _to_codes(cells, bits):
+    """Returns cells (one byte of contents each) as one code per byte.
+    post: raises ValueError if some cell can't be stored in bits."""
+    _check_contents(cells, bits)
+    return bytes(cells).translate(_TO_CODE[bits])
+
+
+def _check_contents(cells, bits):
+    """Raises ValueError if some cell in cells can't be stored in bits."""
+    if cells.translate(None, CODES[bits]):
+        raise ValueError("Only "+", ".join(repr(chr(c)) for c in CODES[bits])+" can be stored at "+str(bits)+" bits per cell")
+
+
+def _pack(codes, bits):
+    """Packs codes (one per byte, each below 2**bits) into bits per cell."""
+    if bits == 2:
+        padded = codes + bytes(-len(codes) % 4)
+        if numpy is not None:
+            quads = numpy.frombuffer(padded, dtype=numpy.uint8).reshape(-1, 4)
+            return (quads[:, 0] | quads[:, 1] << 2 | quads[:, 2] << 4 | quads[:, 3] << 6).tobytes()
+        return bytes(map(_PACK_2.__getitem__, memoryview(padded).cast('I')))
+    size = (len(codes) * 3 + 7) // 8                                            #Every 8 codes take 3 bytes, the last ones only as many as they need
+    padded = codes + bytes(-len(codes) % 8)
+    if numpy is not None:
+        octets = numpy.frombuffer(padded, dtype=numpy.uint8).reshape(-1, 8).astype(numpy.uint32)
+        value = octets[:, 0].copy()
+        for index in range(1, 8):
+            value |= octets[:, index] << (3 * index)
+        return numpy.stack([value & 255, value >> 8 & 255, value >> 16], axis=1).astype(numpy.uint8).tobytes()[:size]
+    quads = memoryview(padded).cast('I')
+    packed = bytearray()
+    for at in range(0, len(quads), 2):
+        packed += (_PACK_3[quads[at]] | _PACK_3[quads[at + 1]] << 12).to_bytes(3, 'little')
+    return bytes(packed[:size])
+
+
+def _unpack(packed, count, bits):
+    """Unpacks count codes (one per byte) from packed, stored in bits per cell."""
+    if bits == 2:
+        if numpy is not None:
+            packed = numpy.frombuffer(packed, dtype=numpy.uint8)
+            quads = numpy.stack([packed & 3, packed >> 2 & 3, packed >> 4 & 3, packed >> 6], axis=1)
+            return quads.tobytes()[:count]
+        return b''.join(map(_UNPACK_2.__getitem__, packed))[:count]
+    padded = bytes(packed) + bytes(-len(packed) % 3)                            #Every 3 bytes hold 8 codes
+    if numpy is not None:
+        triples = numpy.frombuffer(padded, dtype=numpy.uint8).reshape(-1, 3).astype(numpy.uint32)
+        value = triples[:, 0] | triples[:, 1] << 8 | triples[:, 2] << 16
+        octets = numpy.stack([value >> (3 * index) & 7 for index in range(8)], axis=1)
+        return octets.astype(numpy.uint8).tobytes()[:count]
+    codes = []
+    for at in range(0, len(padded), 3):
+        value = padded[at] | padded[at + 1] << 8 | padded[at + 2] << 16
+        codes.append(_UNPACK_3[value & 4095])
+        codes.append(_UNPACK_3[value >> 12])
+    return b''.join(codes)[:count]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Convert caves between the .txt and .cave formats.")
+    parser.add_argument('source', help="cave to convert (.txt or .cave)")
+    parser.add_argument('target', help="file to write the converted cave to")
+    default_tile = str(TILE_SIZE)+'x'+str(TILE_SIZE)
+    parser.add_argument('--tile', default=default_tile, help="size of the tiles in a .cave file, as ROWSxCOLS (default: "+default_tile+")")
+    args = parser.parse_args(argv)
+    try:
+        tile_rows, tile_cols = [int(part) for part in args.tile.lower().split('x')]
+    except ValueError:
+        parser.error("--tile should look like "+default_tile)
+    try:
+        check_tile_size(tile_rows, tile_cols)
+    except ValueError as error:
+        parser.error("--tile: "+str(error))
+    with open(args.source, 'rb') as source:
+        binary = is_cave_file(source.read(len(MAGIC)))
+    if binary:
+        cave_to_txt(args.source, args.target)
+    else:
+        txt_to_cave(args.source, args.target, tile_rows, tile_cols)
+
+
+if __name__ == '__main__':
+    main()
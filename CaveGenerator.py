@@ -0,0 +1,151 @@
+#-------------------------------------------------------------------------------
+# Name:        CaveGenerator.py
+# Purpose: To generate cave maps of any size, in the same .txt format as the
+#          hand-written caves, for testing how the Explorer copes with big caves.
+#          The same seed always generates the same cave.
+#
+# Author:      odanielb (Bridget O'Daniel)
+#
+# Usage:   python CaveGenerator.py [--style STYLE] [--seed SEED] ROWSxCOLS FILE
+#
+# Styles:  maze      - a perfect maze (exactly one path between any two cells)
+#          cavern    - a wide open cavern with scattered rock pillars
+#          corridor  - one long corridor snaking back and forth across the cave
+#          treasure  - an open cavern where a third of the cells hold treasure
+#-------------------------------------------------------------------------------
+import argparse
+import random
+from GridMap import GridMap
+
+STYLES = ('maze', 'cavern', 'corridor', 'treasure')
+TREASURE_CHANCE = {'maze': 0.02, 'cavern': 0.01, 'corridor': 0.01, 'treasure': 0.33}
+WALL_CHANCE = {'cavern': 0.2, 'treasure': 0.1}
+
+
+def generate_cave(file_name, rows, cols, style='maze', seed=0):
+    """Generates a cave of the provided style and size, and writes it to
+    file_name in the 'rows cols' header format, one row of cells per line. The
+    border is always walled, and the explorer ('M') always starts at (1, 1).
+    pre: rows and cols are ints of at least 3, style is one of STYLES.
+    post: writes the file."""
+    if rows < 3 or cols < 3:
+        raise ValueError("A cave must be at least 3x3!")
+    if style not in STYLES:
+        raise ValueError("Unknown cave style "+repr(style)+", try one of: "+', '.join(STYLES))
+    rng = random.Random(str(style)+':'+str(seed))
+    with open(file_name, 'wb') as out:
+        out.write((str(rows)+' '+str(cols)+'\n').encode('ascii'))
+        if style == 'maze':
+            rows_of_cells = _maze_rows(rows, cols, rng)
+        elif style == 'corridor':
+            rows_of_cells = _corridor_rows(rows, cols, rng)
+        else:
+            rows_of_cells = _cavern_rows(rows, cols, rng, WALL_CHANCE[style], TREASURE_CHANCE[style])
+        for row in rows_of_cells:
+            out.write(row)
+            out.write(b'\n')
+
+
+def _random_bytes(rng, count):
+    """Returns count random bytes from rng."""
+    if count == 0:
+        return b''
+    return bytearray(rng.getrandbits(8 * count).to_bytes(count, 'little'))
+
+
+def _sprinkle_table(wall_chance, treasure_chance):
+    """Returns a translation table turning random bytes into cells, so that each
+    cell is a wall or holds treasure with about the provided chances."""
+    walls = int(256 * wall_chance)
+    treasures = int(256 * treasure_chance)
+    return bytes(b'W' * walls + b'T' * treasures + b'.' * (256 - walls - treasures))
+
+
+def _walled(inside):
+    """Returns the row with a wall added at each end."""
+    return b'W' + bytes(inside) + b'W'
+
+
+def _cavern_rows(rows, cols, rng, wall_chance, treasure_chance):
+    """Yields the rows of an open cavern, generating each row as it is needed."""
+    table = _sprinkle_table(wall_chance, treasure_chance)
+    for row in range(rows):
+        if row == 0 or row == rows - 1:
+            yield b'W' * cols
+            continue
+        inside = _random_bytes(rng, cols - 2).translate(table)
+        if row == 1:
+            inside[0:1] = b'M'
+        yield _walled(inside)
+
+
+def _corridor_rows(rows, cols, rng):
+    """Yields the rows of a single corridor running along every other row and
+    turning at alternate ends of the cave."""
+    table = _sprinkle_table(0, TREASURE_CHANCE['corridor'])
+    last_corridor = rows - 2 if rows % 2 == 1 else rows - 3                     #The corridor runs along odd rows, above the bottom wall
+    turn = 0
+    for row in range(rows):
+        if row == 0 or row >= rows - 1 or row > last_corridor:
+            yield b'W' * cols
+        elif row % 2 == 1:                                                      #A length of corridor
+            inside = _random_bytes(rng, cols - 2).translate(table)
+            if row == 1:
+                inside[0:1] = b'M'
+            yield _walled(inside)
+        else:                                                                   #A wall with a gap at one end, where the corridor turns
+            inside = bytearray(b'W' * (cols - 2))
+            gap = cols - 3 if turn % 2 == 0 else 0
+            inside[gap:gap + 1] = b'.'
+            turn += 1
+            yield _walled(inside)
+
+
+def _maze_rows(rows, cols, rng):
+    """Yields the rows of a perfect maze, carved by a depth-first search from
+    (1, 1) through the cells with odd rows and columns."""
+    grid = GridMap(rows, cols)
+    cells = grid.cells
+    wall = ord('W')
+    treasure_chance = TREASURE_CHANCE['maze']
+    cells[cols + 1] = ord('M')
+    offsets = (-2 * cols, 2, -2, 2 * cols)
+    path = [cols + 1]
+    while path:
+        index = path[-1]
+        row, col = divmod(index, cols)
+        options = []
+        for offset in offsets:                                                  #Cells two steps away that are inside the border and not carved yet
+            other = index + offset
+            other_row, other_col = divmod(other, cols)
+            if 0 < other_row < rows - 1 and 0 < other_col < cols - 1 and (other_row == row or other_col == col) and cells[other] == wall:
+                options.append(other)
+        if not options:
+            path.pop()
+            continue
+        other = rng.choice(options)
+        cells[(index + other) // 2] = ord('.')                                  #Knock down the wall between them
+        cells[other] = ord('T') if rng.random() < treasure_chance else ord('.')
+        path.append(other)
+    for row in range(rows):
+        yield bytes(cells[row * cols:(row + 1) * cols])
+
+
+def _parse_size(size):
+    """Turns a size like '100x200' into the tuple (100, 200)."""
+    rows, cols = size.lower().split('x')
+    return int(rows), int(cols)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate a cave map.")
+    parser.add_argument('size', type=_parse_size, help="size of the cave, as ROWSxCOLS")
+    parser.add_argument('file', help="file to write the cave to")
+    parser.add_argument('--style', choices=STYLES, default='maze', help="kind of cave to generate (default: maze)")
+    parser.add_argument('--seed', type=int, default=0, help="seed for the random choices (default: 0)")
+    args = parser.parse_args(argv)
+    generate_cave(args.file, args.size[0], args.size[1], args.style, args.seed)
+
+
+if __name__ == '__main__':
+    main()
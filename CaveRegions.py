@@ -0,0 +1,136 @@
+#-------------------------------------------------------------------------------
+# Name:        CaveRegions.py
+# Purpose: To label the connected open regions of a map in one pass, so how much
+#          treasure can be reached from any cell is known without letting an
+#          Explorer walk through the whole cave.
+#
+# Author:      odanielb (Bridget O'Daniel)
+#
+# Acknowledgements: Labelling runs of cells with union-find, from:
+#                   https://en.wikipedia.org/wiki/Connected-component_labeling
+#-------------------------------------------------------------------------------
+import re
+from array import array
+
+_OPEN_RUN = re.compile(b'[^W]+')
+
+
+class CaveRegions(object):
+
+    def __init__(self, grid):
+        """Labels the connected open regions of grid. Open cells (anything but
+        'W') are connected to the open cells next to them to the N, E, W and S.
+        Every region gets a label from 1 up; walls are labelled 0.
+        pre: grid is a GridMap."""
+        self.rows = grid.rows
+        self.cols = grid.cols
+        self.start = None
+        start = grid.cells.find(b'M')
+        if start != -1:
+            self.start = divmod(start, self.cols)
+
+        runs, parents, treasure = self._find_runs(grid)
+        self.labels = array('i', [0]) * (self.rows * self.cols)
+        self.treasure_counts = [0]                                              #Treasure in each region, by label (walls have none)
+        self.sizes = [0]                                                        #Open cells in each region, by label
+        region_of_root = {}
+        for run, (row, first, last) in enumerate(runs):
+            root = _find(parents, run)
+            if root not in region_of_root:                                      #The first run of a region gives it its label
+                region_of_root[root] = len(self.treasure_counts)
+                self.treasure_counts.append(0)
+                self.sizes.append(0)
+            label = region_of_root[root]
+            self.treasure_counts[label] += treasure[run]
+            self.sizes[label] += last - first
+            start = row * self.cols
+            self.labels[start + first:start + last] = array('i', [label]) * (last - first)
+
+
+    def _find_runs(self, grid):
+        """Finds every run of open cells along each row, joining (with union-find)
+        the runs that touch a run in the row above.
+        post: returns the runs as (row, first col, col after last) tuples, the
+        union-find parents of each run and the treasure in each run."""
+        cols = self.cols
+        runs = []
+        parents = []
+        treasure = []
+        above = []                                                              #Runs in the row above, as (first, last, run number)
+        for row in range(self.rows):
+            contents = bytes(grid.cells[row * cols:(row + 1) * cols])
+            here = []
+            checked = 0                                                         #Runs above that end before this run starts can't touch later runs either
+            for match in _OPEN_RUN.finditer(contents):
+                first, last = match.span()
+                run = len(runs)
+                runs.append((row, first, last))
+                parents.append(run)
+                treasure.append(contents.count(b'T', first, last))
+                while checked < len(above) and above[checked][1] <= first:
+                    checked += 1
+                other = checked
+                while other < len(above) and above[other][0] < last:            #Runs above that overlap this one are connected to it
+                    _union(parents, run, above[other][2])
+                    other += 1
+                here.append((first, last, run))
+            above = here
+        return runs, parents, treasure
+
+
+    def get_region(self, row, col):
+        """Returns the label of the region containing (row, col).
+        post: returns an int, 0 if (row, col) is a wall."""
+        return self.labels[row * self.cols + col]
+
+
+    def get_region_count(self):
+        """Returns the number of connected open regions in the map."""
+        return len(self.sizes) - 1
+
+
+    def reachable_treasure(self, row=None, col=None):
+        """Returns how much treasure can be collected starting from (row, col), or
+        from the explorer's starting point ('M') if no position is provided.
+        pre: (row, col) is a position on the map, or the map contains an 'M'.
+        post: returns an int, 0 if starting in a wall."""
+        if row is None:
+            if self.start is None:
+                raise ValueError("The map has no explorer (M) on it!")
+            row, col = self.start
+        return self.treasure_counts[self.get_region(row, col)]
+
+
+    def reachable_cells(self, row=None, col=None):
+        """Returns how many open cells can be reached from (row, col) (including
+        itself), or from the explorer's starting point if no position is provided.
+        post: returns an int, 0 if starting in a wall."""
+        if row is None:
+            if self.start is None:
+                raise ValueError("The map has no explorer (M) on it!")
+            row, col = self.start
+        return self.sizes[self.get_region(row, col)]
+
+
+    def treasure_from_every_cell(self):
+        """Returns how much treasure can be collected starting from every cell.
+        post: returns an array of ints indexed by row*cols+col (0 for walls)."""
+        counts = array('i', self.treasure_counts)
+        return array('i', (counts[label] for label in self.labels))
+
+
+
+def _find(parents, run):
+    """Returns the root of run's set, halving the path to it on the way."""
+    while parents[run] != run:
+        parents[run] = parents[parents[run]]
+        run = parents[run]
+    return run
+
+
+def _union(parents, first, second):
+    """Joins the sets containing first and second."""
+    first = _find(parents, first)
+    second = _find(parents, second)
+    if first != second:
+        parents[max(first, second)] = min(first, second)
@@ -0,0 +1,257 @@
+#-------------------------------------------------------------------------------
+# Name:        Checkpoint.py
+# Purpose: To save an Explorer's whole state to a compact binary file while it
+#          explores, and to resume exploring from that file later. After the
+#          first full snapshot, each checkpoint only adds the cells and diary
+#          entries that changed since the one before.
+#
+# Author:      odanielb (Bridget O'Daniel)
+#
+# File layout: a header (MAGIC, version, rows, cols, the content hash of the cave
+#              file explored, as MapCache.hash_file gives it), then records, each one a
+#              type byte ('F' for a full snapshot, 'D' for changes since the last
+#              record), the length of its body and the body, compressed with zlib.
+#-------------------------------------------------------------------------------
+import struct
+import threading
+import zlib
+from array import array
+from Explorer import Explorer, TRACE_BACKTRACK
+from GridMap import GridMap
+from NeighbourTable import build_neighbour_table
+from PackedStack import PackedStack
+
+MAGIC = b'CAVECKPT'
+VERSION = 2
+HEADER = struct.Struct('<8sHII16s')                                             #Magic, version, rows, cols, cave hash
+RECORD = struct.Struct('<cQ')                                                   #Record type, length of its body
+STATE = struct.Struct('<IIQQQqQQ')                                              #Row, col, treasure, steps, backtracks, treasure path depth (-1 for none), stack size, stack bytes kept
+COUNT = struct.Struct('<Q')
+DEFAULT_INTERVAL = 100000                                                       #Steps between checkpoints
+
+
+class Checkpointer(object):
+
+    def __init__(self, file_name, interval=DEFAULT_INTERVAL, resuming=False, cave_hash=None):
+        """Creates a Checkpointer that saves an Explorer to file_name every
+        interval steps while run() explores with it. The first save is a full
+        snapshot; each one after it only holds what changed. Files are written
+        by a background thread, so exploring only waits for the changes to be
+        gathered up. cave_hash (16 bytes, from MapCache.hash_file) is saved with
+        the snapshot, so resume can tell which cave the checkpoints are of.
+        pre: interval is a positive int. If resuming is True, file_name holds a
+        checkpoint the Explorer was just resumed from (see resume), and new
+        checkpoints are added to it (after dropping any record cut short).
+        post: Creates a Checkpointer."""
+        self.file_name = file_name
+        self.interval = interval
+        self.cave_hash = cave_hash or bytes(16)
+        self.has_snapshot = resuming
+        self.dirty = set()                                                      #Cells (row*cols+col) changed since the last save
+        self.lowest_depth = 0                                                   #The smallest size of steps_taken since (and at) the last save
+        self._writer = None
+        self._error = None
+        if not resuming:
+            open(file_name, 'wb').close()
+        else:
+            with open(file_name, 'r+b') as checkpoint:
+                checkpoint.truncate(_find_end(checkpoint))                      #New records must follow the last whole one
+
+
+    def run(self, explorer):
+        """Lets explorer explore everything it can with Explorer.run, saving it
+        every interval steps and once more at the end.
+        pre: explorer's map is a GridMap.
+        post: returns once explorer is finished and its last checkpoint has been
+        written to the file."""
+        if not self.has_snapshot:
+            self.save(explorer)
+        finished = False
+        while not finished:
+            start = explorer.get_pos()
+            depth = explorer.steps_taken.size()
+            finished, trace = explorer.run(self.interval, record_trace=True)
+            self._note_trace(explorer, start, depth, trace)
+            self.save(explorer)
+        self.wait()
+
+
+    def _note_trace(self, explorer, start, depth, trace):
+        """Notes the cells changed, and how far steps_taken shrank, while explorer
+        took the steps in trace (from Explorer.run) from start, with depth
+        directions in steps_taken."""
+        cols = explorer.position_diary.cols
+        offsets = [-cols, 1, -1, cols]                                          #By trace code, as in TRACE_DIRECTIONS
+        index = start[0] * cols + start[1]
+        dirty = self.dirty
+        dirty.add(index)
+        lowest = self.lowest_depth
+        for code in trace:
+            index += offsets[code & 3]
+            dirty.add(index)
+            if code & TRACE_BACKTRACK:
+                depth -= 1
+                if depth < lowest:
+                    lowest = depth
+            else:
+                depth += 1
+        self.lowest_depth = lowest
+
+
+    def save(self, explorer):
+        """Saves the Explorer's state now: in full if nothing has been saved yet,
+        otherwise only what changed since the last save.
+        pre: explorer's map is a GridMap."""
+        if self._error is not None:
+            raise self._error
+        grid = explorer.map
+        diary = explorer.position_diary
+        stack = explorer.steps_taken
+        if not self.has_snapshot:
+            header = HEADER.pack(MAGIC, VERSION, grid.rows, grid.cols, self.cave_hash)
+            kept = 0
+            body = [bytes(grid.cells), bytes(diary.possible), bytes(diary.visited)]
+            kind = b'F'
+        else:
+            header = b''
+            kept = min(self.lowest_depth, stack.size()) // 4                    #Whole bytes of steps_taken that can't have changed
+            indices = array('Q', sorted(self.dirty))
+            body = [COUNT.pack(len(indices)), indices.tobytes(),
+                    bytes(bytearray(grid.cells[i] for i in indices)),
+                    bytes(bytearray(diary.possible[i] for i in indices)),
+                    bytes(bytearray(diary.visited[i] for i in indices))]
+            kind = b'D'
+        row, col = explorer.get_pos()
+        path_depth = explorer.treasure_path_depth
+        state = STATE.pack(row, col, explorer.treasure, explorer.steps, explorer.backtracks,
+                           -1 if path_depth is None else path_depth, stack.size(), kept)
+        body = [state, bytes(stack.data[kept:])] + body
+
+        self.has_snapshot = True
+        self.dirty = set()
+        self.lowest_depth = stack.size()
+        self._write(header, kind, body)
+
+
+    def _write(self, header, kind, body):
+        """Hands a record to the background writer thread, starting it if needed."""
+        self.wait()                                                             #Only one write at a time, so records stay in order
+        self._writer = threading.Thread(target=self._write_record, args=(header, kind, body))
+        self._writer.start()
+
+
+    def _write_record(self, header, kind, body):
+        """Compresses a record and adds it to the end of the file."""
+        try:
+            data = zlib.compress(b''.join(body), 1)
+            with open(self.file_name, 'ab') as out:
+                out.write(header)
+                out.write(RECORD.pack(kind, len(data)))
+                out.write(data)
+        except (IOError, OSError) as error:
+            self._error = error
+
+
+    def wait(self):
+        """Waits until the last checkpoint has been written to the file.
+        post: raises the error that stopped it being written, if there was one."""
+        if self._writer is not None:
+            self._writer.join()
+            self._writer = None
+        if self._error is not None:
+            raise self._error
+
+
+
+def resume(file_name, observer=None, cave_hash=None):
+    """Rebuilds an Explorer from the checkpoints in file_name, exactly as it was
+    at the last one.
+    pre: file_name was written by a Checkpointer. observer is an
+    ExplorerObserver or None. cave_hash, if provided, is the hash of the cave
+    (from MapCache.hash_file) the checkpoints should be of.
+    post: returns the Explorer, on a GridMap holding the map as it was then.
+    Raises ValueError if file_name is not a checkpoint file, is damaged, has no
+    whole checkpoint in it or is of a cave other than cave_hash's."""
+    with open(file_name, 'rb') as checkpoint:
+        header = checkpoint.read(HEADER.size)
+        if len(header) < HEADER.size:
+            raise ValueError(file_name+" is not a checkpoint file!")
+        magic, version, rows, cols, saved_hash = HEADER.unpack(header)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(file_name+" is not a checkpoint file!")
+        if cave_hash is not None and saved_hash != cave_hash:
+            raise ValueError(file_name+" is a checkpoint of a different cave!")
+        size = rows * cols
+        cells = possible = visited = None
+        stack = bytearray()
+        state = None
+        while True:
+            record = checkpoint.read(RECORD.size)
+            if len(record) < RECORD.size:
+                break
+            kind, length = RECORD.unpack(record)
+            data = checkpoint.read(length)
+            if len(data) < length:                                              #A record cut short while being written; use the ones before it
+                break
+            try:
+                body = zlib.decompress(data)
+                state = STATE.unpack_from(body, 0)
+            except (zlib.error, struct.error):
+                raise ValueError(file_name+" has a damaged checkpoint in it!")
+            stack_size, kept = state[6], state[7]
+            stack_bytes = (stack_size + 3) // 4 - kept
+            at = STATE.size
+            stack = stack[:kept] + body[at:at + stack_bytes]
+            at += stack_bytes
+            if kind == b'F' and len(body) == at + 3 * size:
+                cells = bytearray(body[at:at + size])
+                possible = bytearray(body[at + size:at + 2 * size])
+                visited = bytearray(body[at + 2 * size:at + 3 * size])
+            elif kind == b'D' and cells is not None and len(body) >= at + COUNT.size:
+                count = COUNT.unpack_from(body, at)[0]
+                at += COUNT.size
+                if len(body) != at + 11 * count:
+                    raise ValueError(file_name+" has a damaged checkpoint in it!")
+                indices = array('Q')
+                indices.frombytes(body[at:at + 8 * count])
+                at += 8 * count
+                for offset, index in enumerate(indices):
+                    if index >= size:
+                        raise ValueError(file_name+" has a damaged checkpoint in it!")
+                    cells[index] = body[at + offset]
+                    possible[index] = body[at + count + offset]
+                    visited[index] = body[at + 2 * count + offset]
+            else:
+                raise ValueError(file_name+" has a damaged checkpoint in it!")
+    if state is None or cells is None:
+        raise ValueError(file_name+" has no checkpoints in it!")
+
+    row, col, treasure, steps, backtracks, path_depth, stack_size, kept = state
+    if row >= rows or col >= cols or len(stack) != (stack_size + 3) // 4:
+        raise ValueError(file_name+" has a damaged checkpoint in it!")
+    grid = GridMap(rows, cols, cells)
+    explorer = Explorer(grid.get_location(row, col), grid, build_neighbour_table(grid, check=False), observer)
+    explorer.treasure = treasure
+    explorer.steps = steps
+    explorer.backtracks = backtracks
+    explorer.treasure_path_depth = None if path_depth < 0 else path_depth
+    explorer.steps_taken = PackedStack()
+    explorer.steps_taken.data = stack
+    explorer.steps_taken.count = stack_size
+    explorer.position_diary.possible = possible
+    explorer.position_diary.visited = visited
+    return explorer
+
+
+def _find_end(checkpoint):
+    """Returns where the last whole record in the open checkpoint file ends,
+    skipping over the records without reading them."""
+    end = checkpoint.seek(0, 2)
+    at = HEADER.size
+    while at + RECORD.size <= end:
+        checkpoint.seek(at)
+        length = RECORD.unpack(checkpoint.read(RECORD.size))[1]
+        if at + RECORD.size + length > end:
+            break
+        at += RECORD.size + length
+    return min(at, end)
@@ -8,22 +8,44 @@
 # Acknowledgements: Future print statement from: http://stackoverflow.com/questions/388069/python-graceful-future-feature-future-import
 #-------------------------------------------------------------------------------
 from __future__ import print_function
-from Stack import Stack
+import time
+from array import array
+from PackedStack import PackedStack
 from Location import Location
+from PositionDiary import PositionDiary, DIRECTION_BITS, MASK_DIRECTIONS, NEXT_DIRECTION, NOTED, ALL_DIRECTIONS, N, E, W, S
+from Renderer import Renderer
+
+TRACE_DIRECTIONS = 'NEWS'                                                       #A step in a trace is the index of its direction in here,
+TRACE_BACKTRACK = 4                                                             #plus this if the step was a backtrack
+EDIT_CONTENTS = ('W', '.', 'T')                                                 #What apply_edits can change a cell to
+_SIDES = ((-1, 0, S), (0, 1, W), (0, -1, E), (1, 0, N))                         #Change to each neighbour, and the bit of the direction from it back
+_STEP_BACK = {'N': (1, 0), 'E': (0, -1), 'W': (0, 1), 'S': (-1, 0)}             #Change to undo a step in each direction
 
 class Explorer (object):
 
     DIRECTIONS = ['N','E', 'W', 'S']
     DIRECTION_OPP = {'N':'S', 'S':'N', 'E':'W', 'W':'E'}
 
-    def __init__(self, location, explorer_map):
-        """Creates a new Explorer."""
+    def __init__(self, location, explorer_map, neighbours=None, observer=None):
+        """Creates a new Explorer. If a neighbour table is provided (see
+        NeighbourTable.build_neighbour_table), the Explorer looks up the possible
+        directions from each cell in it instead of checking the map. If an
+        observer is provided (see ExplorerObserver), it is told about every move,
+        backtrack, treasure, diary lookup and frame, and when exploring is
+        finished. A map can choose the kind of PositionDiary kept for it with a
+        diary_class attribute, called with its rows and cols (see TiledMap)."""
         self.name = 'M'
         self.pos = location.get_pos()
         self.treasure = 0
-        self.steps_taken = Stack()
-        self.position_diary = {}
+        self.steps = 0
+        self.backtracks = 0
+        self.steps_taken = PackedStack()
+        self.position_diary = getattr(explorer_map, 'diary_class', PositionDiary)(len(explorer_map), len(explorer_map[0]))
         self.map = explorer_map
+        self.neighbours = neighbours
+        self.observer = observer
+        self.treasure_path_depth = None
+        self.renderer = None
 
 
     def get_pos(self):
@@ -50,6 +72,19 @@ class Explorer (object):
         return self.treasure
 
 
+    def get_step_count(self):
+        """Returns the number of steps the Explorer has taken, counting both
+        moves into new directions and backtracks.
+        post: returns an int."""
+        return self.steps
+
+
+    def get_backtrack_count(self):
+        """Returns the number of steps the Explorer has taken backtracking.
+        post: returns an int."""
+        return self.backtracks
+
+
     def get_pos_of_location_in_direction(self, direction, position=0):
         """Returns the position of the location one spot in the provided direction,
         from the provided position. If no position is provided, it is assumed to
@@ -71,6 +106,20 @@ class Explorer (object):
             elif direction == 'S':
                 return (row+1, col)
 
+    def set_renderer(self, renderer):
+        """Sets the Renderer used to display the map, which the Explorer tells
+        about every cell it changes.
+        pre: renderer is a Renderer."""
+        self.renderer = renderer
+
+
+    def set_observer(self, observer):
+        """Sets the observer told about what the Explorer does, or removes it if
+        observer is None.
+        pre: observer is an ExplorerObserver or None."""
+        self.observer = observer
+
+
     def set_pos(self, row, col):
         """Sets the position of Explorer to (row, col).
         pre: row and col are ints and (row, col) is a position on the map.
@@ -83,7 +132,23 @@ class Explorer (object):
         backtrack no further, the Explorer has explored everything in the cave."""
         if self.steps_taken.size() > 0:
             direction = self.get_opposite_direction(self.pop_last_direction())  #Pop direction last gone and find its opposite (backtrack = go in opp. direction)
+            if self.treasure_path_depth is not None and self.treasure_path_depth > self.steps_taken.size():
+                self.treasure_path_depth = self.steps_taken.size()              #The path to the treasure is now only as long as the path back to the start
             self._update_explorer_pos(direction)                                #Update the position of Explorer appropriately
+            self.steps += 1                                                     #Count the step, and that it was a backtrack
+            self.backtracks += 1
+            if self.observer is not None:
+                self.observer.on_backtrack(self, direction)
+
+
+    def walk(self, direction):
+        """The Explorer goes one spot in the provided direction (collecting any
+        treasure there), without noting it in steps_taken or its position diary.
+        This is for following a planned route rather than exploring.
+        pre: direction is a string of one character in 'NEWS' and there is no
+        wall in that direction."""
+        self.steps += 1
+        self._update_explorer_pos(direction)
 
 
     def move(self):
@@ -101,21 +166,311 @@ class Explorer (object):
 
         if direction not in 'NEWS':
             if direction == 'No':
+                if self.observer is not None:
+                    self.observer.on_finished(self)
                 return None
             self.backtrack()                                                    #If direction wasn't in 'NEWS', but wasn't 'None', it would be 'Backtrack'
 
         else:                                                               #If it is a normal direction,
-            self.steps_taken.push(direction)                                    #Add the direction gone in on top of the steps_taken stack
-            self._update_explorer_pos(direction)                                #Properly moves Explorer and collects treasure if any.
-
-            if self.is_position_in_diary():                                     #If the current (ie, new) position is in the position diary,
-                self.update_position_diary()                                        #Update diary to include the direction gone in, for last and current pos
-            else:                                                               #If not in diary,
-                self.add_position_to_diary()                                        #Add the current position to the position diary
-                self.update_position_diary()                                        #Update diary to include the direction gone in, for last and current pos
+            self._explore_direction(direction)
         return True
 
 
+    def _explore_direction(self, direction):
+        """The Explorer moves in the provided direction, noting it in steps_taken
+        and its position diary.
+        pre: direction is a string of one character in 'NEWS', not yet visited
+        from the current position."""
+        self.steps += 1                                                         #Count the step
+        self.steps_taken.push(direction)                                        #Add the direction gone in on top of the steps_taken stack
+        self._update_explorer_pos(direction)                                    #Properly moves Explorer and collects treasure if any.
+
+        if not self.is_position_in_diary():                                     #If the current (ie, new) position is not in the position diary,
+            row, col = self.get_pos()
+            self.position_diary.add(row, col, self.check_possible_mask())           #Add it, with the directions possible from it
+        self.update_position_diary()                                            #Update diary to include the direction gone in, for last and current pos
+        if self.observer is not None:
+            self.observer.on_move(self, direction)
+
+
+    def run(self, max_steps=None, record_trace=False):
+        """The Explorer keeps moving exactly as move() would, until the cave has
+        been fully explored or it has taken max_steps steps (if provided). On a
+        GridMap with a neighbour table this runs in one tight loop, without the
+        method calls move() makes for every step.
+        If record_trace is True, every step is recorded in a compact trace: an
+        array of bytes, each holding the index of the direction moved in
+        TRACE_DIRECTIONS, plus TRACE_BACKTRACK if the step was a backtrack. The
+        trace can be replayed with replay().
+        pre: Current position is already in position diary.
+        post: Returns a tuple of True if the cave has been fully explored (else
+        False) and the trace (or None if record_trace is False)."""
+        trace = array('B') if record_trace else None
+        if getattr(self.map, 'cells', None) is None or self.neighbours is None:
+            return self._run_moves(max_steps, trace), trace
+        if self.renderer is None:
+            return self._run_fast(max_steps, trace), trace
+        steps = trace if trace is not None else array('B')                      #The cells stepped on need redrawing in the next frame
+        start = self.pos
+        finished = self._run_fast(max_steps, steps)
+        self._mark_steps(start, steps)
+        return finished, trace
+
+
+    def _mark_steps(self, start, trace):
+        """Marks every cell the steps in trace (from run()) went through, from
+        start, as dirty in the Renderer."""
+        row, col = start
+        self.renderer.mark_dirty(row, col)
+        moves = ((-1, 0), (0, 1), (0, -1), (1, 0))                              #By trace code, as in TRACE_DIRECTIONS
+        for code in trace:
+            row_change, col_change = moves[code & 3]
+            row += row_change
+            col += col_change
+            self.renderer.mark_dirty(row, col)
+
+
+    def _run_moves(self, max_steps, trace):
+        """Runs the Explorer by calling move() for each step, for maps run() can't
+        run in a tight loop.
+        post: returns True if the cave has been fully explored, else False."""
+        taken = 0
+        while max_steps is None or taken < max_steps:
+            depth = self.steps_taken.size()
+            row, col = self.get_pos()
+            if not self.move():
+                return True
+            taken += 1
+            if trace is not None:
+                new_row, new_col = self.get_pos()
+                code = TRACE_DIRECTIONS.index('N' if new_row < row else 'S' if new_row > row else 'W' if new_col < col else 'E')
+                trace.append(code if self.steps_taken.size() > depth else code | TRACE_BACKTRACK)
+        return False
+
+
+    def _run_fast(self, max_steps, trace):
+        """Runs the Explorer in one loop, working directly on the map's cells, the
+        neighbour table, the position diary's bytearrays and the packed bytes of
+        steps_taken, keeping everything else in local variables.
+        post: returns True if the cave has been fully explored, else False."""
+        cells = self.map.cells
+        neighbours = self.neighbours
+        possible = self.position_diary.possible
+        visited = self.position_diary.visited
+        cols = self.position_diary.cols
+        stack = self.steps_taken
+        packed = stack.data                                                     #Two bits per direction, coded as its index in 'NEWS'
+        observer = self.observer
+        record = trace.append if trace is not None else None
+
+        offset = [0] * 16                                                       #Lists indexed by direction bit
+        opposite = [0] * 16
+        code = [0] * 16
+        for letter, bit, step, back in (('N', N, -cols, S), ('E', E, 1, W), ('W', W, -1, E), ('S', S, cols, N)):
+            offset[bit], opposite[bit], code[bit] = step, back, TRACE_DIRECTIONS.index(letter)
+        bit_of_code = [DIRECTION_BITS[letter] for letter in TRACE_DIRECTIONS]
+        first_bit = [DIRECTION_BITS[letter] if letter else 0 for letter in NEXT_DIRECTION]
+        path, treasure, explorer = ord('.'), ord('T'), ord('M')
+
+        row, col = self.pos
+        index = row * cols + col
+        depth = stack.size()
+        steps = backtracks = found_treasure = taken = 0
+        finished = False
+        while max_steps is None or taken < max_steps:
+            unexplored = possible[index] & ~visited[index] & ALL_DIRECTIONS
+            if unexplored:                                                      #Go the first way not yet been, in order N > E > W > S
+                bit = first_bit[unexplored]
+                shift = (depth & 3) << 1                                            #Push the direction onto steps_taken
+                if shift:
+                    packed[depth >> 2] |= code[bit] << shift
+                else:
+                    packed.append(code[bit])
+                depth += 1
+                visited[index] |= bit
+                cells[index] = path
+                index += offset[bit]
+                if not possible[index] & NOTED:
+                    possible[index] = neighbours[index] | NOTED
+                visited[index] |= opposite[bit]
+                if record is not None:
+                    record(code[bit])
+            elif depth:                                                         #Nowhere new to go, so backtrack
+                depth -= 1
+                shift = (depth & 3) << 1                                            #Pop the direction off steps_taken
+                if shift:
+                    bit = opposite[bit_of_code[(packed[depth >> 2] >> shift) & 3]]
+                    packed[depth >> 2] &= ~(3 << shift)
+                else:
+                    bit = opposite[bit_of_code[packed.pop()]]
+                if self.treasure_path_depth is not None and self.treasure_path_depth > depth:
+                    self.treasure_path_depth = depth
+                cells[index] = path
+                index += offset[bit]
+                backtracks += 1
+                if record is not None:
+                    record(code[bit] | TRACE_BACKTRACK)
+            else:                                                               #Nowhere to go and back at the start
+                finished = True
+                break
+            steps += 1
+            taken += 1
+
+            found = cells[index] == treasure
+            cells[index] = explorer
+            if found:
+                found_treasure += 1
+                self.treasure_path_depth = depth
+            if observer is not None:                                            #Bring the Explorer up to date before telling the observer
+                self.pos = divmod(index, cols)
+                stack.count = depth
+                self.treasure += found_treasure
+                self.steps += steps
+                self.backtracks += backtracks
+                steps = backtracks = found_treasure = 0
+                observer.on_diary_lookups(self, 2 if unexplored else 1)         #The unexplored directions here, and whether a new cell is noted
+                if found:
+                    observer.on_treasure(self, self.pos)
+                if unexplored:
+                    observer.on_move(self, TRACE_DIRECTIONS[code[bit]])
+                else:
+                    observer.on_backtrack(self, TRACE_DIRECTIONS[code[bit]])
+
+        self.pos = divmod(index, cols)
+        stack.count = depth
+        self.treasure += found_treasure
+        self.steps += steps
+        self.backtracks += backtracks
+        if finished and observer is not None:
+            observer.on_diary_lookups(self, 1)                                  #Finding nowhere left to go
+            observer.on_finished(self)
+        return finished
+
+
+    def replay_step(self, code):
+        """The Explorer takes the step recorded as code in a trace from run().
+        pre: code is an int from a trace recorded from the Explorer's current state.
+        post: raises ValueError if the step can't be the one the Explorer would
+        have taken."""
+        direction = TRACE_DIRECTIONS[code & 3]
+        if code & TRACE_BACKTRACK:
+            if self.steps_taken.size() == 0 or self.steps_taken.top() != self.get_opposite_direction(direction):
+                raise ValueError("The trace backtracks "+direction+", which is not the way the Explorer came.")
+            self.backtrack()
+        else:
+            if self.decide_where_to_go() != direction:
+                raise ValueError("The trace moves "+direction+", which is not where the Explorer would go.")
+            self._explore_direction(direction)
+
+
+    def replay(self, trace, display=False, delay=0):
+        """The Explorer takes every step recorded in a trace from run(), displaying
+        the map after each one if display is True (waiting delay seconds between
+        frames).
+        pre: trace was recorded from the Explorer's current state."""
+        for code in trace:
+            if display:
+                if delay:
+                    time.sleep(delay)
+                self.display_map()
+            self.replay_step(code)
+        if display:
+            self.display_map()
+
+
+    def apply_edits(self, edits):
+        """Changes cells of the map while the Explorer is exploring it (walls
+        collapsing, treasure appearing), and brings what the Explorer knows up
+        to date so it can carry on from where it is instead of starting again.
+        Only the changed cells and their neighbours are looked at: a cell that
+        became a wall is forgotten from the diary and can no longer be gone to,
+        and a cell that opened up can be gone to, unexplored, from its
+        neighbours in the diary. If a wall lands on the path in steps_taken, the
+        path is cut off just before it and the Explorer is put back there
+        (without taking any steps). Treasure that appears under the Explorer is
+        collected.
+        The Explorer only looks for new directions from the cells it goes back
+        through, so an opening beside a part of the cave it has already
+        backtracked out of is not explored.
+        pre: edits is a dictionary of (row, col) -> contents, or a list of
+        ((row, col), contents) pairs, each contents one of EDIT_CONTENTS.
+        post: Changes the map, the neighbour table, the diary and steps_taken.
+        Raises ValueError, without changing anything, if an edit is not on the
+        map, would open a cell on its border, or would wall in the start of the
+        path."""
+        edits = dict(edits)
+        diary = self.position_diary
+        rows, cols = diary.rows, diary.cols
+        changes = []                                                            #(row, col, True if it is now a wall) of cells opened or walled
+        walled = set()                                                          #Cells walled that the Explorer has been to
+        for (row, col), contents in edits.items():
+            if contents not in EDIT_CONTENTS:
+                raise ValueError("Cells can only be changed to 'W', '.' or 'T', not "+repr(contents)+"!")
+            if not (0 <= row < rows and 0 <= col < cols):
+                raise ValueError(str((row, col))+" is not on the map!")
+            if contents != 'W' and (row in (0, rows - 1) or col in (0, cols - 1)):
+                raise ValueError("Opening "+str((row, col))+" would let the Explorer off the map!")
+            was_wall = self.map[row][col].get_contents() == 'W'
+            if was_wall != (contents == 'W'):
+                changes.append((row, col, not was_wall))
+                if not was_wall and diary.is_noted(row, col):
+                    walled.add((row, col))
+
+        back_to = None
+        if walled:                                                              #Find the first walled cell on the path, walking down it from the top
+            row, col = self.pos
+            depth = self.steps_taken.size()
+            on_wall = (row, col) in walled
+            for direction in self.steps_taken.iter_from_top():
+                row_change, col_change = _STEP_BACK[direction]
+                row += row_change
+                col += col_change
+                depth -= 1
+                if on_wall:
+                    back_to = (depth, row, col)                                     #The cell before the lowest wall on the path so far
+                on_wall = (row, col) in walled
+            if on_wall:
+                raise ValueError("Walling "+str((row, col))+" would wall in the start of the Explorer's path!")
+
+        neighbours = self.neighbours
+        if changes and neighbours is not None and not isinstance(neighbours, bytearray):
+            neighbours = self.neighbours = bytearray(neighbours)                #A shared, read-only table (see SessionServer) is copied first
+        for (row, col), contents in edits.items():
+            self.map[row][col].set_contents(contents)
+            if self.renderer is not None:
+                self.renderer.mark_dirty(row, col)
+        for row, col, is_wall in changes:
+            for row_change, col_change, bit in _SIDES:                          #Update the direction into this cell from each of its neighbours
+                next_row, next_col = row + row_change, col + col_change
+                if 0 <= next_row < rows and 0 <= next_col < cols:
+                    if neighbours is not None:
+                        index = next_row * cols + next_col
+                        neighbours[index] = neighbours[index] & ~bit if is_wall else neighbours[index] | bit
+                    if is_wall:
+                        diary.close_direction(next_row, next_col, bit)
+                    else:
+                        diary.open_direction(next_row, next_col, bit)
+            if is_wall:
+                diary.forget(row, col)
+
+        if back_to is not None:
+            depth, row, col = back_to
+            self.steps_taken.truncate(depth)
+            if self.treasure_path_depth is not None and self.treasure_path_depth > depth:
+                self.treasure_path_depth = depth
+            old_location = self.map[self.pos[0]][self.pos[1]]
+            if old_location.get_contents() == 'M':                              #Unless a wall landed on the Explorer
+                old_location.set_contents('.')
+            if self.renderer is not None:
+                self.renderer.mark_dirty(self.pos[0], self.pos[1])
+                self.renderer.mark_dirty(row, col)
+            self.set_pos(row, col)
+        location = self.map[self.pos[0]][self.pos[1]]
+        if location.get_contents() == 'T':
+            self.collect_treasure(location)
+        location.set_contents('M')
+
+
     def _update_explorer_pos(self, direction):
         """Using the given direction, changes Explorer's location to the next
         spot in that direction, making the appropriate changes to positions and
@@ -125,10 +480,13 @@ class Explorer (object):
         self.map[old_row][old_col].set_contents('.')                            #Set the Location to contain a path rather than the explorer
         new_row, new_col = self.get_pos_of_location_in_direction(direction)     #Get the position to move to
         self.set_pos(new_row, new_col)                                          #Set Explorer's new position
+        if self.renderer is not None:                                           #Both cells need redrawing in the next frame
+            self.renderer.mark_dirty(old_row, old_col)
+            self.renderer.mark_dirty(new_row, new_col)
 
         new_loc = self.map[new_row][new_col]                                    #Variable for the new location
         if new_loc.get_contents() == 'T':                                       #If the new location contains Treasure:
-            self.collect_treasure(new_loc)                                          #Collect treasure and display path there using 'X's
+            self.collect_treasure(new_loc)                                          #Collect treasure and note the path there to display using 'X's
  #       else:
  #           self.steps_since_treasure += 1                                          #Keep this value updated
 
@@ -136,19 +494,36 @@ class Explorer (object):
 
 
     def collect_treasure(self, location):
-        """The Explorer will collect the treasure that is in this Location.
+        """The Explorer will collect the treasure that is in this Location, and
+        note how deep it is in steps_taken so the next frame can display the
+        path back to the start. The path itself is only worked out when a frame
+        displays it (see get_treasure_path).
         pre: location is a Location object with the same position as Explorer."""
-        self.treasure += 1                                                                          #Add treasure
-
-        temp_stack = Stack()                                                                        #Temporary stack to store popped directions
+        self.treasure += 1                                                      #Add treasure
+        self.treasure_path_depth = self.steps_taken.size()                      #The path to this treasure is the bottom of steps_taken, up to here
+        if self.observer is not None:
+            self.observer.on_treasure(self, self.get_pos())
+
+
+    def get_treasure_path(self):
+        """Returns the positions on the path from the start to the last treasure
+        collected (not including the treasure itself), to be displayed using 'X's.
+        The path is worked out by walking back down steps_taken from the current
+        position. If the Explorer has backtracked past the treasure since, only
+        the part of the path still in steps_taken is returned.
+        post: returns a list of (row, col) tuples, empty if there is no path to display."""
+        depth = self.treasure_path_depth
+        path = []
+        if not depth:
+            return path
         row, col = self.get_pos()
-        for i in range(self.steps_taken.size()):
-            direction = self.pop_last_direction()                                                       #Get the last direction gone in
+        index = self.steps_taken.size()
+        for direction in self.steps_taken.iter_from_top():
+            index -= 1
             row, col = self.get_pos_of_location_in_direction(self.get_opposite_direction(direction), (row, col)) #Get the position of the Location that direction came from (using opposite direction)
-            self.map[row][col].set_contents('X')                                                        #Set the contents of that Location to X
-            temp_stack.push(direction)                                                                  #Put the direction in the temporary stack
-        for i in range(temp_stack.size()):                                                          #For every direction popped,
-            self.steps_taken.push(temp_stack.pop())                                                     #Put it back on the steps_taken stack in the correct order
+            if index < depth:                                                   #Steps taken since the treasure are not part of its path
+                path.append((row, col))
+        return path
 
 
     def is_position_in_diary(self, position=0):
@@ -157,20 +532,22 @@ class Explorer (object):
         post: Returns True or False."""
         if position == 0:
             position = self.get_pos()
-        return position in self.position_diary.keys()
+        if self.observer is not None:
+            self.observer.on_diary_lookups(self, 1)
+        return self.position_diary.is_noted(position[0], position[1])
 
 
     def add_position_to_diary(self, pos=0):
         """Adds the provided position to the Explorer's position diary, noting the
         following information: what directions are possible to go in from this
-        position (list) and what directions have already been visited by the
-        Explorer from this position. If no position is provided, assumes current
-        location of Explorer.
+        position and what directions have already been visited by the Explorer
+        from this position (none, to start with). If no position is provided,
+        assumes current location of Explorer.
         pre: pos is a tuple with two int values representing (row, col)."""
         if pos == 0:
             pos = self.get_pos()                                                #If no pos provided, sets to current pos
-        if not self.is_position_in_diary():
-            self.position_diary[pos] = [self.check_possible_directions(),[]]    #Stores possible directions and an empty list for directions it will travel from the position
+        if not self.is_position_in_diary(pos):
+            self.position_diary.add(pos[0], pos[1], self.check_possible_mask()) #Stores possible directions, with none traveled yet
 
 
     def update_position_diary(self):
@@ -178,60 +555,54 @@ class Explorer (object):
         both for the previous position (ex, to say that it went 'N'), and the
         current one (ex, came from 'S').
         pre: The Explorer is NOT at its starting position.
-        post: Adds a string (ex: 'N') to the second item in the positions' position diary.
-        If Explorer at starting position, no changes will be made. If the
-        direction is already in the position diary, no changes will be made."""
-        if self.steps_taken.size() > 0:               #As long as Explorer is not at its starting point,
-            row = self.get_row()                        #References to current position
-            col = self.get_col()
-            direction = self.steps_taken.top()          #The last direction taken
-
-            if (direction == 'N') and ('N' not in self.position_diary[(row+1, col)][1]):    #If the last step was to the North and North is not yet noted,
-                self.position_diary[(row+1,col)][1].append('N')                                 #Add it as a direction taken by Explorer from the previous location
-                if 'S' not in self.position_diary[(row, col)][1]:                               #If South is not yet noted as a direction visited from new location,
-                    self.position_diary[(row,col)][1].append('S')                                   #Add it
-
-            elif (direction == 'E') and ('E' not in self.position_diary[(row, col-1)][1]):  #Same as above, but with East from previous position
-                self.position_diary[(row,col-1)][1].append('E')
-                if 'W' not in self.position_diary[(row, col)][1]:
-                    self.position_diary[(row,col)][1].append('W')
-
-            elif (direction == 'W') and ('W' not in self.position_diary[(row, col+1)][1]):  #West from previous position
-                self.position_diary[(row,col+1)][1].append('W')
-                if 'E' not in self.position_diary[(row, col)][1]:
-                    self.position_diary[(row,col)][1].append('E')
-
-            elif (direction == 'S') and ('S' not in self.position_diary[(row-1, col)][1]):  #South from previous position
-                self.position_diary[(row-1,col)][1].append('S')
-                if 'N' not in self.position_diary[(row, col)][1]:
-                    self.position_diary[(row,col)][1].append('N')
+        post: Notes the direction as visited in the positions' position diary.
+        If Explorer at starting position, no changes will be made."""
+        if self.steps_taken.size() > 0:                                         #As long as Explorer is not at its starting point,
+            row, col = self.get_pos()                                               #References to current position
+            direction = self.steps_taken.top()                                      #The last direction taken
+            opposite = self.get_opposite_direction(direction)
+            last_row, last_col = self.get_pos_of_location_in_direction(opposite)
+            self.position_diary.note_visited(last_row, last_col, DIRECTION_BITS[direction])  #Went in direction from the previous location,
+            self.position_diary.note_visited(row, col, DIRECTION_BITS[opposite])             #and so came from the opposite direction to this one
 
 
     def are_directions_unexplored(self):
         """Checks its diary to see if Explorer has already been in all possible
         directions from the current location.
         post: Returns True or False."""
-        pos = self.get_pos()
-        return len(self.position_diary[pos][0]) != len(self.position_diary[pos][1])
+        row, col = self.get_pos()
+        if self.observer is not None:
+            self.observer.on_diary_lookups(self, 1)
+        return self.position_diary.get_unexplored_mask(row, col) != 0
 
 
-    def check_possible_directions(self):
+    def check_possible_mask(self):
         """Checks the possible directions from the Explorer's current location.
-        Returns these directions as strings ('N', for example) in a list.
-        post: returns a list that is empty (if there are walls all around the
-        current spot) or a list containing strings."""
+        Returns these directions as a bitmask of the direction bits N, E, W, S
+        from PositionDiary.
+        post: returns an int, 0 if there are walls all around the current spot."""
         current_row = self.get_row()
         current_col = self.get_col()
-        directions = []
+        if self.neighbours is not None:                                 #If the whole map was checked in advance, look it up
+            return self.neighbours[current_row * self.position_diary.cols + current_col]
+        mask = 0
         if self.map[current_row-1][current_col].get_contents() != 'W':  #If no wall in this direction, count it as an option
-            directions.append('N')
+            mask |= N
         if self.map[current_row][current_col+1].get_contents() != 'W':
-            directions.append('E')
+            mask |= E
         if self.map[current_row][current_col-1].get_contents() != 'W':
-            directions.append('W')
+            mask |= W
         if self.map[current_row+1][current_col].get_contents() != 'W':
-            directions.append('S')
-        return directions
+            mask |= S
+        return mask
+
+
+    def check_possible_directions(self):
+        """Checks the possible directions from the Explorer's current location.
+        Returns these directions as strings ('N', for example) in a list.
+        post: returns a list that is empty (if there are walls all around the
+        current spot) or a list containing strings."""
+        return list(MASK_DIRECTIONS[self.check_possible_mask()])
 
 
     def decide_where_to_go(self):
@@ -242,16 +613,16 @@ class Explorer (object):
             3. 'None' (tried all posible directions and is at starting point)
         pre: The current position is in the position diary.
         post: Returns a string from above list."""
-        pos_diary = self.position_diary
-        pos = self.get_pos()
-        if not(self.are_directions_unexplored()) and self.steps_taken.size() == 0: #If there are no more directions to explore AND Explorer is at starting point
-            return 'No'                                                             #Return empty string
-        elif not(self.are_directions_unexplored()):                             #If there are no more directions to explore,
-            return 'Backtrack'                                                      #Return 'Backtrack'
-        else:                                                                   #Otherwise,
-            for direction in self.DIRECTIONS:                                       #For every direction in 'NEWS'
-                if (direction in pos_diary[pos][0]) and (direction not in pos_diary[pos][1]):   #If it's not yet been traveled to,
-                    return direction                                                                #Return the direction
+        row, col = self.get_pos()
+        if self.observer is not None:
+            self.observer.on_diary_lookups(self, 1)
+        direction = self.position_diary.get_next_direction(row, col)            #The first direction not yet traveled to, in order N > E > W > S
+        if direction is not None:
+            return direction
+        elif self.steps_taken.size() == 0:                                      #If there are no more directions to explore AND Explorer is at starting point
+            return 'No'
+        else:                                                                   #If there are no more directions to explore,
+            return 'Backtrack'
 
 
     def get_opposite_direction(self, direction):
@@ -269,15 +640,24 @@ class Explorer (object):
 
 
     def display_map(self):
-        """Prints the current state of the map.
-        pre: map is a valid map that can be used by an Explorer (a tuple of tuples
-        (of same lengths) containing Locations.)
-        post: Outputs the map to the screen."""
-        map = self.map
-        for row in map:
-            for loc in row:
-                print(loc.get_contents(), end="")
-                if loc.get_contents() == 'X':       #Now that it's printed, if a path to a treasure was displayed,
-                    loc.set_contents('.')               #Change it back to a normal path for future adventuring
-            print('\n', end="")
-        print('\n', end="")
+        """Displays the current state of the map, with the path to the last
+        treasure collected shown using 'X's (without writing them into the map).
+        Only the cells that changed since the last frame are redrawn.
+        pre: map is a valid map that can be used by an Explorer (a GridMap or a
+        tuple of tuples (of same lengths) containing Locations.)
+        post: Outputs the map to the screen, unless the Renderer skipped the frame."""
+        if self.renderer is None:
+            self.renderer = Renderer()
+        if self.observer is None:
+            drawn = self.renderer.draw(self.map, self.get_treasure_path)       #Draw the frame, working out the path only if it is drawn
+        else:
+            path = []
+            def overlay():                                                      #Keep the path, to tell the observer how long it was
+                path.extend(self.get_treasure_path())
+                return path
+            start = time.time()
+            drawn = self.renderer.draw(self.map, overlay)
+            if drawn:
+                self.observer.on_render(self, time.time() - start, len(path))
+        if drawn:                                                               #If the frame was drawn,
+            self.treasure_path_depth = None                                         #The path to the treasure has been displayed
@@ -0,0 +1,160 @@
+#-------------------------------------------------------------------------------
+# Name:        ExplorerObserver.py
+# Purpose: To let other code watch what an Explorer does (moves, backtracks,
+#          treasure found, the end of exploring, diary lookups, frames rendered),
+#          and to count and time a run of the Explorer with RunStats.
+#
+# Author:      odanielb (Bridget O'Daniel)
+#-------------------------------------------------------------------------------
+import json
+import time
+from contextlib import contextmanager
+
+
+class ExplorerObserver(object):
+    """Receives events from an Explorer. Every method does nothing here, so an
+    observer only needs to override the events it cares about."""
+
+    def on_move(self, explorer, direction):
+        """Called after the Explorer moves in direction to somewhere new."""
+        pass
+
+
+    def on_backtrack(self, explorer, direction):
+        """Called after the Explorer backtracks one spot (in direction)."""
+        pass
+
+
+    def on_treasure(self, explorer, position):
+        """Called when the Explorer collects the treasure at position."""
+        pass
+
+
+    def on_finished(self, explorer):
+        """Called when the Explorer has explored everything it can."""
+        pass
+
+
+    def on_diary_lookups(self, explorer, count):
+        """Called after the Explorer has looked up count positions in its
+        position diary."""
+        pass
+
+
+    def on_render(self, explorer, seconds, path_length):
+        """Called after a frame of the map is drawn, with how long drawing took
+        and how many cells of path to treasure were worked out for it."""
+        pass
+
+
+
+class ObserverGroup(ExplorerObserver):
+
+    def __init__(self, observers):
+        """Creates an observer that passes every event on to each of observers.
+        pre: observers is a list of ExplorerObservers."""
+        self.observers = list(observers)
+
+
+    def on_move(self, explorer, direction):
+        for observer in self.observers:
+            observer.on_move(explorer, direction)
+
+
+    def on_backtrack(self, explorer, direction):
+        for observer in self.observers:
+            observer.on_backtrack(explorer, direction)
+
+
+    def on_treasure(self, explorer, position):
+        for observer in self.observers:
+            observer.on_treasure(explorer, position)
+
+
+    def on_finished(self, explorer):
+        for observer in self.observers:
+            observer.on_finished(explorer)
+
+
+    def on_diary_lookups(self, explorer, count):
+        for observer in self.observers:
+            observer.on_diary_lookups(explorer, count)
+
+
+    def on_render(self, explorer, seconds, path_length):
+        for observer in self.observers:
+            observer.on_render(explorer, seconds, path_length)
+
+
+
+class RunStats(ExplorerObserver):
+
+    def __init__(self):
+        """Creates a new RunStats, with every counter and timer at zero. Attach it
+        to an Explorer as its observer to count what it does, and time the
+        phases of a run (like 'load' and 'explore') with phase()."""
+        self.counters = {'moves': 0,
+                         'backtracks': 0,
+                         'treasure': 0,
+                         'diary_lookups': 0,
+                         'treasure_path_rewrites': 0,
+                         'treasure_path_cells': 0,
+                         'frames': 0}
+        self.phases = {}
+        self.finished = False
+
+
+    @contextmanager
+    def phase(self, name):
+        """Times the code in a 'with stats.phase(name):' block, adding the time
+        to the phase called name."""
+        start = time.time()
+        try:
+            yield
+        finally:
+            self.add_time(name, time.time() - start)
+
+
+    def add_time(self, name, seconds):
+        """Adds seconds to the time spent in the phase called name."""
+        self.phases[name] = self.phases.get(name, 0.0) + seconds
+
+
+    def on_move(self, explorer, direction):
+        self.counters['moves'] += 1
+
+
+    def on_backtrack(self, explorer, direction):
+        self.counters['backtracks'] += 1
+
+
+    def on_treasure(self, explorer, position):
+        self.counters['treasure'] += 1
+
+
+    def on_finished(self, explorer):
+        self.finished = True
+
+
+    def on_diary_lookups(self, explorer, count):
+        self.counters['diary_lookups'] += count
+
+
+    def on_render(self, explorer, seconds, path_length):
+        self.counters['frames'] += 1
+        if path_length:
+            self.counters['treasure_path_rewrites'] += 1
+            self.counters['treasure_path_cells'] += path_length
+        self.add_time('render', seconds)
+
+
+    def to_dict(self):
+        """Returns the counters and phase times (in seconds) as a dictionary."""
+        return {'counters': dict(self.counters),
+                'phases': dict((name, round(seconds, 6)) for name, seconds in self.phases.items()),
+                'finished': self.finished}
+
+
+    def to_json(self):
+        """Returns the counters and phase times as a JSON string."""
+        return json.dumps(self.to_dict(), sort_keys=True)
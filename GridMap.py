@@ -0,0 +1,167 @@
+#-------------------------------------------------------------------------------
+# Name:        GridMap.py
+# Purpose: A compact map for the Explorer, storing one byte per cell in a single
+#          flat bytearray instead of one Location object per cell.
+#
+# Author:      odanielb (Bridget O'Daniel)
+#-------------------------------------------------------------------------------
+from Location import Location
+
+
+class GridMap(object):
+
+    CONTENTS = 'W.TMX'
+
+    def __init__(self, rows, cols, cells=None):
+        """Creates a new GridMap with the provided number of rows and columns.
+        Each cell is stored as the byte value of its contents character:
+            'W' = Wall
+            '.' = Empty path
+            'T' = Treasure
+            'M' = Explorer
+            'X' = To display path taken to treasure
+        pre: rows and cols are ints. cells, if provided, is a bytearray (or any
+        writable buffer) of length rows*cols laid out row after row. If it is not
+        provided, every cell starts as a Wall.
+        post: Creates a GridMap. Its start and treasures are None unless whoever
+        loaded it already knows where the explorer ('M') started, as a (row, col)
+        tuple, and where the treasure was, as an array('Q') of row*cols+col (or
+        a read-only view of one, for maps from a MapCache grid file)."""
+        self.rows = rows
+        self.cols = cols
+        if cells is None:
+            cells = bytearray(b'W' * (rows * cols))
+        if len(cells) != rows * cols:
+            raise ValueError("Map should have "+str(rows*cols)+" cells, not "+str(len(cells)))
+        self.cells = cells
+        self.start = None
+        self.treasures = None
+
+
+    @classmethod
+    def from_rows(cls, list_of_rows):
+        """Creates a GridMap from a list of rows, each row being a string or a
+        list of one character strings.
+        pre: every row has the same length.
+        post: returns a GridMap."""
+        rows = len(list_of_rows)
+        cols = len(list_of_rows[0]) if rows > 0 else 0
+        grid = cls(rows, cols)
+        for row, contents in enumerate(list_of_rows):
+            grid.set_row(row, ''.join(contents))
+        return grid
+
+
+    def copy(self):
+        """Returns a new GridMap with the same contents (and start and treasures)
+        as this one."""
+        grid = GridMap(self.rows, self.cols, bytearray(self.cells))
+        grid.start = self.start
+        grid.treasures = self.treasures
+        return grid
+
+
+    def get(self, row, col):
+        """Returns the contents of the cell at (row, col).
+        post: returns a string of one character ('W', '.', 'T', 'M', 'X')."""
+        return chr(self.cells[row * self.cols + col])
+
+
+    def set(self, row, col, contents):
+        """Sets the cell at (row, col) to the provided contents.
+        pre: contents is a string of one character from CONTENTS."""
+        self.cells[row * self.cols + col] = ord(contents)
+
+
+    def set_row(self, row, contents):
+        """Sets a whole row of cells at once.
+        pre: contents is a string of exactly cols characters from CONTENTS."""
+        start = row * self.cols
+        self.cells[start:start + self.cols] = contents.encode('ascii')
+
+
+    def get_row_string(self, row):
+        """Returns the contents of a whole row as a string.
+        post: returns a string of cols characters."""
+        start = row * self.cols
+        return bytes(self.cells[start:start + self.cols]).decode('ascii')
+
+
+    def get_location(self, row, col):
+        """Returns a Location that reads and writes this cell of the map.
+        post: returns a Location."""
+        return GridLocation(self, row, col)
+
+
+    def __len__(self):
+        """Returns the number of rows, so the map can be used like a tuple of rows."""
+        return self.rows
+
+
+    def __getitem__(self, row):
+        """Returns a view of the row, so that map[row][col] returns a Location."""
+        if row < 0:
+            row += self.rows
+        if not 0 <= row < self.rows:
+            raise IndexError("row index out of range")
+        return GridRow(self, row)
+
+
+    def __iter__(self):
+        """Iterates through the rows of the map."""
+        for row in range(self.rows):
+            yield GridRow(self, row)
+
+
+
+class GridRow(object):
+
+    __slots__ = ('grid', 'row')
+
+    def __init__(self, grid, row):
+        """Creates a view of one row of a GridMap.
+        pre: grid is a GridMap and row is a valid row in it."""
+        self.grid = grid
+        self.row = row
+
+
+    def __len__(self):
+        return self.grid.cols
+
+
+    def __getitem__(self, col):
+        """Returns a Location view of the cell in this row at col."""
+        if col < 0:
+            col += self.grid.cols
+        if not 0 <= col < self.grid.cols:
+            raise IndexError("column index out of range")
+        return GridLocation(self.grid, self.row, col)
+
+
+    def __iter__(self):
+        for col in range(self.grid.cols):
+            yield GridLocation(self.grid, self.row, col)
+
+
+
+class GridLocation(Location):
+
+    __slots__ = ('grid',)
+
+    def __init__(self, grid, row, col):
+        """Creates a Location that has no contents of its own, but reads and
+        writes the contents of the (row, col) cell of grid.
+        pre: grid is a GridMap and (row, col) is a position on it."""
+        self.grid = grid
+        self.row = row
+        self.col = col
+
+
+    @property
+    def contents(self):
+        return chr(self.grid.cells[self.row * self.grid.cols + self.col])
+
+
+    @contents.setter
+    def contents(self, contents):
+        self.grid.cells[self.row * self.grid.cols + self.col] = ord(contents)
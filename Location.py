@@ -8,6 +8,7 @@
 
 class Location(object):
 
+    __slots__ = ('row', 'col', 'contents')
 
     def __init__(self, row, col, contents):
         """Creates a new Location (a single spot on a map) with a provided row
@@ -0,0 +1,298 @@
+#-------------------------------------------------------------------------------
+# Name:        MapCache.py
+# Purpose: To keep caves that have already been parsed, keyed by a hash of the
+#          file's contents, so loading the same cave again skips parsing it. The
+#          cache is kept in memory (least recently used first out, up to a number
+#          of bytes) and, if given a directory, on disk as precompiled grids that
+#          are memory-mapped straight back in, copy-on-write, so each load only
+#          copies the cells the Explorer changes. Each cave remembers where the
+#          explorer ('M') starts and where the treasure is, so nothing has to
+#          scan the map for them.
+#
+# Author:      odanielb (Bridget O'Daniel)
+#
+# Grid file layout: a header (MAGIC, version, rows, cols, start row, start col,
+#                   number of treasures), padded to CELLS_OFFSET so the cells can
+#                   be memory-mapped on their own, then the cells (one byte each,
+#                   row after row), padded to a multiple of 8 bytes, then each
+#                   treasure as row*cols+col in 8 bytes.
+#-------------------------------------------------------------------------------
+import hashlib
+import mmap
+import os
+import struct
+import tempfile
+import threading
+from array import array
+from collections import OrderedDict
+from CaveFormat import find_treasures
+from GridMap import GridMap
+from MapLoader import _parse, load_map
+
+MAGIC = b'CAVEGRID'
+VERSION = 3
+HEADER = struct.Struct('<8sHIIIIQ')                                             #Magic, version, rows, cols, start row, start col, treasures
+CELLS_OFFSET = mmap.ALLOCATIONGRANULARITY                                       #Where the cells start in a grid file (memory maps must start at a multiple of this)
+NO_START = 0xFFFFFFFF                                                           #Start row and col of a map with no explorer on it
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+ENTRY_BYTES = 512                                                               #Roughly what a cached cave takes besides its cells and treasures
+HASH_BYTES = 16                                                                 #Size of the content hashes caves are keyed by
+MAX_FILES = 4096                                                                #Files whose content hash is remembered, so they aren't read again
+
+_caches = {}                                                                    #(Cache directory (or None), max bytes) -> the MapCache shared by everything in this process
+
+
+class CachedMap(object):
+
+    def __init__(self, rows, cols, cells, start, treasures, grid_file=None):
+        """Holds a parsed cave in the cache, either in memory or in a grid file.
+        Its cells are never changed; each load gets a copy.
+        pre: cells is a bytes-like object of rows*cols cells and treasures an
+        array('Q') of row*cols+col of every treasure, or both are None if they
+        are in grid_file (the name of a grid file). start is a (row, col) tuple
+        or None."""
+        self.rows = rows
+        self.cols = cols
+        self.cells = cells
+        self.start = start
+        self.treasures = treasures
+        self.grid_file = grid_file
+
+
+    def get_size(self):
+        """Returns roughly how many bytes of this process's memory the cave takes
+        up (cells and treasures in a grid file are the operating system's to
+        keep)."""
+        if self.cells is None:
+            return ENTRY_BYTES
+        return ENTRY_BYTES + len(self.cells) + self.treasures.itemsize * len(self.treasures)
+
+
+    def get_map(self):
+        """Returns a new GridMap of the cave, with its start and treasures set.
+        Cells from a grid file are memory-mapped copy-on-write, so only the pages
+        the Explorer writes to are copied, and its treasures are a read-only view
+        of the file rather than an array('Q').
+        post: raises IOError if the grid file has gone."""
+        if self.cells is None:
+            size = self.rows * self.cols
+            with open(self.grid_file, 'rb') as grid_file:
+                count = HEADER.unpack(grid_file.read(HEADER.size))[6]
+                cells = mmap.mmap(grid_file.fileno(), size, access=mmap.ACCESS_COPY, offset=CELLS_OFFSET)
+                treasures = array('Q')
+                if count:
+                    first = _treasures_offset(size)
+                    start = first - first % mmap.ALLOCATIONGRANULARITY              #Memory maps must start at a multiple of this
+                    view = mmap.mmap(grid_file.fileno(), first - start + 8 * count, access=mmap.ACCESS_READ, offset=start)
+                    treasures = memoryview(view)[first - start:].cast('Q')
+        else:
+            cells = bytearray(self.cells)
+            treasures = self.treasures                                          #Never changed, so every load can share it
+        grid = GridMap(self.rows, self.cols, cells)
+        grid.start = self.start
+        grid.treasures = treasures
+        return grid
+
+
+
+class MapCache(object):
+
+    def __init__(self, max_bytes=DEFAULT_MAX_BYTES, cache_dir=None):
+        """Creates an empty cache of parsed caves, holding up to max_bytes of them
+        in memory (0 to keep none there). If cache_dir is provided, caves are
+        also saved there as precompiled grids, and loaded from there when they
+        aren't in memory.
+        pre: max_bytes is an int. cache_dir is the name of a directory or None.
+        post: Creates a MapCache. cache_dir is created if it doesn't exist."""
+        self.max_bytes = max_bytes
+        self.cache_dir = cache_dir
+        self.entries = OrderedDict()                                            #Content hash -> CachedMap, least recently used first
+        self.hashes = OrderedDict()                                             #(Real path, size, modified time, inode) -> content hash of that file, least recently used first
+        self.size = 0
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()                                            #So sessions in other threads can share the cache
+        if cache_dir is not None and not os.path.isdir(cache_dir):
+            os.makedirs(cache_dir)
+
+
+    def load_map(self, file_name):
+        """Loads the map in file_name like MapLoader.load_map, parsing it only if
+        a file with the same contents hasn't been loaded before.
+        pre: file_name is a string.
+        post: returns a new GridMap, with its start and treasures set. Raises IOError if the
+        file can't be opened and ValueError if it does not hold a map."""
+        status = os.stat(file_name)
+        identity = (os.path.realpath(file_name), status.st_size, status.st_mtime_ns, status.st_ino)
+        with self.lock:
+            key = self.hashes.get(identity)
+        entry = self._get(key)                                                  #A file that hasn't changed isn't even read again
+        grid = None
+        if entry is None:
+            with open(file_name, 'rb') as open_file:
+                try:
+                    buf = mmap.mmap(open_file.fileno(), 0, access=mmap.ACCESS_READ)
+                except ValueError:
+                    raise ValueError(file_name+" is empty!")
+                try:
+                    key = hashlib.blake2b(buf, digest_size=HASH_BYTES).hexdigest()
+                    entry = self._get(key)
+                    if entry is None:
+                        entry = self._load_from_disk(key)
+                        if entry is None:
+                            self.misses += 1
+                            grid = _parse(buf, file_name)
+                            entry = self._entry_for(key, grid)
+                        if entry is not None:
+                            self._add(key, entry)
+                finally:
+                    buf.close()
+            self._remember(identity, key)
+        if grid is not None and (entry is None or entry.cells is None):
+            return grid                                                         #Freshly parsed and not kept in memory, so it needn't be copied
+        try:
+            return entry.get_map()
+        except (IOError, OSError):                                              #Its grid file was removed; forget it and parse the file again
+            with self.lock:
+                if self.entries.pop(key, None) is not None:
+                    self.size -= entry.get_size()
+            grid = load_map(file_name)
+            _set_start_and_treasures(grid)
+            return grid
+
+
+    def _remember(self, identity, key):
+        """Remembers that the file identified by identity has content hash key,
+        forgetting the least recently used files beyond MAX_FILES."""
+        with self.lock:
+            self.hashes[identity] = key
+            self.hashes.move_to_end(identity)
+            while len(self.hashes) > MAX_FILES:
+                self.hashes.popitem(last=False)
+
+
+    def _get(self, key):
+        """Returns the cave with content hash key from memory (as the most
+        recently used), or None if it isn't there."""
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                self.entries.move_to_end(key)
+                self.hits += 1
+            return entry
+
+
+    def _add(self, key, entry):
+        """Adds entry to the cache in memory, forgetting the least recently used
+        caves until the cache fits in max_bytes again. Caves bigger than
+        max_bytes aren't kept (so with max_bytes 0, nothing is)."""
+        with self.lock:
+            if key in self.entries or entry.get_size() > self.max_bytes:
+                return
+            self.entries[key] = entry
+            self.size += entry.get_size()
+            while self.size > self.max_bytes:
+                evicted = self.entries.popitem(last=False)[1]
+                self.size -= evicted.get_size()
+
+
+    def _entry_for(self, key, grid):
+        """Returns the CachedMap for a freshly parsed GridMap (setting its start
+        and treasures): in a grid file if there is a cache directory, otherwise
+        holding grid's own cells and treasures if they fit in memory, otherwise
+        None."""
+        _set_start_and_treasures(grid)
+        entry = self._save_to_disk(key, grid)
+        if entry is None:
+            entry = CachedMap(grid.rows, grid.cols, grid.cells, grid.start, grid.treasures)   #The caller gets a copy, so these are never changed
+            if entry.get_size() > self.max_bytes:
+                entry = None
+        return entry
+
+
+    def _path(self, key):
+        """Returns the name of the grid file for the cave with content hash key."""
+        return os.path.join(self.cache_dir, key+'.grid')
+
+
+    def _load_from_disk(self, key):
+        """Returns the CachedMap saved on disk for key, or None if there isn't one
+        (or it can't be used). Only its header is read; the cells are
+        memory-mapped, and the treasures read, by get_map."""
+        if self.cache_dir is None:
+            return None
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as grid_file:
+                header = grid_file.read(HEADER.size)
+                if len(header) < HEADER.size:
+                    return None
+                magic, version, rows, cols, start_row, start_col, treasures = HEADER.unpack(header)
+                if magic != MAGIC or version != VERSION or os.fstat(grid_file.fileno()).st_size != _treasures_offset(rows * cols) + 8 * treasures:
+                    return None
+        except (IOError, OSError):
+            return None
+        self.disk_hits += 1
+        start = None if start_row == NO_START else (start_row, start_col)
+        return CachedMap(rows, cols, None, start, None, path)
+
+
+    def _save_to_disk(self, key, grid):
+        """Saves grid to disk as a grid file for key (if there is a cache
+        directory), writing to a temporary file first so other processes never
+        see half a file.
+        post: returns the CachedMap for the grid file, or None if it wasn't saved."""
+        if self.cache_dir is None or not grid.cells:
+            return None
+        start_row, start_col = grid.start if grid.start is not None else (NO_START, NO_START)
+        handle, temporary = tempfile.mkstemp(dir=self.cache_dir, suffix='.tmp')
+        try:
+            with os.fdopen(handle, 'wb') as grid_file:
+                grid_file.write(HEADER.pack(MAGIC, VERSION, grid.rows, grid.cols, start_row, start_col,
+                                            len(grid.treasures)).ljust(CELLS_OFFSET, b'\0'))
+                grid_file.write(grid.cells)
+                grid_file.write(bytes(_treasures_offset(len(grid.cells)) - CELLS_OFFSET - len(grid.cells)))
+                grid_file.write(grid.treasures)
+            os.replace(temporary, self._path(key))
+        except (IOError, OSError):
+            if os.path.exists(temporary):
+                os.remove(temporary)
+            return None
+        return CachedMap(grid.rows, grid.cols, None, grid.start, None, self._path(key))
+
+
+def hash_file(file_name):
+    """Returns the hash of the contents of file_name that caves are cached by, as
+    16 bytes (the cache names them by its hex digits).
+    post: raises IOError if the file can't be read."""
+    digest = hashlib.blake2b(digest_size=HASH_BYTES)
+    with open(file_name, 'rb') as open_file:
+        for chunk in iter(lambda: open_file.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.digest()
+
+
+def _set_start_and_treasures(grid):
+    """Sets the start of a freshly parsed GridMap to where the explorer ('M') is,
+    and its treasures (unless its file already listed them, as .cave files do)
+    to row*cols+col of every 'T'."""
+    start = grid.cells.find(b'M')
+    grid.start = None if start == -1 else divmod(start, grid.cols)
+    if grid.treasures is None:
+        grid.treasures = find_treasures(grid.cells)
+
+
+def _treasures_offset(size):
+    """Returns where the treasures start in a grid file of a cave of size cells."""
+    return CELLS_OFFSET + (size + 7) // 8 * 8
+
+
+def get_cache(cache_dir=None, max_bytes=DEFAULT_MAX_BYTES):
+    """Returns the MapCache shared by everything in this process that caches maps
+    in cache_dir (or only in memory, if cache_dir is None), keeping up to
+    max_bytes of them in memory."""
+    cache = _caches.get((cache_dir, max_bytes))
+    if cache is None:
+        cache = _caches[(cache_dir, max_bytes)] = MapCache(max_bytes, cache_dir)
+    return cache
@@ -0,0 +1,93 @@
+#-------------------------------------------------------------------------------
+# Name:        MapLoader.py
+# Purpose: To load a cave map from a .txt file straight into a GridMap, memory
+#          mapping the file and parsing it one row at a time. Caves in the binary
+#          .cave format (see CaveFormat) are recognised and loaded too.
+#
+# Author:      odanielb (Bridget O'Daniel)
+#-------------------------------------------------------------------------------
+import mmap
+from GridMap import GridMap
+from CaveFormat import is_cave_file, parse_cave
+
+_BLANKS = b' \t\r\n'
+
+
+def load_map(file_name):
+    """Opens the file with the name in 'file_name' and loads the map it contains
+    into a GridMap. The first line of the file gives the size of the map as
+    'rows cols', and every line after it is one row of the map, either written
+    densely ('WW.TW') or with spaces between the cells ('W W . T W'). Files in
+    the .cave format are loaded with CaveFormat instead, whatever their name.
+    pre: file_name is a string with the name of a .txt or .cave file (including
+    extension).
+    post: returns a GridMap. Raises IOError if the file can't be opened and
+    ValueError if the file does not hold a map of the size in its first line."""
+    with open(file_name, 'rb') as open_file:
+        try:
+            buf = mmap.mmap(open_file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            raise ValueError(file_name+" is empty!")
+        try:
+            return _parse(buf, file_name)
+        finally:
+            buf.close()
+
+
+def _parse(buf, file_name):
+    """Parses the map in buf (the contents of file_name) in a single pass,
+    writing each row directly into the cells of a new GridMap.
+    pre: buf is a bytes-like object supporting find() and slicing, like an mmap.
+    post: returns a GridMap."""
+    if is_cave_file(buf):
+        return parse_cave(buf, file_name)
+    rows, cols, lines = read_rows(buf, file_name)
+    grid = GridMap(rows, cols, bytearray(rows * cols))
+    cells = grid.cells
+    for row, line in enumerate(lines):
+        cells[row * cols:(row + 1) * cols] = line                               #Put the row right into its place in the map
+    return grid
+
+
+def read_rows(buf, file_name):
+    """Reads the size of the .txt map in buf (the contents of file_name), and
+    gets ready to read its rows one at a time, so a map too big for memory can
+    be read a piece at a time (see CaveFormat.txt_to_cave).
+    pre: buf is a bytes-like object supporting find() and slicing, like an mmap.
+    post: returns rows, cols and a generator of the rows, each as a bytes of
+    cols cells. Raises ValueError if buf does not start with the size of the
+    map; the generator raises ValueError when it reaches a row of the wrong
+    length, or the end of buf before the last row."""
+    size = len(buf)
+    end = _line_end(buf, 0, size)
+    dimensions = buf[0:end].split()
+    if len(dimensions) != 2:
+        raise ValueError(file_name+" does not start with the size of the map (rows cols)!")
+    rows, cols = int(dimensions[0]), int(dimensions[1])
+    return rows, cols, _rows(buf, file_name, end + 1, rows, cols)
+
+
+def _rows(buf, file_name, pos, rows, cols):
+    """Yields the rows of the map in buf one at a time, from pos on."""
+    size = len(buf)
+    row = 0
+    while row < rows and pos < size:
+        end = _line_end(buf, pos, size)
+        line = buf[pos:end].translate(None, _BLANKS)                           #Take out the spaces (if any) and line endings
+        pos = end + 1
+        if not line:                                                            #Skip blank lines
+            continue
+        if len(line) != cols:
+            raise ValueError("Row "+str(row)+" of "+file_name+" should have "+str(cols)+" cells, not "+str(len(line)))
+        yield line
+        row += 1
+    if row != rows:
+        raise ValueError(file_name+" should have "+str(rows)+" rows, not "+str(row))
+
+
+def _line_end(buf, pos, size):
+    """Returns the index of the end of the line starting at pos in buf."""
+    end = buf.find(b'\n', pos)
+    if end == -1:
+        end = size
+    return end
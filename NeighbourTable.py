@@ -0,0 +1,98 @@
+#-------------------------------------------------------------------------------
+# Name:        NeighbourTable.py
+# Purpose: To work out, for every cell of a map at once, which of its neighbours
+#          are open (not walls), so the Explorer can look this up instead of
+#          checking the map each time it enters a new cell. Also checks maps for
+#          open cells on their border, which would lead the Explorer off the map.
+#
+# Author:      odanielb (Bridget O'Daniel)
+#
+# Uses NumPy if it is installed, otherwise falls back to plain Python.
+#-------------------------------------------------------------------------------
+from PositionDiary import N, E, W, S
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+WALL = ord('W')
+
+
+def build_neighbour_table(grid, check=True):
+    """Returns a bytearray with one byte per cell of grid (indexed by
+    row*cols+col), holding the bitmask of directions (N, E, W, S from
+    PositionDiary) whose neighbouring cell is not a wall. Neighbours off the
+    edge of the map count as walls.
+    pre: grid is a GridMap.
+    post: returns a bytearray of length rows*cols. If check is True, raises
+    ValueError if the map has open cells on its border."""
+    if check:
+        check_map(grid)
+    if numpy is not None:
+        return _build_with_numpy(grid)
+    return _build_with_python(grid)
+
+
+def find_open_border_cells(grid):
+    """Returns the positions of the cells on the border of grid that are not
+    walls. From these the Explorer could try to step off the map.
+    pre: grid is a GridMap.
+    post: returns a list of (row, col) tuples."""
+    rows, cols, cells = grid.rows, grid.cols, grid.cells
+    border = set()
+    for col in range(cols):
+        border.add((0, col))
+        border.add((rows - 1, col))
+    for row in range(rows):
+        border.add((row, 0))
+        border.add((row, cols - 1))
+    return sorted((row, col) for row, col in border if cells[row * cols + col] != WALL)
+
+
+def check_map(grid):
+    """Checks that grid can be explored without leaving the map.
+    pre: grid is a GridMap.
+    post: raises ValueError naming the open border cells, if there are any."""
+    if grid.rows < 1 or grid.cols < 1:
+        raise ValueError("The map is empty!")
+    open_cells = find_open_border_cells(grid)
+    if open_cells:
+        shown = ', '.join(str(pos) for pos in open_cells[:10])
+        if len(open_cells) > 10:
+            shown += ', ...'
+        raise ValueError("The map has "+str(len(open_cells))+" open cells on its border: "+shown)
+
+
+def _build_with_numpy(grid):
+    """Builds the neighbour table in one vectorised pass, comparing the map
+    against itself shifted by one cell in each direction."""
+    rows, cols = grid.rows, grid.cols
+    is_open = numpy.frombuffer(grid.cells, dtype=numpy.uint8).reshape(rows, cols) != WALL
+    table = numpy.zeros((rows, cols), dtype=numpy.uint8)
+    table[1:, :] |= is_open[:-1, :] * numpy.uint8(N)                            #The cell above is open
+    table[:, :-1] |= is_open[:, 1:] * numpy.uint8(E)                            #The cell to the right is open
+    table[:, 1:] |= is_open[:, :-1] * numpy.uint8(W)                            #The cell to the left is open
+    table[:-1, :] |= is_open[1:, :] * numpy.uint8(S)                            #The cell below is open
+    return bytearray(table.tobytes())
+
+
+def _build_with_python(grid):
+    """Builds the neighbour table one row at a time, for when NumPy is not installed."""
+    rows, cols, cells = grid.rows, grid.cols, grid.cells
+    table = bytearray(rows * cols)
+    for row in range(rows):
+        start = row * cols
+        for col in range(cols):
+            index = start + col
+            mask = 0
+            if row > 0 and cells[index - cols] != WALL:
+                mask |= N
+            if col < cols - 1 and cells[index + 1] != WALL:
+                mask |= E
+            if col > 0 and cells[index - 1] != WALL:
+                mask |= W
+            if row < rows - 1 and cells[index + cols] != WALL:
+                mask |= S
+            table[index] = mask
+    return table
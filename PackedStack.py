@@ -0,0 +1,102 @@
+#-------------------------------------------------------------------------------
+# Name:        PackedStack.py
+# Purpose: A stack of directions ('N', 'E', 'W', 'S') for the Explorer's
+#          steps_taken, storing each direction in 2 bits of a bytearray rather
+#          than as one Python object per entry. Has the same push/pop/top/size
+#          methods as Stack.
+#
+# Author:      odanielb (Bridget O'Daniel)
+#-------------------------------------------------------------------------------
+
+DIRECTIONS = 'NEWS'                                                             #A direction is stored as its index in here
+CODES = dict((direction, code) for code, direction in enumerate(DIRECTIONS))
+_TOP_DOWN = tuple(''.join(DIRECTIONS[(byte >> shift) & 3] for shift in (6, 4, 2, 0)) for byte in range(256))   #The four directions in each full byte, from the top down
+
+
+class PackedStack(object):
+
+    def __init__(self):
+        """Creates an empty stack of directions."""
+        self.data = bytearray()
+        self.count = 0
+
+
+    def push(self, direction):
+        """Places direction on top of the stack.
+        pre: direction is one of 'N', 'E', 'W', 'S'."""
+        self.push_code(CODES[direction])
+
+
+    def push_code(self, code):
+        """Places the direction with the provided code (its index in 'NEWS') on
+        top of the stack."""
+        count = self.count
+        shift = (count & 3) << 1
+        if shift == 0:
+            self.data.append(code)                                              #Start a new byte
+        else:
+            self.data[count >> 2] |= code << shift
+        self.count = count + 1
+
+
+    def pop(self):
+        """Removes and returns the direction on top of the stack.
+        post: returns a string of one character. Raises IndexError if the stack
+        is empty."""
+        return DIRECTIONS[self.pop_code()]
+
+
+    def pop_code(self):
+        """Removes and returns the code of the direction on top of the stack."""
+        count = self.count - 1
+        if count < 0:
+            raise IndexError("pop from empty stack")
+        shift = (count & 3) << 1
+        if shift == 0:
+            code = self.data.pop()                                              #It was the only direction left in its byte
+        else:
+            index = count >> 2
+            code = (self.data[index] >> shift) & 3
+            self.data[index] &= ~(3 << shift)
+        self.count = count
+        return code
+
+
+    def truncate(self, size):
+        """Removes directions from the top of the stack until only size are left.
+        pre: size is an int from 0 to size()."""
+        del self.data[(size + 3) >> 2:]
+        shift = (size & 3) << 1
+        if shift:
+            self.data[-1] &= (1 << shift) - 1                                   #Clear the directions above size in the last byte
+        self.count = size
+
+
+    def top(self):
+        """Returns the direction on top of the stack without removing it.
+        post: returns a string of one character. Raises IndexError if the stack
+        is empty."""
+        count = self.count - 1
+        if count < 0:
+            raise IndexError("top of empty stack")
+        return DIRECTIONS[(self.data[count >> 2] >> ((count & 3) << 1)) & 3]
+
+
+    def size(self):
+        """Returns the number of directions in the stack."""
+        return self.count
+
+
+    def iter_from_top(self):
+        """Returns an iterator over the directions in the stack, from the top
+        down, without removing them. Full bytes are decoded four directions at
+        a time."""
+        full, partial = divmod(self.count, 4)
+        if partial:
+            byte = self.data[full]
+            for shift in range((partial - 1) << 1, -1, -2):
+                yield DIRECTIONS[(byte >> shift) & 3]
+        data = self.data
+        for index in range(full - 1, -1, -1):
+            for direction in _TOP_DOWN[data[index]]:
+                yield direction
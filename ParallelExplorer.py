@@ -0,0 +1,161 @@
+#-------------------------------------------------------------------------------
+# Name:        ParallelExplorer.py
+# Purpose: To explore one very large cave with several worker processes at once.
+#          The map is split into bands of rows, and each band is explored by one
+#          worker at a time, so the visited map (kept in shared memory) never has
+#          two workers writing the same cell. Paths that lead into another band
+#          are handed over to that band, which is explored again as soon as no
+#          worker is busy with it, until nothing is left to explore. The workers'
+#          treasure and visited cells are then merged.
+#
+# Author:      odanielb (Bridget O'Daniel)
+#
+# Needs Python 3.8 or newer, for multiprocessing.shared_memory.
+#-------------------------------------------------------------------------------
+import multiprocessing
+from multiprocessing import shared_memory
+import queue
+from PositionDiary import N, E, W, S
+from NeighbourTable import build_neighbour_table
+
+BANDS_PER_WORKER = 4                                                            #More bands than workers, so a busy band doesn't leave workers idle
+
+_shared = {}                                                                    #The shared memory each worker process has attached to
+
+
+class ParallelResult(object):
+
+    def __init__(self, treasure, coverage, tasks):
+        """Holds the merged results of exploring a cave in parallel.
+        pre: treasure is an int, coverage is a bytearray with a 1 for every cell
+        visited (indexed by row*cols+col) and tasks is the number of times a band
+        was handed to a worker."""
+        self.treasure = treasure
+        self.coverage = coverage
+        self.tasks = tasks
+
+
+    def get_treasure_count(self):
+        """Returns the amount of treasure collected by all the workers."""
+        return self.treasure
+
+
+    def get_visited_count(self):
+        """Returns the number of cells visited by all the workers."""
+        return self.coverage.count(1)
+
+
+    def was_visited(self, row, col, cols):
+        """Returns True if some worker visited (row, col) on a map cols wide."""
+        return self.coverage[row * cols + col] == 1
+
+
+def explore_in_parallel(grid, workers=None, bands=None, neighbours=None):
+    """Explores everything reachable from the explorer ('M') on grid, using a pool
+    of workers processes (one per CPU if workers is None), each exploring one
+    band of rows at a time.
+    pre: grid is a GridMap containing an 'M'. bands is the number of bands of
+    rows to split the map into (by default BANDS_PER_WORKER for each worker).
+    neighbours is the grid's neighbour table, or None to build it.
+    post: returns a ParallelResult."""
+    if neighbours is None:
+        neighbours = build_neighbour_table(grid)
+    if workers is None:
+        workers = multiprocessing.cpu_count()
+    if bands is None:
+        bands = workers * BANDS_PER_WORKER
+    start = grid.cells.find(b'M')
+    if start == -1:
+        raise ValueError("The map has no explorer (M) on it!")
+    rows, cols = grid.rows, grid.cols
+    bands = max(1, min(bands, rows))
+    band_rows = -(-rows // bands)                                               #Rows in each band, rounded up
+
+    blocks = []
+    try:
+        for contents in (grid.cells, neighbours, bytearray(rows * cols)):       #The map, its neighbour table and the visited map, shared by all the workers
+            block = shared_memory.SharedMemory(create=True, size=max(1, len(contents)))
+            block.buf[:len(contents)] = contents
+            blocks.append(block)
+        names = tuple(block.name for block in blocks)
+
+        pending = {start // cols // band_rows: [start]}                          #Cells to explore from, by band
+        busy = set()                                                            #Bands a worker is exploring right now
+        results = queue.Queue()
+        treasure = 0
+        tasks = 0
+        pool = multiprocessing.Pool(workers, initializer=_attach, initargs=(names, cols, band_rows))
+        try:
+            while pending or busy:
+                for band in sorted(pending):                                    #Hand every waiting band that isn't busy to a worker
+                    if band not in busy:
+                        busy.add(band)
+                        tasks += 1
+                        pool.apply_async(_explore_band, ((band, pending.pop(band)),), callback=results.put, error_callback=results.put)
+                result = results.get()                                          #Wait for any worker to finish
+                if isinstance(result, BaseException):
+                    raise result
+                band, found, seeds_by_band = result
+                busy.discard(band)
+                treasure += found
+                for other, seeds in seeds_by_band.items():
+                    pending.setdefault(other, []).extend(seeds)
+        finally:
+            pool.terminate()
+            pool.join()
+        coverage = bytearray(blocks[2].buf[:rows * cols])
+    finally:
+        for block in blocks:
+            block.close()
+            block.unlink()
+    return ParallelResult(treasure, coverage, tasks)
+
+
+def _attach(names, cols, band_rows):
+    """Attaches a worker process to the shared map, neighbour table and visited
+    map (runs once in each worker)."""
+    blocks = [shared_memory.SharedMemory(name=name) for name in names]
+    _shared['blocks'] = blocks                                                  #Kept so the memory stays attached while the worker lives
+    _shared['cells'], _shared['neighbours'], _shared['visited'] = [block.buf for block in blocks]
+    _shared['cols'] = cols
+    _shared['band_rows'] = band_rows
+
+
+def _explore_band(task):
+    """Explores one band of rows from the provided cells, marking every cell it
+    reaches in the band as visited.
+    pre: task is a tuple of the band number and a list of the cells (as
+    row*cols+col) to explore from. No other worker is exploring this band.
+    post: returns a tuple of the band, the treasure found and the cells next to
+    this band to explore from, by band."""
+    band, seeds = task
+    cells = _shared['cells']
+    neighbours = _shared['neighbours']
+    visited = _shared['visited']
+    cols = _shared['cols']
+    band_rows = _shared['band_rows']
+    first = band * band_rows * cols                                             #The band's cells are first <= index < last
+    last = first + band_rows * cols
+    treasure_code = ord('T')
+    offsets = ((N, -cols), (E, 1), (W, -1), (S, cols))
+
+    found = 0
+    handed_over = {}
+    to_explore = list(seeds)
+    while to_explore:
+        index = to_explore.pop()
+        if visited[index]:
+            continue
+        visited[index] = 1
+        if cells[index] == treasure_code:
+            found += 1
+        mask = neighbours[index]
+        for bit, offset in offsets:
+            if mask & bit:
+                other = index + offset
+                if first <= other < last:
+                    if not visited[other]:
+                        to_explore.append(other)
+                elif not visited[other]:                                        #The path leads into another band; hand it over
+                    handed_over.setdefault(other // cols // band_rows, []).append(other)
+    return band, found, handed_over
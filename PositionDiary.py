@@ -0,0 +1,278 @@
+#-------------------------------------------------------------------------------
+# Name:        PositionDiary.py
+# Purpose: To keep the Explorer's diary of which directions are possible and
+#          which have been visited from each position, as bitmasks stored in two
+#          flat bytearrays (one byte of each per cell of the map). For maps too
+#          big to keep whole, SparsePositionDiary only keeps the parts the
+#          Explorer has been to, and SpillingPositionDiary keeps only the parts
+#          it has been to lately, writing the rest to a work file.
+#
+# Author:      odanielb (Bridget O'Daniel)
+#-------------------------------------------------------------------------------
+import tempfile
+from collections import OrderedDict
+
+N, E, W, S = 1, 2, 4, 8                                                         #One bit for each direction
+DIRECTION_BITS = {'N': N, 'E': E, 'W': W, 'S': S}
+ALL_DIRECTIONS = N | E | W | S
+NOTED = 16                                                                      #Set in the possible mask of every position in the diary
+
+
+def _first_direction(mask):
+    """Returns the first direction in mask, in the order N > E > W > S, or None
+    if mask has no directions in it."""
+    for direction in 'NEWS':
+        if mask & DIRECTION_BITS[direction]:
+            return direction
+    return None
+
+NEXT_DIRECTION = tuple(_first_direction(mask) for mask in range(ALL_DIRECTIONS + 1))   #The direction to go for every mask of unexplored directions
+MASK_DIRECTIONS = tuple([d for d in 'NEWS' if mask & DIRECTION_BITS[d]] for mask in range(ALL_DIRECTIONS + 1))
+
+
+class PositionDiary(object):
+
+    def __init__(self, rows, cols):
+        """Creates a new, empty PositionDiary for a map with the provided number
+        of rows and columns.
+        pre: rows and cols are ints."""
+        self.rows = rows
+        self.cols = cols
+        self.possible = bytearray(rows * cols)
+        self.visited = bytearray(rows * cols)
+
+
+    def is_noted(self, row, col):
+        """Returns True if the position (row, col) is in the diary, else False."""
+        return bool(self.possible[row * self.cols + col] & NOTED)
+
+
+    def add(self, row, col, possible_mask):
+        """Adds the position (row, col) to the diary, noting the directions
+        possible from it, with none of them visited yet.
+        pre: possible_mask is an int made of the direction bits N, E, W, S."""
+        index = row * self.cols + col
+        self.possible[index] = possible_mask | NOTED
+        self.visited[index] = 0
+
+
+    def note_visited(self, row, col, direction_bit):
+        """Notes that the direction direction_bit has been visited from (row, col).
+        pre: (row, col) is in the diary."""
+        self.visited[row * self.cols + col] |= direction_bit
+
+
+    def get_unexplored_mask(self, row, col):
+        """Returns the bitmask of directions that are possible from (row, col) but
+        not yet visited.
+        pre: (row, col) is in the diary.
+        post: returns an int."""
+        index = row * self.cols + col
+        return self.possible[index] & ~self.visited[index] & ALL_DIRECTIONS
+
+
+    def get_next_direction(self, row, col):
+        """Returns the first unexplored direction from (row, col), in the order
+        N > E > W > S, or None if every possible direction has been visited.
+        pre: (row, col) is in the diary.
+        post: returns a string of one character or None."""
+        return NEXT_DIRECTION[self.get_unexplored_mask(row, col)]
+
+
+    def open_direction(self, row, col, direction_bit):
+        """Notes that direction_bit has become possible from (row, col), and has
+        not been visited yet. Does nothing if (row, col) is not in the diary."""
+        index = row * self.cols + col
+        if self.possible[index] & NOTED:
+            self.possible[index] |= direction_bit
+            self.visited[index] &= ~direction_bit
+
+
+    def close_direction(self, row, col, direction_bit):
+        """Notes that direction_bit is no longer possible from (row, col). Does
+        nothing if (row, col) is not in the diary."""
+        index = row * self.cols + col
+        if self.possible[index] & NOTED:
+            self.possible[index] &= ~direction_bit
+            self.visited[index] &= ~direction_bit
+
+
+    def forget(self, row, col):
+        """Removes the position (row, col) from the diary."""
+        index = row * self.cols + col
+        self.possible[index] = 0
+        self.visited[index] = 0
+
+
+    def get_possible_directions(self, row, col):
+        """Returns the directions possible from (row, col) as a list, like ['N', 'W']."""
+        return list(MASK_DIRECTIONS[self.possible[row * self.cols + col] & ALL_DIRECTIONS])
+
+
+    def get_visited_directions(self, row, col):
+        """Returns the directions visited from (row, col) as a list, like ['N', 'W']."""
+        return list(MASK_DIRECTIONS[self.visited[row * self.cols + col]])
+
+
+    def __contains__(self, position):
+        """Returns True if position, a (row, col) tuple, is in the diary."""
+        return self.is_noted(position[0], position[1])
+
+
+
+BLOCK_BITS = 6                                                                  #A SparsePositionDiary keeps its diary in blocks of 64x64 cells
+BLOCK_MASK = (1 << BLOCK_BITS) - 1
+BLOCK_CELLS = 1 << (2 * BLOCK_BITS)
+BLOCK_SIZE = 2 * BLOCK_CELLS                                                    #Bytes in a block: the possible masks, then the visited masks
+_EMPTY_BLOCK = bytes(BLOCK_SIZE)
+
+
+class SparsePositionDiary(PositionDiary):
+
+    def __init__(self, rows, cols):
+        """Creates a new, empty PositionDiary for a map with the provided number
+        of rows and columns, which only takes up memory for the blocks of 64x64
+        cells the Explorer has been to (for maps too big to keep whole, like a
+        TiledMap).
+        pre: rows and cols are ints."""
+        self.rows = rows
+        self.cols = cols
+        self.blocks = {}                                                        #(row >> BLOCK_BITS, col >> BLOCK_BITS) -> bytearray of the possible masks, then the visited masks
+
+
+    def _find(self, row, col, create=False):
+        """Returns the block holding (row, col) (or None if it hasn't been made
+        and create is False) and the index of (row, col) in it."""
+        key = (row >> BLOCK_BITS, col >> BLOCK_BITS)
+        block = self.blocks.get(key)
+        if block is None and create:
+            block = self.blocks[key] = bytearray(BLOCK_SIZE)
+        return block, ((row & BLOCK_MASK) << BLOCK_BITS) | (col & BLOCK_MASK)
+
+
+    def is_noted(self, row, col):
+        block, index = self._find(row, col)
+        return block is not None and bool(block[index] & NOTED)
+
+
+    def add(self, row, col, possible_mask):
+        block, index = self._find(row, col, True)
+        block[index] = possible_mask | NOTED
+        block[BLOCK_CELLS + index] = 0
+
+
+    def note_visited(self, row, col, direction_bit):
+        block, index = self._find(row, col, True)
+        block[BLOCK_CELLS + index] |= direction_bit
+
+
+    def get_unexplored_mask(self, row, col):
+        block, index = self._find(row, col)
+        if block is None:
+            return 0
+        return block[index] & ~block[BLOCK_CELLS + index] & ALL_DIRECTIONS
+
+
+    def open_direction(self, row, col, direction_bit):
+        block, index = self._find(row, col)
+        if block is not None and block[index] & NOTED:
+            block[index] |= direction_bit
+            block[BLOCK_CELLS + index] &= ~direction_bit
+
+
+    def close_direction(self, row, col, direction_bit):
+        block, index = self._find(row, col)
+        if block is not None and block[index] & NOTED:
+            block[index] &= ~direction_bit
+            block[BLOCK_CELLS + index] &= ~direction_bit
+
+
+    def forget(self, row, col):
+        block, index = self._find(row, col)
+        if block is not None:
+            block[index] = 0
+            block[BLOCK_CELLS + index] = 0
+
+
+    def get_possible_directions(self, row, col):
+        block, index = self._find(row, col)
+        return list(MASK_DIRECTIONS[block[index] & ALL_DIRECTIONS]) if block is not None else []
+
+
+    def get_visited_directions(self, row, col):
+        block, index = self._find(row, col)
+        return list(MASK_DIRECTIONS[block[BLOCK_CELLS + index]]) if block is not None else []
+
+
+
+class SpillingPositionDiary(SparsePositionDiary):
+
+    def __init__(self, rows, cols, max_blocks, spill_dir=None):
+        """Creates a new, empty PositionDiary for a map with the provided number
+        of rows and columns, which keeps at most max_blocks blocks of 64x64
+        cells in memory. The least recently used blocks are written to a work
+        file in spill_dir (or the system's temporary directory), each in its
+        own place, and read back when the Explorer returns to them; the work
+        file is deleted when the diary is closed or forgotten.
+        pre: rows and cols are ints. max_blocks is a positive int."""
+        SparsePositionDiary.__init__(self, rows, cols)
+        self.blocks = OrderedDict()                                             #Least recently used first
+        self.max_blocks = max_blocks
+        self.blocks_across = (cols + BLOCK_MASK) >> BLOCK_BITS
+        self.spill = tempfile.TemporaryFile(dir=spill_dir)
+        self.spill_size = 0                                                     #Where the last block written to the work file ends
+        self.last_key = None                                                    #The block used last
+        self.last_block = None
+        self.spills = 0
+        self.reloads = 0
+
+
+    def _find(self, row, col, create=False):
+        """Returns the block holding (row, col), reading it from the work file
+        (and writing out the least recently used block if there are too many)
+        if it isn't in memory, and the index of (row, col) in it. Blocks the
+        Explorer hasn't been to come back empty."""
+        key = (row >> BLOCK_BITS, col >> BLOCK_BITS)
+        index = ((row & BLOCK_MASK) << BLOCK_BITS) | (col & BLOCK_MASK)
+        if key == self.last_key:
+            return self.last_block, index
+        block = self.blocks.get(key)
+        if block is None:
+            block = self.blocks[key] = self._read_block(key)
+            while len(self.blocks) > self.max_blocks:
+                self._write_block(*self.blocks.popitem(last=False))
+        else:
+            self.blocks.move_to_end(key)
+        self.last_key, self.last_block = key, block
+        return block, index
+
+
+    def _read_block(self, key):
+        """Returns the block at key from the work file, or an empty block if it
+        has never been written there."""
+        block = bytearray(BLOCK_SIZE)
+        at = (key[0] * self.blocks_across + key[1]) * BLOCK_SIZE
+        if at < self.spill_size:
+            self.spill.seek(at)
+            self.spill.readinto(block)
+            self.reloads += 1
+        return block
+
+
+    def _write_block(self, key, block):
+        """Writes a block to its place in the work file, unless it is empty and
+        has never been written there (so the places of blocks the Explorer only
+        looked into stay holes in the file)."""
+        at = (key[0] * self.blocks_across + key[1]) * BLOCK_SIZE
+        if at < self.spill_size or block != _EMPTY_BLOCK:
+            self.spill.seek(at)
+            self.spill.write(block)
+            self.spill_size = max(self.spill_size, at + BLOCK_SIZE)
+            self.spills += 1
+
+
+    def close(self):
+        """Deletes the work file, and everything in the diary."""
+        self.spill.close()
+        self.blocks = OrderedDict()
+        self.last_key = self.last_block = None
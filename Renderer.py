@@ -0,0 +1,121 @@
+#-------------------------------------------------------------------------------
+# Name:        Renderer.py
+# Purpose: To draw a map to the terminal, redrawing only the cells that changed
+#          since the last frame instead of printing the whole map every step. The
+#          changed cells are marked as they change, so a frame costs as much as
+#          the changes, not the size of the map.
+#
+# Author:      odanielb (Bridget O'Daniel)
+#
+# Acknowledgements: ANSI escape codes from: https://en.wikipedia.org/wiki/ANSI_escape_code
+#-------------------------------------------------------------------------------
+import sys
+import time
+
+CLEAR_SCREEN = '\x1b[2J\x1b[H'
+
+
+def _move_cursor(row, col):
+    """Returns the ANSI escape code that moves the cursor to (row, col) of the
+    map, where the map is drawn from the top left corner of the screen."""
+    return '\x1b['+str(row+1)+';'+str(col+1)+'H'
+
+
+class Renderer(object):
+
+    def __init__(self, out=None, max_fps=None):
+        """Creates a new Renderer that writes frames to out (the screen, if no
+        out is provided). If max_fps is provided, frames asked for sooner than
+        1/max_fps seconds after the last one drawn are skipped.
+        pre: out is a file-like object, max_fps is a positive number or None."""
+        self.out = out if out is not None else sys.stdout
+        self.min_interval = 1.0 / max_fps if max_fps else 0
+        self.size = None                                                        #Rows and columns of the last frame, or None to draw the next one in full
+        self.dirty = set()                                                      #Cells changed since the last frame, as (row, col)
+        self.last_overlay = set()
+        self.last_time = None
+        self.frames_drawn = 0
+        self.frames_skipped = 0
+
+
+    def reset(self):
+        """Forgets the last frame, so the next one is drawn in full."""
+        self.size = None
+
+
+    def mark_dirty(self, row, col):
+        """Notes that the cell at (row, col) has changed, so the next frame
+        redraws it. Whatever changes the map must mark the cells it changes (the
+        Explorer does, for a Renderer set with set_renderer)."""
+        self.dirty.add((row, col))
+
+
+    def draw(self, the_map, overlay=(), force=False):
+        """Draws the map, with an 'X' on every position in overlay (without
+        changing the map itself). The first frame, a frame of a map of another
+        size and a forced frame are drawn in full; otherwise only the cells
+        marked dirty and the cells joining or leaving the overlay are written,
+        in a single write to out.
+        pre: the_map is a GridMap or a tuple of tuples of Locations. overlay is an
+        iterable of (row, col) tuples, or a function returning one (which is only
+        called if the frame is drawn).
+        post: Returns True if the frame was drawn, or False if it was skipped to
+        keep under the frame rate cap (unless force is True)."""
+        now = time.time()
+        if not force and self.last_time is not None and now - self.last_time < self.min_interval:
+            self.frames_skipped += 1
+            return False
+
+        if callable(overlay):
+            overlay = overlay()
+        overlay = set(overlay)
+        rows = len(the_map)
+        cols = len(the_map[0]) if rows > 0 else 0
+        if force or self.size != (rows, cols):
+            output = self._full_frame(the_map, rows, cols, overlay)
+        else:
+            output = self._changed_cells(the_map, rows, overlay, self.dirty | (overlay ^ self.last_overlay))
+
+        if output:
+            self.out.write(output)
+            self.out.flush()
+        self.size = (rows, cols)
+        self.dirty = set()
+        self.last_overlay = overlay
+        self.last_time = now
+        self.frames_drawn += 1
+        return True
+
+
+    def _full_frame(self, the_map, rows, cols, overlay):
+        """Returns the output that clears the screen and draws the whole map,
+        with the overlay drawn on top."""
+        cells = getattr(the_map, 'cells', None)
+        if cells is not None:
+            frame = bytearray(cells)                                            #GridMaps can be copied all at once
+        else:
+            frame = bytearray(''.join(loc.get_contents() for row in the_map for loc in row).encode('ascii'))
+        for row, col in overlay:
+            frame[row * cols + col] = ord('X')
+        lines = [CLEAR_SCREEN]
+        for row in range(rows):
+            lines.append(bytes(frame[row * cols:(row + 1) * cols]).decode('ascii'))
+            lines.append('\n')
+        lines.append('\n')
+        return ''.join(lines)
+
+
+    def _changed_cells(self, the_map, rows, overlay, changed):
+        """Returns the output that redraws only the cells in changed, moving the
+        cursor to each run of them along a row and then back below the map."""
+        output = []
+        last_row = last_col = None
+        for row, col in sorted(changed):
+            contents = 'X' if (row, col) in overlay else the_map[row][col].get_contents()
+            if row != last_row or col != last_col + 1:                          #Cells next to each other are written together
+                output.append(_move_cursor(row, col))
+            output.append(contents)
+            last_row, last_col = row, col
+        if output:
+            output.append(_move_cursor(rows + 1, 0))
+        return ''.join(output)
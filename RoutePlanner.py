@@ -0,0 +1,162 @@
+#-------------------------------------------------------------------------------
+# Name:        RoutePlanner.py
+# Purpose: To plan a short route that collects every reachable treasure on a map
+#          and returns to the explorer's starting point, to compare with the
+#          route the Explorer takes by exploring the whole cave.
+#
+# Author:      odanielb (Bridget O'Daniel)
+#
+# Acknowledgements: Held-Karp algorithm from: https://en.wikipedia.org/wiki/Held%E2%80%93Karp_algorithm
+#-------------------------------------------------------------------------------
+from array import array
+from collections import deque
+from PositionDiary import N, E, W, S
+from NeighbourTable import build_neighbour_table
+
+EXACT_LIMIT = 12                                                                #Most treasures to plan for exactly; more than this uses nearest-treasure-first
+STEPS = ((N, 'N'), (E, 'E'), (W, 'W'), (S, 'S'))
+
+
+def plan_route(grid, neighbours=None, exact_limit=EXACT_LIMIT):
+    """Plans a route from the explorer ('M') that collects every treasure it can
+    reach and comes back to where it started. With up to exact_limit treasures
+    the shortest such route is found (Held-Karp); with more, the route goes to
+    the nearest treasure not yet collected each time.
+    pre: grid is a GridMap containing one 'M'. neighbours is the grid's neighbour
+    table, or None to build it.
+    post: returns a tuple of the route (a list of directions like ['N', 'E']) and
+    the list of treasure positions in the order they are collected."""
+    if neighbours is None:
+        neighbours = build_neighbour_table(grid)
+    cols = grid.cols
+    start = grid.cells.find(b'M')
+    if start == -1:
+        raise ValueError("The map has no explorer (M) on it!")
+    distances, _ = _breadth_first(neighbours, cols, start)
+    treasures = [index for index in _find_all(grid.cells, b'T') if distances[index] >= 0]
+
+    if len(treasures) <= exact_limit:
+        order = _held_karp(neighbours, cols, start, treasures)
+    else:
+        order = _nearest_first(grid.cells, neighbours, cols, start, len(treasures))
+
+    route = []
+    stops = [start] + order + [start]
+    for here, there in zip(stops, stops[1:]):
+        route.extend(_path_between(neighbours, cols, here, there))
+    return route, [divmod(index, cols) for index in order]
+
+
+def _find_all(cells, contents):
+    """Returns the indices of every cell holding contents, in order."""
+    found = []
+    index = cells.find(contents)
+    while index != -1:
+        found.append(index)
+        index = cells.find(contents, index + 1)
+    return found
+
+
+def _breadth_first(neighbours, cols, start, goal=None):
+    """Searches outwards from the cell at index start, stopping early once goal
+    is reached (if a goal is provided).
+    post: returns two arrays with one entry per cell: the distance from start
+    (-1 if not reached) and the direction last moved to reach it."""
+    distances = array('i', [-1]) * len(neighbours)
+    came_by = bytearray(len(neighbours))
+    distances[start] = 0
+    offsets = ((N, -cols), (E, 1), (W, -1), (S, cols))
+    queue = deque([start])
+    while queue:
+        index = queue.popleft()
+        if index == goal:
+            break
+        mask = neighbours[index]
+        distance = distances[index] + 1
+        for bit, offset in offsets:
+            if mask & bit and distances[index + offset] < 0:
+                distances[index + offset] = distance
+                came_by[index + offset] = bit
+                queue.append(index + offset)
+    return distances, came_by
+
+
+def _path_between(neighbours, cols, start, goal):
+    """Returns the directions of a shortest path from the cell at index start to
+    the cell at index goal."""
+    distances, came_by = _breadth_first(neighbours, cols, start, goal)
+    back = {N: cols, E: -1, W: 1, S: -cols}                                     #Where a cell was reached from, given the direction moved
+    names = dict(STEPS)
+    path = []
+    index = goal
+    while index != start:
+        bit = came_by[index]
+        path.append(names[bit])
+        index += back[bit]
+    path.reverse()
+    return path
+
+
+def _held_karp(neighbours, cols, start, treasures):
+    """Returns the treasures in the order that makes the shortest route from
+    start, through every treasure, and back to start."""
+    count = len(treasures)
+    if count == 0:
+        return []
+    stops = [start] + treasures
+    matrix = []                                                                 #Distances between every pair of stops, one search from each
+    for stop in stops:
+        distances, _ = _breadth_first(neighbours, cols, stop)
+        matrix.append([distances[other] for other in stops])
+
+    full = (1 << count) - 1
+    best = {}                                                                   #(visited treasures, last treasure) -> (length, previous treasure)
+    for last in range(count):
+        best[(1 << last, last)] = (matrix[0][last + 1], None)
+    for visited in range(1, full + 1):
+        for last in range(count):
+            if not visited & (1 << last) or (visited, last) not in best:
+                continue
+            length = best[(visited, last)][0]
+            for following in range(count):
+                if visited & (1 << following):
+                    continue
+                key = (visited | (1 << following), following)
+                candidate = length + matrix[last + 1][following + 1]
+                if key not in best or candidate < best[key][0]:
+                    best[key] = (candidate, last)
+
+    last = min(range(count), key=lambda t: best[(full, t)][0] + matrix[t + 1][0])
+    order = []
+    visited = full
+    while last is not None:                                                     #Follow the previous treasures back to the start
+        order.append(treasures[last])
+        visited, last = visited & ~(1 << last), best[(visited, last)][1]
+    order.reverse()
+    return order
+
+
+def _nearest_first(cells, neighbours, cols, start, count):
+    """Returns count treasures in the order found by always going to the
+    nearest treasure not yet collected."""
+    collected = set()
+    order = []
+    here = start
+    offsets = ((N, -cols), (E, 1), (W, -1), (S, cols))
+    treasure = ord('T')
+    while len(order) < count:
+        seen = {here}
+        queue = deque([here])
+        while queue:                                                            #Search outwards until an uncollected treasure turns up
+            index = queue.popleft()
+            if cells[index] == treasure and index not in collected:
+                break
+            mask = neighbours[index]
+            for bit, offset in offsets:
+                if mask & bit and index + offset not in seen:
+                    seen.add(index + offset)
+                    queue.append(index + offset)
+        collected.add(index)
+        order.append(index)
+        here = index
+    return order
@@ -0,0 +1,332 @@
+#-------------------------------------------------------------------------------
+# Name:        SessionServer.py
+# Purpose: To run many explorations at once from one process, as an asyncio TCP
+#          server. Each client connection can open sessions, each one an Explorer
+#          on its own cave file, which are advanced a batch of steps at a time and
+#          streamed back to the client as JSON step events or rendered frames.
+#
+# Author:      odanielb (Bridget O'Daniel)
+#
+# Protocol: one JSON object per line each way.
+#   Client: {"cmd": "open", "file": "cave.txt", "stream": "steps", "batch": 1000}
+#               stream is "steps" (an event per step), "frames" (a rendered frame
+#               per batch: the whole map first, then only the cells changed since
+#               the frame before) or "summary" (only the end result).
+#           {"cmd": "edit", "session": 1, "cells": [[row, col, "W"], ...]}
+#               changes cells of a running session's cave (to "W", "." or "T");
+#               see Explorer.apply_edits.
+#           {"cmd": "close", "session": 1}
+#   Server: {"event": "opened", "session": 1, "file": ..., "rows": ..., "cols": ..., "start": [row, col]}
+#           {"event": "step", "session": 1, "direction": "N", "backtrack": false, "pos": [row, col]}
+#           {"event": "frame", "session": 1, "frame": "<ANSI text, as Renderer draws it>"}
+#           {"event": "progress", "session": 1, "treasure": ..., "steps": ..., "backtracks": ...}
+#           {"event": "finished", "session": 1, "treasure": ..., "steps": ..., "backtracks": ...}
+#           {"event": "edited", "session": 1, "cells": ..., "pos": [row, col]}
+#           {"event": "closed", "session": 1}
+#           {"event": "error", "message": "..."} (with "session" if it is about one)
+#-------------------------------------------------------------------------------
+import asyncio
+import io
+import json
+import os
+from Explorer import Explorer, TRACE_DIRECTIONS, TRACE_BACKTRACK
+from MapCache import get_cache
+from NeighbourTable import build_neighbour_table
+from Renderer import Renderer
+
+DEFAULT_BATCH = 1000                                                            #Steps a session takes before letting the others have a turn
+HIGH_WATER = 256 * 1024                                                         #Bytes waiting to be sent to a client before its sessions wait for it
+STREAMS = ('steps', 'frames', 'summary')
+STEP_EVENT = '{"backtrack": %s, "direction": "%s", "event": "step", "pos": [%d, %d], "session": %d}\n'   #As _event would write it, but much faster
+
+
+class MapStore(object):
+
+    def __init__(self):
+        """Creates an empty store of parsed maps, shared by every session that
+        loads the same file."""
+        self.maps = {}                                                          #Real path -> (GridMap, neighbour table)
+        self.users = {}                                                         #Real path -> number of sessions using it
+        self.loading = {}                                                       #Real path -> Future of a load in progress
+
+
+    async def acquire(self, file_name):
+        """Returns the parsed map in file_name and its neighbour table, loading
+        them (in a worker thread) if no session has them loaded already. Neither
+        may be changed: sessions explore a copy of the map.
+        post: returns a tuple of a GridMap and bytes. Raises IOError or
+        ValueError if the map can't be loaded."""
+        key = os.path.realpath(file_name)
+        if key not in self.maps:
+            if key not in self.loading:
+                self.loading[key] = asyncio.get_running_loop().run_in_executor(None, _load_shared, file_name)
+            try:
+                loaded = await asyncio.shield(self.loading[key])                #Sessions opening the same file wait for the same load
+            finally:
+                self.loading.pop(key, None)
+            if key not in self.maps:
+                self.maps[key] = loaded
+        self.users[key] = self.users.get(key, 0) + 1
+        return self.maps[key]
+
+
+    def release(self, file_name):
+        """Notes that a session is done with the map in file_name, forgetting it
+        once no session is using it."""
+        key = os.path.realpath(file_name)
+        self.users[key] -= 1
+        if self.users[key] == 0:
+            del self.users[key]
+            del self.maps[key]
+
+
+def _load_shared(file_name):
+    """Loads the map in file_name and builds its neighbour table, read-only."""
+    grid = get_cache().load_map(file_name)
+    return grid, bytes(build_neighbour_table(grid))
+
+
+
+class Session(object):
+
+    def __init__(self, number, file_name, explorer, stream, batch):
+        """Holds one client's exploration of the cave in file_name.
+        pre: stream is one of STREAMS and batch is a positive int."""
+        self.number = number
+        self.file_name = file_name
+        self.explorer = explorer
+        self.stream = stream
+        self.batch = batch
+        self.renderer = Renderer(io.StringIO()) if stream == 'frames' else None
+        if self.renderer is not None:
+            explorer.set_renderer(self.renderer)                                #So each frame only redraws the cells the Explorer changed
+        self.task = None
+
+
+    def step_events(self, start, trace):
+        """Returns the JSON lines for the steps in trace (from Explorer.run),
+        taken from start."""
+        row, col = start
+        moves = ((-1, 0), (0, 1), (0, -1), (1, 0))                              #By trace code, as in TRACE_DIRECTIONS
+        lines = []
+        for code in trace:
+            row_change, col_change = moves[code & 3]
+            row += row_change
+            col += col_change
+            lines.append(STEP_EVENT % ('true' if code & TRACE_BACKTRACK else 'false', TRACE_DIRECTIONS[code & 3], row, col, self.number))
+        return ''.join(lines)
+
+
+    def frame_event(self):
+        """Returns the JSON line for a frame of the map, drawn since the last
+        frame sent."""
+        out = self.renderer.out
+        out.seek(0)
+        out.truncate()
+        self.renderer.draw(self.explorer.map)
+        return _event('frame', session=self.number, frame=out.getvalue())
+
+
+    def counts(self):
+        """Returns the Explorer's treasure, steps and backtracks as a dictionary."""
+        return {'treasure': self.explorer.get_treasure_count(),
+                'steps': self.explorer.get_step_count(),
+                'backtracks': self.explorer.get_backtrack_count()}
+
+
+def _is_cell_edit(cell):
+    """Returns True if cell, from an edit command, looks like [row, col, contents]."""
+    return (isinstance(cell, list) and len(cell) == 3 and isinstance(cell[2], str)
+            and all(isinstance(part, int) and not isinstance(part, bool) for part in cell[:2]))
+
+
+def _event(name, **fields):
+    """Returns one line of JSON for the event called name."""
+    fields['event'] = name
+    return json.dumps(fields, sort_keys=True)+"\n"
+
+
+
+class SessionServer(object):
+
+    def __init__(self, host='127.0.0.1', port=0, batch=DEFAULT_BATCH):
+        """Creates a server for exploration sessions on host and port (port 0
+        picks a free one; see get_port once started). Sessions take batch steps
+        at a time unless they ask for another batch size."""
+        self.host = host
+        self.port = port
+        self.batch = batch
+        self.store = MapStore()
+        self.server = None
+        self.next_session = 1
+
+
+    async def start(self):
+        """Starts listening for clients."""
+        self.server = await asyncio.start_server(self._handle_client, self.host, self.port)
+
+
+    def get_port(self):
+        """Returns the port the server is listening on."""
+        return self.server.sockets[0].getsockname()[1]
+
+
+    async def serve_forever(self):
+        """Starts the server if needed and serves clients until cancelled."""
+        if self.server is None:
+            await self.start()
+        async with self.server:
+            await self.server.serve_forever()
+
+
+    async def close(self):
+        """Stops listening for clients."""
+        self.server.close()
+        await self.server.wait_closed()
+
+
+    async def _handle_client(self, reader, writer):
+        """Reads commands from one client until it disconnects, then stops any
+        sessions it still has running."""
+        writer.transport.set_write_buffer_limits(high=HIGH_WATER)
+        sessions = {}
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                try:
+                    command = json.loads(line)
+                    if not isinstance(command, dict):
+                        raise ValueError("commands must be JSON objects")
+                except ValueError as error:
+                    writer.write(_event('error', message="Bad command: "+str(error)).encode())
+                    continue
+                if command.get('cmd') == 'open':
+                    await self._open(command, sessions, writer)
+                elif command.get('cmd') == 'edit':
+                    self._edit(command, sessions, writer)
+                elif command.get('cmd') == 'close':
+                    session = self._find_session(command, sessions, writer)
+                    if session is not None:
+                        session.task.cancel()
+                else:
+                    writer.write(_event('error', message="Unknown command!").encode())
+        except ConnectionError:
+            pass
+        finally:
+            tasks = [session.task for session in sessions.values()]
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            writer.close()
+
+
+    async def _open(self, command, sessions, writer):
+        """Opens a session exploring the cave named in command and starts it
+        running."""
+        file_name = command.get('file')
+        stream = command.get('stream', 'steps')
+        batch = command.get('batch', self.batch)
+        if not isinstance(file_name, str) or stream not in STREAMS or not isinstance(batch, int) or batch < 1:
+            writer.write(_event('error', message="open needs a file, a stream in "+", ".join(STREAMS)+" and a positive batch").encode())
+            return
+        try:
+            shared, neighbours = await self.store.acquire(file_name)
+        except (IOError, ValueError) as error:
+            writer.write(_event('error', message=str(error), file=file_name).encode())
+            return
+        grid = shared.copy()                                                    #The Explorer marks its path on the map, so each session explores its own copy
+        if grid.start is None:
+            self.store.release(file_name)
+            writer.write(_event('error', message="The map has no explorer (M) on it!", file=file_name).encode())
+            return
+        row, col = grid.start
+        explorer = Explorer(grid.get_location(row, col), grid, neighbours)
+        explorer.add_position_to_diary((row, col))
+
+        session = Session(self.next_session, file_name, explorer, stream, batch)
+        self.next_session += 1
+        sessions[session.number] = session
+        writer.write(_event('opened', session=session.number, file=file_name,
+                            rows=grid.rows, cols=grid.cols, start=[row, col]).encode())
+        session.task = asyncio.create_task(self._run_session(session, sessions, writer))
+
+
+    def _find_session(self, command, sessions, writer):
+        """Returns the client's session numbered in command, or None (telling the
+        client why) if it has no such session."""
+        number = command.get('session')
+        session = sessions.get(number) if isinstance(number, int) and not isinstance(number, bool) else None
+        if session is None:
+            writer.write(_event('error', message="No such session!", session=number).encode())
+        return session
+
+
+    def _edit(self, command, sessions, writer):
+        """Changes the cells listed in command in a running session's cave. The
+        session is between batches, so its Explorer carries on from the edited
+        cave with its next one."""
+        session = self._find_session(command, sessions, writer)
+        if session is None:
+            return
+        cells = command.get('cells')
+        if not isinstance(cells, list) or not all(_is_cell_edit(cell) for cell in cells):
+            writer.write(_event('error', message="edit needs cells as a list of [row, col, contents]", session=session.number).encode())
+            return
+        try:
+            edits = [((row, col), contents) for row, col, contents in cells]
+            session.explorer.apply_edits(edits)
+        except ValueError as error:
+            writer.write(_event('error', message="Bad edit: "+str(error), session=session.number).encode())
+            return
+        writer.write(_event('edited', session=session.number, cells=len(edits),
+                            pos=list(session.explorer.get_pos())).encode())
+
+
+    async def _run_session(self, session, sessions, writer):
+        """Advances a session a batch of steps at a time until it is finished (or
+        cancelled), streaming it to the client. Step events wait for the client
+        to keep up, so a slow client only holds up its own sessions; frames are
+        skipped instead while it is behind."""
+        explorer = session.explorer
+        try:
+            if session.renderer is not None:
+                writer.write(session.frame_event().encode())
+            finished = False
+            while not finished:
+                start = explorer.get_pos()
+                finished, trace = explorer.run(session.batch, record_trace=session.stream == 'steps')
+                if session.stream == 'steps':
+                    writer.write(session.step_events(start, trace).encode())
+                    writer.write(_event('progress', session=session.number, **session.counts()).encode())
+                    await writer.drain()                                        #Wait here, not in the other sessions, if this client is behind
+                elif session.stream == 'frames' and (finished or writer.transport.get_write_buffer_size() < HIGH_WATER):
+                    writer.write(session.frame_event().encode())
+                await asyncio.sleep(0)                                          #Let the other sessions have a turn
+            writer.write(_event('finished', session=session.number, **session.counts()).encode())
+            await writer.drain()
+        except asyncio.CancelledError:
+            if not writer.is_closing():
+                writer.write(_event('closed', session=session.number).encode())
+            raise
+        except ConnectionError:
+            pass
+        finally:
+            del sessions[session.number]
+            self.store.release(session.file_name)
+
+
+def serve(host='127.0.0.1', port=8023, batch=DEFAULT_BATCH):
+    """Runs a SessionServer on host and port until interrupted."""
+    server = SessionServer(host, port, batch)
+
+    async def run():
+        await server.start()
+        print("Serving exploration sessions on "+host+":"+str(server.get_port()))
+        await server.serve_forever()
+
+    try:
+        asyncio.run(run())
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,259 @@
+#-------------------------------------------------------------------------------
+# Name:        TiledMap.py
+# Purpose: A map for the Explorer that stays in a .cave file on disk, for caves
+#          too big to load whole. Tiles of the cave are decoded when the Explorer
+#          first needs them and kept in a bounded least-recently-used cache;
+#          tiles it has changed are written back to the file when they are
+#          evicted. As the Explorer nears the edge of a tile, the operating system
+#          is asked to start reading the next tile in the direction it is going.
+#          map[row][col] works like it does on a GridMap, so the Explorer needs no
+#          changes to explore it. The Explorer's diary is kept the same way: only
+#          as many of its blocks as cover max_tiles tiles stay in memory, and the
+#          rest go to a work file beside the cave.
+#
+# Author:      odanielb (Bridget O'Daniel)
+#-------------------------------------------------------------------------------
+import functools
+import os
+from collections import OrderedDict
+from CaveFormat import CaveFile
+from Location import Location
+from PositionDiary import BLOCK_BITS, BLOCK_MASK, SpillingPositionDiary
+
+DEFAULT_MAX_TILES = 256                                                         #4MB of decoded 128x128 tiles
+PREFETCH_MARGIN = 8                                                             #Cells from the edge of a tile at which the next tile is prefetched
+_STEPS = {(-1, 0): 'N', (0, 1): 'E', (0, -1): 'W', (1, 0): 'S'}
+
+
+class TiledMap(object):
+
+    def __init__(self, file_name, max_tiles=DEFAULT_MAX_TILES):
+        """Opens the .cave file called file_name as a map, keeping at most
+        max_tiles decoded tiles in memory, and its Explorer's diary to as many
+        blocks as cover max_tiles tiles. The Explorer's changes (its path and
+        the treasure it collects) are written back to the file, so explore a copy
+        of a cave that should be kept as it is.
+        pre: max_tiles is a positive int.
+        post: Creates a TiledMap; close it when done. Raises IOError if the file
+        can't be opened and ValueError if it is not a .cave file."""
+        self.cave = CaveFile.open(file_name, writable=True)
+        self.rows = self.cave.rows
+        self.cols = self.cave.cols
+        self.start = self.cave.start
+        self.treasures = None                                                   #The cave's treasure index is only read if asked for (see get_treasures)
+        self.max_tiles = max_tiles
+        self.tiles = OrderedDict()                                              #(tile row, tile col) -> bytearray of its cells, least recently used first
+        self.dirty = set()                                                      #Tiles changed since they were read
+        self.last_key = None                                                    #The tile used last, and its cells
+        self.last_tile = None
+        self.last_explorer_pos = None
+        self.loads = 0
+        self.evictions = 0
+        self.prefetches = 0
+        blocks = _blocks_over(self.cave.tile_rows) * _blocks_over(self.cave.tile_cols)
+        self.diary_class = functools.partial(SpillingPositionDiary, max_blocks=max_tiles * blocks,
+                                             spill_dir=os.path.dirname(os.path.abspath(file_name)))   #Beside the cave, as the system's temporary directory may be in memory
+
+
+    def _get_tile(self, tile_row, tile_col):
+        """Returns the cells of a tile, reading it from the file (and evicting the
+        least recently used tile if there are too many) if it isn't in memory."""
+        key = (tile_row, tile_col)
+        if key == self.last_key:                                                #Already the most recently used
+            return self.last_tile
+        tile = self.tiles.get(key)
+        if tile is not None:
+            self.tiles.move_to_end(key)
+            self.last_key, self.last_tile = key, tile
+            return tile
+        tile = self.tiles[key] = self.cave.read_tile(tile_row, tile_col)
+        self.last_key, self.last_tile = key, tile
+        self.loads += 1
+        while len(self.tiles) > self.max_tiles:
+            evicted, cells = self.tiles.popitem(last=False)
+            self.evictions += 1
+            if evicted in self.dirty:
+                self.dirty.discard(evicted)
+                self.cave.write_tile(evicted[0], evicted[1], cells)
+        return tile
+
+
+    def get(self, row, col):
+        """Returns the contents of the cell at (row, col).
+        post: returns a string of one character ('W', '.', 'T', 'M', 'X')."""
+        tile_rows, tile_cols = self.cave.tile_rows, self.cave.tile_cols
+        tile = self._get_tile(row // tile_rows, col // tile_cols)
+        width = min(tile_cols, self.cols - col // tile_cols * tile_cols)
+        return chr(tile[row % tile_rows * width + col % tile_cols])
+
+
+    def set(self, row, col, contents):
+        """Sets the contents of the cell at (row, col). Moving the explorer ('M')
+        near the edge of a tile prefetches the next tile the way it is going.
+        pre: contents is a string of one character."""
+        tile_rows, tile_cols = self.cave.tile_rows, self.cave.tile_cols
+        key = (row // tile_rows, col // tile_cols)
+        tile = self._get_tile(key[0], key[1])
+        width = min(tile_cols, self.cols - key[1] * tile_cols)
+        tile[row % tile_rows * width + col % tile_cols] = ord(contents)
+        self.dirty.add(key)
+        if contents == 'M':
+            last = self.last_explorer_pos
+            self.last_explorer_pos = (row, col)
+            if last is not None:
+                direction = _STEPS.get((row - last[0], col - last[1]))
+                if direction is not None:
+                    self.prefetch(row, col, direction)
+
+
+    def prefetch(self, row, col, direction):
+        """If (row, col) is within PREFETCH_MARGIN cells of the edge of its tile
+        in direction, asks for the next tile that way to be read from disk in
+        the background (so it is ready when the Explorer gets there)."""
+        tile_rows, tile_cols = self.cave.tile_rows, self.cave.tile_cols
+        tile_row, tile_col = row // tile_rows, col // tile_cols
+        if direction == 'N' and row % tile_rows < PREFETCH_MARGIN:
+            tile_row -= 1
+        elif direction == 'S' and row % tile_rows >= tile_rows - PREFETCH_MARGIN:
+            tile_row += 1
+        elif direction == 'W' and col % tile_cols < PREFETCH_MARGIN:
+            tile_col -= 1
+        elif direction == 'E' and col % tile_cols >= tile_cols - PREFETCH_MARGIN:
+            tile_col += 1
+        else:
+            return
+        if 0 <= tile_row < self.cave.tiles_down and 0 <= tile_col < self.cave.tiles_across \
+                and (tile_row, tile_col) not in self.tiles:
+            self.prefetches += 1
+            self.cave.prefetch_tile(tile_row, tile_col)
+
+
+    def get_location(self, row, col):
+        """Returns a Location that reads and writes the cell at (row, col).
+        post: returns a Location."""
+        return TiledLocation(self, row, col)
+
+
+    def get_row_string(self, row):
+        """Returns the contents of a whole row as a string."""
+        return ''.join(self.get(row, col) for col in range(self.cols))
+
+
+    def get_treasures(self):
+        """Returns the positions of the treasure when the cave was saved, as a
+        tuple of (row, col) tuples."""
+        if self.treasures is None:
+            self.treasures = self.cave.get_treasures()
+        return self.treasures
+
+
+    def find_open_border_cells(self):
+        """Returns the positions of the cells on the border of the map that are not
+        walls, as a sorted list of (row, col) tuples."""
+        border = set()
+        for col in range(self.cols):
+            border.add((0, col))
+            border.add((self.rows - 1, col))
+        for row in range(self.rows):
+            border.add((row, 0))
+            border.add((row, self.cols - 1))
+        return sorted(pos for pos in border if self.get(pos[0], pos[1]) != 'W')
+
+
+    def flush(self):
+        """Writes every changed tile back to the file."""
+        for key in self.dirty:
+            self.cave.write_tile(key[0], key[1], self.tiles[key])
+        self.dirty = set()
+        self.cave.buf.flush()
+
+
+    def close(self):
+        """Writes every changed tile back to the file, and closes it."""
+        self.flush()
+        self.tiles = OrderedDict()
+        self.last_key = self.last_tile = None
+        self.cave.close()
+
+
+    def __len__(self):
+        """Returns the number of rows in the map."""
+        return self.rows
+
+
+    def __getitem__(self, row):
+        """Returns a view of the row, so that map[row][col] returns a Location."""
+        if row < 0:
+            row += self.rows
+        if not 0 <= row < self.rows:
+            raise IndexError("row index out of range")
+        return TiledRow(self, row)
+
+
+    def __iter__(self):
+        """Iterates through the rows of the map."""
+        for row in range(self.rows):
+            yield TiledRow(self, row)
+
+
+
+def _blocks_over(size):
+    """Returns the most 64 cell blocks of the diary (along one side) that a
+    tile of size cells (along that side) can lie across."""
+    if size & BLOCK_MASK == 0:                                                  #Tiles line up with the blocks
+        return size >> BLOCK_BITS
+    return (size >> BLOCK_BITS) + 2
+
+
+
+class TiledRow(object):
+
+    __slots__ = ('tiled_map', 'row')
+
+    def __init__(self, tiled_map, row):
+        """Creates a view of one row of a TiledMap.
+        pre: tiled_map is a TiledMap and row is a valid row in it."""
+        self.tiled_map = tiled_map
+        self.row = row
+
+
+    def __len__(self):
+        return self.tiled_map.cols
+
+
+    def __getitem__(self, col):
+        """Returns a Location view of the cell in this row at col."""
+        if col < 0:
+            col += self.tiled_map.cols
+        if not 0 <= col < self.tiled_map.cols:
+            raise IndexError("column index out of range")
+        return TiledLocation(self.tiled_map, self.row, col)
+
+
+    def __iter__(self):
+        for col in range(self.tiled_map.cols):
+            yield TiledLocation(self.tiled_map, self.row, col)
+
+
+
+class TiledLocation(Location):
+
+    __slots__ = ('tiled_map',)
+
+    def __init__(self, tiled_map, row, col):
+        """Creates a Location that has no contents of its own, but reads and
+        writes the contents of the (row, col) cell of tiled_map.
+        pre: tiled_map is a TiledMap and (row, col) is a position on it."""
+        self.tiled_map = tiled_map
+        self.row = row
+        self.col = col
+
+
+    @property
+    def contents(self):
+        return self.tiled_map.get(self.row, self.col)
+
+
+    @contents.setter
+    def contents(self, contents):
+        self.tiled_map.set(self.row, self.col, contents)
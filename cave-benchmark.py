@@ -0,0 +1,169 @@
+#-------------------------------------------------------------------------------
+# Name:        cave-benchmark.py
+# Purpose: To measure how loading, exploring and displaying caves scale with
+#          their size and style, using caves made by CaveGenerator, and to
+#          compare the results against a saved baseline.
+#
+# Author:      odanielb (Bridget O'Daniel)
+#
+# Usage:   python cave-benchmark.py [--sizes 10x10,100x100] [--styles maze,cavern]
+#                                   [--save baseline.json] [--compare baseline.json]
+#
+# Each cave is measured in a fresh process, so its peak memory is its own.
+#-------------------------------------------------------------------------------
+from __future__ import print_function
+import argparse
+import importlib
+import io
+import json
+import multiprocessing
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+from CaveGenerator import STYLES, generate_cave
+from MapLoader import load_map
+from Renderer import Renderer
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+driver = importlib.import_module('map-explorer-driver')
+
+DEFAULT_SIZES = '10x10,100x100,300x300'
+RENDER_FRAMES = 200                                                             #Most frames to time while rendering
+LOWER_IS_BETTER = ('load_seconds', 'explore_seconds', 'peak_memory_mb', 'full_frame_ms', 'changed_frame_ms')
+HIGHER_IS_BETTER = ('steps_per_second',)
+
+
+def run_case(file_name):
+    """Measures loading, exploring and rendering the cave in file_name.
+    post: returns a dictionary of measurements."""
+    start = time.time()
+    the_map = load_map(file_name)
+    load_seconds = time.time() - start
+
+    start = time.time()
+    explorer = driver.explore(the_map)
+    explore_seconds = time.time() - start
+    steps = explorer.get_step_count()
+
+    result = {'rows': the_map.rows,
+              'cols': the_map.cols,
+              'treasure': explorer.get_treasure_count(),
+              'steps': steps,
+              'load_seconds': round(load_seconds, 6),
+              'explore_seconds': round(explore_seconds, 6),
+              'steps_per_second': round(steps / explore_seconds, 1) if explore_seconds > 0 else None}
+    result.update(_time_rendering(file_name))
+    if resource is not None:
+        result['peak_memory_mb'] = round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0, 1)   #ru_maxrss is in kilobytes on Linux
+    return result
+
+
+def _time_rendering(file_name):
+    """Times drawing the first (full) frame of the cave and the frames after it,
+    which only redraw the cells that changed.
+    post: returns a dictionary of the average milliseconds per frame."""
+    explorer = driver.create_explorer(load_map(file_name))
+    explorer.set_renderer(Renderer(out=io.StringIO()))
+    start = time.time()
+    explorer.display_map()
+    full_frame = time.time() - start
+
+    frames = 0
+    changed_frames = 0.0
+    while frames < RENDER_FRAMES and explorer.move():
+        start = time.time()
+        explorer.display_map()
+        changed_frames += time.time() - start
+        frames += 1
+    return {'full_frame_ms': round(full_frame * 1000, 3),
+            'changed_frame_ms': round(changed_frames * 1000 / frames, 3) if frames else None}
+
+
+def run_suite(sizes, styles, seed=0, directory=None):
+    """Generates a cave for every size and style and measures each one in a
+    fresh process.
+    post: returns a dictionary of measurements, keyed like 'maze-100x100'."""
+    made_directory = directory is None
+    if made_directory:
+        directory = tempfile.mkdtemp(prefix='caves-')
+    results = {}
+    try:
+        for rows, cols in sizes:
+            for style in styles:
+                name = style+'-'+str(rows)+'x'+str(cols)
+                file_name = os.path.join(directory, name+'.txt')
+                if not os.path.exists(file_name):
+                    generate_cave(file_name, rows, cols, style, seed)
+                pool = multiprocessing.Pool(1, maxtasksperchild=1)             #A fresh process for every cave
+                try:
+                    results[name] = pool.apply(run_case, (file_name,))
+                finally:
+                    pool.close()
+                    pool.join()
+                print(name+': '+json.dumps(results[name], sort_keys=True), file=sys.stderr)
+    finally:
+        if made_directory:
+            shutil.rmtree(directory)
+    return results
+
+
+def compare(results, baseline, tolerance):
+    """Compares results against a baseline, listing every measurement that got
+    worse by more than tolerance (0.2 for 20%).
+    post: returns a list of strings describing the regressions."""
+    regressions = []
+    for name in sorted(results):
+        if name not in baseline:
+            continue
+        for key in LOWER_IS_BETTER + HIGHER_IS_BETTER:
+            now = results[name].get(key)
+            before = baseline[name].get(key)
+            if not now or not before:
+                continue
+            change = (now - before) / float(before)
+            if key in HIGHER_IS_BETTER:
+                change = -change
+            if change > tolerance:
+                regressions.append(name+' '+key+': '+str(before)+' -> '+str(now)+' ('+str(int(round(change * 100)))+'% worse)')
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark loading, exploring and rendering generated caves.")
+    parser.add_argument('--sizes', default=DEFAULT_SIZES, help="comma separated ROWSxCOLS sizes (default: "+DEFAULT_SIZES+")")
+    parser.add_argument('--styles', default=','.join(STYLES), help="comma separated cave styles (default: all of them)")
+    parser.add_argument('--seed', type=int, default=0, help="seed for generating the caves (default: 0)")
+    parser.add_argument('--caves', default=None, help="directory to keep generated caves in, so they are only generated once")
+    parser.add_argument('--save', default=None, help="save the results as a JSON baseline to this file")
+    parser.add_argument('--compare', default=None, help="compare the results against the JSON baseline in this file")
+    parser.add_argument('--tolerance', type=float, default=0.2, help="how much worse a measurement can get before it counts as a regression (default: 0.2)")
+    args = parser.parse_args(argv)
+
+    sizes = [tuple(int(n) for n in size.lower().split('x')) for size in args.sizes.split(',')]
+    styles = args.styles.split(',')
+    results = run_suite(sizes, styles, args.seed, args.caves)
+    report = {'python': platform.python_version(), 'seed': args.seed, 'results': results}
+    print(json.dumps(report, indent=2, sort_keys=True))
+
+    if args.save:
+        with open(args.save, 'w') as out:
+            json.dump(report, out, indent=2, sort_keys=True)
+    if args.compare:
+        with open(args.compare) as baseline_file:
+            baseline = json.load(baseline_file)
+        regressions = compare(results, baseline['results'], args.tolerance)
+        for regression in regressions:
+            print("REGRESSION "+regression, file=sys.stderr)
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
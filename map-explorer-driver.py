@@ -6,44 +6,52 @@
 # Author:      odanielb
 #
 # Acknowledgements: Cleaning file help from :http://stackoverflow.com/questions/10794245/removing-spaces-and-empty-lines-from-a-file-using-python
+#
+# Usage:   python map-explorer-driver.py
+#               Asks for a map file and shows the Explorer adventuring through it.
+#          python map-explorer-driver.py [-j JOBS] CAVE [CAVE ...]
+#               Explores every cave (file names or globs like 'caves/*.txt')
+#               without displaying anything, spread across JOBS processes, and
+#               prints one JSON line of results per cave.
+#          python map-explorer-driver.py --parallel WORKERS CAVE [CAVE ...]
+#               Explores each cave with WORKERS processes at once, splitting the
+#               map into bands of rows, and prints one JSON line per cave with
+#               the treasure collected and the cells visited.
+#          python map-explorer-driver.py --serve PORT
+#               Serves exploration sessions to clients on localhost:PORT, many
+#               at once from one process (see SessionServer for the protocol).
+#          Adding --checkpoint-every STEPS saves each Explorer to CAVE.checkpoint
+#          every STEPS steps, and resumes from that file if it already exists
+#          (and is of the cave as it is now). It is deleted once the cave is done.
+#          Adding --max-tiles TILES explores each cave from disk without loading it
+#          whole, as a copy in .cave format (CAVE.explored.cave), keeping at most
+#          TILES tiles of it in memory.
+#          Adding --cache-dir DIR keeps precompiled copies of the caves in DIR,
+#          so caves seen before (by their contents) load without being parsed.
+#          Adding --stats also counts what the Explorer does and times loading,
+#          exploring and rendering, printing the results as JSON.
+#          Adding --plan also plans the shortest route that collects all the
+#          treasure, showing that route instead of the Explorer's and reporting
+#          its steps next to the Explorer's.
 #-------------------------------------------------------------------------------
+import argparse
+import functools
+import glob
+import json
+import multiprocessing
+import os
+import shutil
+import sys
 import time
-import copy
 from Explorer import Explorer
-from Location import Location
-
-
-def read_map(file_name):
-    """This function opens a file with the name in 'file_name', reads the map it
-    contains. Stores each line of the file as strings in a list.
-    pre: none, as this function handles IOError for when the file is not there gracefully
-    post: Returns a list of strings."""
-    map_file_list_of_rows = []
-    try:
-        open_file = open(file_name, 'r')            #Open the specified file
-        for line in open_file:
-            cleaned_line = line.strip()
-            if 'W' in line:
-                cleaned_line = cleaned_line.replace(" ", "")
-            map_file_list_of_rows.append(cleaned_line)
-        open_file.close()                           #Close the file
-    except IOError:
-        print("File does not exist! Try again.")    #If it can't find this file.
-    return map_file_list_of_rows
-
-
-def finalize_map(map_list):
-    """Makes the tuple of tuples that contain Locations according to a given
-    string.
-    pre: map_string is a list of strings returned by the function read_map
-    post: returns the map as represented as a tuple of tuples containing Locations."""
-    dimensions = map_list[0].split()
-    map_ = []
-    for i in range(int(dimensions[0])):  #For each row
-        row = list(map_list[i+1])
-        map_.append(row)
-    map_tup = _create_locations(map_)
-    return map_tup
+from MapCache import get_cache, hash_file
+from MapLoader import load_map
+from NeighbourTable import build_neighbour_table, check_map
+from RoutePlanner import plan_route
+from ExplorerObserver import RunStats
+from Checkpoint import Checkpointer, resume
+from CaveFormat import MAGIC, is_cave_file, txt_to_cave
+from TiledMap import TiledMap
 
 
 def initialize_map(file_name):
@@ -51,53 +59,357 @@ def initialize_map(file_name):
     used by an Explorer.
     pre: file_name is a string with the valid name of a .txt file (including
     extension).
-    post: returns the map as a tuple of tuples (rows, containing locations)"""
-    read_file_list = read_map(file_name)
-    the_map = finalize_map(read_file_list)
+    post: returns the map as a GridMap (rows, containing locations), or None if
+    the file does not exist or does not hold a map an Explorer can explore."""
+    try:
+        the_map = load_map(file_name)                                           #Memory-maps the file and parses it straight into a GridMap
+        check_map(the_map)                                                      #No open cells on the border,
+        if find_explorer_location(the_map) is None:                             #and somewhere for the explorer to start
+            raise ValueError("The map has no explorer (M) on it!")
+    except IOError:
+        print("File does not exist! Try again.")                                #If it can't find this file.
+        return None
+    except ValueError as error:
+        print(str(error)+" Try again.")                                         #If the file doesn't hold a map that can be explored.
+        return None
     return the_map
 
 
-def _create_locations(list_of_lists):
-    """From the list of lists (each representing a row), creates a tuple containing
-    the tuples of rows, each row containing a Location object rather than the strings
-    provided in the list_of_lists.
-    pre: list_of_lists is a list of lists, each nested list containing the same
-    number of strings (each one character long).
-    post: returns a tuple of tuples of Locations."""
-    lol = copy.deepcopy(list_of_lists)
-    for row, lst in enumerate(lol):
-        for col, string in enumerate(lst):
-            loc = Location(row,col,string)
-            lol[row][col] = loc
-        lol[row] = tuple(lst)
-    lol = tuple(lol)
-    return lol
+def load_cave(file_name, cache_dir=None):
+    """Loads the map in file_name, from a precompiled copy in cache_dir if one
+    was saved there before (see MapCache).
+    pre: file_name is a string. cache_dir is the name of a directory or None.
+    post: returns a GridMap. Raises IOError if the file can't be opened and
+    ValueError if it does not hold a map."""
+    if cache_dir is None:
+        return load_map(file_name)
+    return get_cache(cache_dir, max_bytes=0).load_map(file_name)               #Each cave is loaded once per run, so only the copies on disk are worth keeping
 
 
 def find_explorer_location(map):
     """Returns the Location on map that contains the explorer, M.
-    pre: map is the map represented as a tuple of tuples of Locations.
-    post: Returns the Location containing M."""
+    pre: map is the map represented as a GridMap or a tuple of tuples of Locations.
+    post: Returns the Location containing M, or None if there isn't one."""
+    start = getattr(map, 'start', None)
+    if start is not None:                                                       #Already found when the map was loaded
+        return map.get_location(start[0], start[1])
+    cells = getattr(map, 'cells', None)
+    if cells is not None:                                                       #A GridMap can be searched without making Locations
+        start = cells.find(b'M')
+        return map.get_location(start // map.cols, start % map.cols) if start != -1 else None
     for i, row in enumerate(map):
         for j, loc in enumerate(row):
             if loc.get_contents() == 'M':
                 return loc
 
-def main():
-    file_name = raw_input("What is the name of the file containing the map? (.txt included)")
-    the_map = initialize_map(file_name)                                         #Create the map
-
+def create_explorer(the_map, observer=None):
+    """Creates an Explorer at the explorer's location on the map, with the walls
+    around every cell of the map worked out in advance.
+    pre: the_map is a map as returned by initialize_map. observer is an
+    ExplorerObserver or None.
+    post: returns an Explorer that has noted its starting position in its diary.
+    Raises ValueError if the map has open cells on its border or no explorer on it."""
+    neighbours = build_neighbour_table(the_map)                                 #Check the whole map and note the walls around every cell
     explorer_loc = find_explorer_location(the_map)                              #Find the location of the explorer
-    explorer = Explorer(explorer_loc, the_map)                                  #Initialize the explorer
+    if explorer_loc is None:
+        raise ValueError("The map has no explorer (M) on it!")
+    explorer = Explorer(explorer_loc, the_map, neighbours, observer)            #Initialize the explorer
     explorer.add_position_to_diary(explorer_loc.get_pos())                      #Explorer notes where it is in its diary
+    return explorer
+
+
+def explore(the_map, observer=None):
+    """Lets an Explorer adventure through the whole map without displaying it
+    or waiting between steps.
+    pre: the_map is a map as returned by initialize_map. observer is an
+    ExplorerObserver or None.
+    post: returns the Explorer after it has explored everything it can."""
+    explorer = create_explorer(the_map, observer)
+    explorer.run()                                                              #Move until the whole cave is explored, in one tight loop
+    return explorer
+
+
+def explore_with_checkpoints(file_name, interval, observer=None, cache_dir=None):
+    """Explores the map in file_name like explore, saving the Explorer to
+    file_name+'.checkpoint' as it goes, every interval steps. If that file
+    already exists and holds checkpoints of the cave as it is now, carries on
+    from the last one instead of starting again (a checkpoint file that can't
+    be used is started over). The file is deleted once the cave has been
+    explored.
+    pre: file_name is a string. interval is a positive int. observer is an
+    ExplorerObserver or None. cache_dir is as for explore_file.
+    post: returns the Explorer after it has explored everything it can."""
+    checkpoint_file = file_name+'.checkpoint'
+    cave_hash = hash_file(file_name)
+    explorer = None
+    if os.path.exists(checkpoint_file):
+        try:
+            explorer = resume(checkpoint_file, observer, cave_hash)
+        except (IOError, ValueError):                                           #Of another version of the cave, or cut short before its first checkpoint
+            explorer = None
+    if explorer is not None:
+        checkpointer = Checkpointer(checkpoint_file, interval, resuming=True)
+    else:
+        explorer = create_explorer(load_cave(file_name, cache_dir), observer)
+        checkpointer = Checkpointer(checkpoint_file, interval, cave_hash=cave_hash)
+    checkpointer.run(explorer)
+    os.remove(checkpoint_file)                                                  #Finished, so there is nothing left to resume
+    return explorer
+
+
+def explore_out_of_core(file_name, max_tiles, observer=None):
+    """Explores the cave in file_name without loading it whole: a copy of it in
+    .cave format, file_name+'.explored.cave', is explored as a TiledMap keeping
+    at most max_tiles tiles (and as many blocks of the Explorer's diary) in
+    memory, and is left holding the explored cave.
+    pre: file_name is a string. max_tiles is a positive int. observer is an
+    ExplorerObserver or None.
+    post: returns the Explorer after it has explored everything it can (with
+    its diary closed). Raises ValueError if the map has no explorer or has open
+    cells on its border."""
+    work_file = file_name+'.explored.cave'
+    with open(file_name, 'rb') as cave_file:
+        binary = is_cave_file(cave_file.read(len(MAGIC)))
+    if binary:
+        shutil.copyfile(file_name, work_file)
+    else:
+        txt_to_cave(file_name, work_file)                                       #A band of tiles at a time, so the cave never has to fit in memory
+    the_map = TiledMap(work_file, max_tiles)
+    try:
+        open_cells = the_map.find_open_border_cells()
+        if open_cells:
+            raise ValueError("The map has "+str(len(open_cells))+" open cells on its border: "+str(open_cells[0]))
+        if the_map.start is None:
+            raise ValueError("The map has no explorer (M) on it!")
+        explorer = Explorer(find_explorer_location(the_map), the_map, None, observer)
+        try:
+            explorer.add_position_to_diary(the_map.start)
+            explorer.run()
+        finally:
+            explorer.position_diary.close()                                     #Deletes the diary's work file
+    finally:
+        the_map.close()
+    return explorer
+
+
+def explore_file(file_name, plan=False, stats=False, checkpoint_every=None, cache_dir=None, max_tiles=None):
+    """Loads the map in file_name and explores it, timing how long it takes. If
+    plan is True, also plans the shortest route collecting all the treasure. If
+    stats is True, also counts what the Explorer does and times each phase. If
+    checkpoint_every is an int, explores with explore_with_checkpoints instead
+    (and plan is ignored). If cache_dir is provided, parsed maps are cached
+    there (see load_cave). If max_tiles is an int, explores with
+    explore_out_of_core instead (and plan is ignored).
+    pre: file_name is a string.
+    post: returns a dictionary with the results of the exploration, or with the
+    error that stopped the map from being explored."""
+    start = time.time()
+    run_stats = RunStats() if stats else None
+    try:
+        if max_tiles is not None:
+            plan = False
+            if run_stats is None:
+                explorer = explore_out_of_core(file_name, max_tiles)
+            else:
+                with run_stats.phase('explore'):
+                    explorer = explore_out_of_core(file_name, max_tiles, run_stats)
+        elif checkpoint_every is not None:
+            plan = False
+            if run_stats is None:
+                explorer = explore_with_checkpoints(file_name, checkpoint_every, cache_dir=cache_dir)
+            else:
+                with run_stats.phase('explore'):
+                    explorer = explore_with_checkpoints(file_name, checkpoint_every, run_stats, cache_dir)
+        else:
+            if run_stats is None:
+                the_map = load_cave(file_name, cache_dir)
+            else:
+                with run_stats.phase('load'):
+                    the_map = load_cave(file_name, cache_dir)
+            if plan:
+                route, treasures = plan_route(the_map)                          #Plan before exploring, while the treasure is still there
+            if run_stats is None:
+                explorer = explore(the_map)
+            else:
+                with run_stats.phase('explore'):
+                    explorer = explore(the_map, run_stats)
+    except (IOError, ValueError) as error:
+        return {'file': file_name, 'error': str(error)}
+    result = {'file': file_name,
+              'treasure': explorer.get_treasure_count(),
+              'steps': explorer.get_step_count(),
+              'backtracks': explorer.get_backtrack_count(),
+              'elapsed': round(time.time() - start, 6)}
+    if plan:
+        result['planned_steps'] = len(route)
+        result['planned_treasure'] = len(treasures)
+    if run_stats is not None:
+        result['stats'] = run_stats.to_dict()
+    return result
+
+
+def explore_file_in_parallel(file_name, workers):
+    """Loads the map in file_name and explores it with workers processes at once
+    (see ParallelExplorer), timing how long it takes.
+    post: returns a dictionary with the results of the exploration, or with the
+    error that stopped the map from being explored."""
+    from ParallelExplorer import explore_in_parallel                            #Needs Python 3.8 or newer, so only imported when used
+    start = time.time()
+    try:
+        result = explore_in_parallel(load_map(file_name), workers)
+    except (IOError, ValueError) as error:
+        return {'file': file_name, 'error': str(error)}
+    return {'file': file_name,
+            'treasure': result.get_treasure_count(),
+            'visited': result.get_visited_count(),
+            'tasks': result.tasks,
+            'workers': workers,
+            'elapsed': round(time.time() - start, 6)}
+
+
+def _expand_file_names(patterns):
+    """Expands any globs in patterns into the file names they match. Patterns
+    that match nothing are kept, so they are reported as missing files.
+    post: returns a list of strings."""
+    file_names = []
+    for pattern in patterns:
+        matches = sorted(glob.glob(pattern))
+        if matches:
+            file_names.extend(matches)
+        else:
+            file_names.append(pattern)
+    return file_names
+
+
+def run_batch(patterns, jobs=None, out=sys.stdout, plan=False, stats=False, checkpoint_every=None, cache_dir=None, max_tiles=None):
+    """Explores every cave file matched by patterns across a pool of jobs
+    processes, writing one JSON line of results per cave to out, in order. If
+    checkpoint_every is an int, each cave is checkpointed (see
+    explore_with_checkpoints). If cache_dir is provided, parsed maps are cached
+    there for every process to use. If max_tiles is an int, each cave is
+    explored out of core (see explore_out_of_core).
+    pre: patterns is a list of file names or globs. jobs is an int or None (to
+    use one process per CPU).
+    post: returns the number of caves that could not be explored."""
+    file_names = _expand_file_names(patterns)
+    failures = 0
+    pool = multiprocessing.Pool(jobs)
+    try:
+        for result in pool.imap(functools.partial(explore_file, plan=plan, stats=stats, checkpoint_every=checkpoint_every, cache_dir=cache_dir, max_tiles=max_tiles), file_names):
+            if 'error' in result:
+                failures += 1
+            out.write(json.dumps(result, sort_keys=True)+"\n")
+            out.flush()
+    finally:
+        pool.close()
+        pool.join()
+    return failures
+
+
+def run_parallel(patterns, workers, out=sys.stdout):
+    """Explores every cave file matched by patterns one after another, each with
+    workers processes at once, writing one JSON line of results per cave to out.
+    post: returns the number of caves that could not be explored."""
+    failures = 0
+    for file_name in _expand_file_names(patterns):
+        result = explore_file_in_parallel(file_name, workers)
+        if 'error' in result:
+            failures += 1
+        out.write(json.dumps(result, sort_keys=True)+"\n")
+        out.flush()
+    return failures
+
+
+def play(plan=False, stats=False):
+    """Asks for a map file and shows the Explorer adventuring through it, one
+    step every second. If plan is True, shows the Explorer following the
+    shortest route that collects all the treasure instead. If stats is True,
+    prints what the Explorer did and how long each phase took, as JSON."""
+    run_stats = RunStats() if stats else None
+    the_map = None
+    start = time.time()
+    while the_map is None:                                                      #Until a map is loaded,
+        file_name = input("What is the name of the file containing the map? (.txt included)")
+        start = time.time()
+        the_map = initialize_map(file_name)                                         #Create the map
+    if run_stats is not None:
+        run_stats.add_time('load', time.time() - start)
+
+    if plan:
+        play_route(the_map)
+        return
+    explorer = create_explorer(the_map, run_stats)                              #Initialize the explorer
 
     is_more = True
     while is_more:                                                              #While the explorer is not at the start OR there are unexplored directions:
         time.sleep(1)                                                                  #Wait two seconds
         explorer.display_map()                                                  #Display the current map
+        start = time.time()
         is_more = explorer.move()                                                       #Try to move a space, is_more = None if it cannot
+        if run_stats is not None:
+            run_stats.add_time('explore', time.time() - start)                      #Only the moves, not the waiting or drawing
+    print("You've collected "+str(explorer.get_treasure_count())+" treasure!")
+    if run_stats is not None:
+        print(run_stats.to_json())
+
+
+def play_route(the_map):
+    """Shows the Explorer following the planned route that collects all the
+    treasure on the map, then compares it with exploring the whole cave.
+    pre: the_map is a map as returned by initialize_map."""
+    dfs_steps = explore(the_map.copy()).get_step_count()                       #How many steps exploring takes, on a copy of the map
+    explorer = create_explorer(the_map)
+    route, treasures = plan_route(the_map, explorer.neighbours)
+
+    for direction in route:
+        time.sleep(1)
+        explorer.display_map()                                                  #Display the current map
+        explorer.walk(direction)                                                #Take the next step of the route
+    explorer.display_map()
     print("You've collected "+str(explorer.get_treasure_count())+" treasure!")
+    print("The planned route took "+str(len(route))+" steps; exploring the whole cave takes "+str(dfs_steps)+".")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Explore cave maps and collect all the treasure possible.")
+    parser.add_argument('caves', nargs='*', help="cave files or globs to explore without displaying them (asks for one file if none are given)")
+    parser.add_argument('-j', '--jobs', type=int, default=None, help="number of processes to explore with (default: one per CPU)")
+    parser.add_argument('--plan', action='store_true', help="also plan the shortest route that collects all the treasure")
+    parser.add_argument('--stats', action='store_true', help="also count what the Explorer does and time each phase, as JSON")
+    parser.add_argument('--parallel', type=int, metavar='WORKERS', default=None, help="explore each cave with this many processes at once")
+    parser.add_argument('--serve', type=int, metavar='PORT', default=None, help="serve exploration sessions on localhost:PORT instead of exploring")
+    parser.add_argument('--cache-dir', metavar='DIR', default=None, help="keep precompiled copies of parsed caves in DIR, to load them faster next time")
+    parser.add_argument('--max-tiles', type=int, metavar='TILES', default=None, help="explore each cave from disk, as CAVE.explored.cave, with at most TILES tiles in memory")
+    parser.add_argument('--checkpoint-every', type=int, metavar='STEPS', default=None, help="save each Explorer to CAVE.checkpoint every STEPS steps, resuming from it if it exists (it is deleted when done)")
+    args = parser.parse_args(argv)
+
+    if args.serve is not None:
+        from SessionServer import serve                                         #Needs Python 3.7 or newer, for asyncio.run, so only imported when used
+        serve(port=args.serve)
+        return 0
+    if args.parallel is not None:
+        if not args.caves:
+            parser.error("--parallel needs at least one cave")
+        return 1 if run_parallel(args.caves, args.parallel) else 0
+    if args.checkpoint_every is not None:
+        if not args.caves:
+            parser.error("--checkpoint-every needs at least one cave")
+        if args.checkpoint_every < 1:
+            parser.error("--checkpoint-every must be at least 1")
+        if args.plan:
+            parser.error("--checkpoint-every can't be used with --plan")
+    if args.max_tiles is not None:
+        if not args.caves:
+            parser.error("--max-tiles needs at least one cave")
+        if args.max_tiles < 1:
+            parser.error("--max-tiles must be at least 1")
+        if args.plan or args.checkpoint_every is not None:
+            parser.error("--max-tiles can't be used with --plan or --checkpoint-every")
+    if not args.caves:
+        play(args.plan, args.stats)
+        return 0
+    return 1 if run_batch(args.caves, args.jobs, plan=args.plan, stats=args.stats, checkpoint_every=args.checkpoint_every, cache_dir=args.cache_dir, max_tiles=args.max_tiles) else 0
 
 
 if __name__ == '__main__':
-    main()
+    sys.exit(main())
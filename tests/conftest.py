@@ -0,0 +1,62 @@
+#-------------------------------------------------------------------------------
+# Name:        conftest.py
+# Purpose: Fixtures shared by the tests: small caves made with CaveGenerator, and
+#          Explorers made on them the way the driver makes them.
+#
+# Author:      odanielb (Bridget O'Daniel)
+#-------------------------------------------------------------------------------
+import importlib.util
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from CaveGenerator import STYLES, generate_cave
+from MapLoader import load_map
+
+SIZES = ((3, 3), (7, 9), (12, 13), (31, 17))                                     #Small caves, odd and even, square and not
+SEEDS = (0, 1, 2)
+
+
+def _load_driver():
+    """Returns map-explorer-driver.py as a module (its name can't be imported)."""
+    spec = importlib.util.spec_from_file_location('map_explorer_driver', os.path.join(ROOT, 'map-explorer-driver.py'))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+driver = _load_driver()
+
+
+@pytest.fixture
+def make_cave(tmp_path):
+    """Returns a function that generates a cave with CaveGenerator and returns
+    the name of its .txt file."""
+    def make_cave(rows, cols, style='maze', seed=0):
+        file_name = str(tmp_path / (style+'_'+str(rows)+'x'+str(cols)+'_'+str(seed)+'.txt'))
+        generate_cave(file_name, rows, cols, style, seed)
+        return file_name
+    return make_cave
+
+
+def every_cave():
+    """Returns (rows, cols, style, seed) for every small cave the tests try."""
+    return [(rows, cols, style, seed) for rows, cols in SIZES for style in STYLES for seed in SEEDS]
+
+
+def create_explorer(the_map):
+    """Returns an Explorer on the_map, made as map-explorer-driver.py makes them."""
+    return driver.create_explorer(the_map)
+
+
+def explore_by_moves(file_name):
+    """Returns an Explorer that explored the cave in file_name one move() at a
+    time, and the position it was at after every step."""
+    explorer = create_explorer(load_map(file_name))
+    positions = []
+    while explorer.move():
+        positions.append(explorer.get_pos())
+    return explorer, positions
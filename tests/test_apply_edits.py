@@ -0,0 +1,128 @@
+#-------------------------------------------------------------------------------
+# Name:        test_apply_edits.py
+# Purpose: To check that after Explorer.apply_edits the Explorer still knows the
+#          cave as it is now (its diary and neighbour table agree with the map,
+#          and its path back to the start is open), that edits it refuses change
+#          nothing, and that run() on a GridMap, move() without a neighbour
+#          table and a TiledMap all carry on from the edits the same way.
+#
+# Author:      odanielb (Bridget O'Daniel)
+#-------------------------------------------------------------------------------
+import random
+
+import pytest
+
+from CaveFormat import save_cave
+from CaveGenerator import STYLES
+from Explorer import Explorer
+from GridMap import GridMap
+from MapLoader import load_map
+from NeighbourTable import build_neighbour_table
+from PositionDiary import DIRECTION_BITS
+from TiledMap import TiledMap
+
+_STEP_BACK = {'N': (1, 0), 'E': (0, -1), 'W': (0, 1), 'S': (-1, 0)}
+CAVES = [(rows, cols, style) for rows, cols in ((7, 9), (12, 13), (31, 17)) for style in STYLES]
+TRIALS = range(12)
+
+
+def _cells(explorer):
+    """Returns the cells of the Explorer's map, row after row."""
+    the_map = explorer.map
+    return ''.join(the_map.get_row_string(row) for row in range(len(the_map)))
+
+
+def _state(explorer):
+    """Returns everything about an Explorer that apply_edits and exploring change."""
+    return (explorer.get_pos(), explorer.steps, explorer.backtracks, explorer.treasure, explorer.treasure_path_depth,
+            explorer.steps_taken.size(), bytes(explorer.steps_taken.data), _cells(explorer))
+
+
+def _check_knows_the_cave(explorer):
+    """Checks that the Explorer's diary, neighbour table and path agree with its map."""
+    diary = explorer.position_diary
+    rows, cols = diary.rows, diary.cols
+    grid = GridMap(rows, cols, bytearray(_cells(explorer).encode('ascii')))
+    table = build_neighbour_table(grid, check=False)
+    if explorer.neighbours is not None:
+        assert bytes(explorer.neighbours) == bytes(table)
+    for row in range(rows):
+        for col in range(cols):
+            if diary.is_noted(row, col):
+                open_sides = table[row * cols + col]
+                assert grid.get(row, col) != 'W'
+                assert sum(DIRECTION_BITS[d] for d in diary.get_possible_directions(row, col)) == open_sides
+                assert sum(DIRECTION_BITS[d] for d in diary.get_visited_directions(row, col)) & ~open_sides == 0
+    row, col = explorer.get_pos()
+    assert grid.get(row, col) == 'M'
+    for direction in explorer.steps_taken.iter_from_top():
+        row += _STEP_BACK[direction][0]
+        col += _STEP_BACK[direction][1]
+        assert grid.get(row, col) != 'W'
+        assert diary.is_noted(row, col)
+
+
+def _random_edits(rng, explorer, rows, cols):
+    """Returns a few random edits inside the border, sometimes walling the
+    Explorer's own cell or one on its path."""
+    edits = {}
+    for _ in range(rng.randint(1, 8)):
+        edits[(rng.randint(1, rows - 2), rng.randint(1, cols - 2))] = rng.choice('WW.T')
+    if rng.random() < 0.3:
+        edits[explorer.get_pos()] = 'W'
+    return edits
+
+
+@pytest.mark.parametrize('trial', TRIALS)
+@pytest.mark.parametrize('rows, cols, style', CAVES)
+def test_edits_while_exploring(make_cave, tmp_path, rows, cols, style, trial):
+    rng = random.Random(trial)
+    base = load_map(make_cave(rows, cols, style, trial))
+    start = divmod(base.cells.find(b'M'), cols)
+    fast_map = base.copy()
+    moves_map = base.copy()
+    cave_name = str(tmp_path / 'cave.cave')
+    save_cave(base, cave_name, 4, 4)
+    tiled_map = TiledMap(cave_name, max_tiles=2)
+    explorers = [Explorer(fast_map.get_location(*start), fast_map, bytes(build_neighbour_table(fast_map))),   #Shared and read-only, as SessionServer's are
+                 Explorer(moves_map.get_location(*start), moves_map),
+                 Explorer(tiled_map.get_location(*start), tiled_map)]
+    try:
+        for explorer in explorers:
+            explorer.add_position_to_diary(start)
+        for _ in range(rng.randint(1, 6)):
+            steps = rng.randint(0, rows * cols // 4)
+            assert len(set(explorer.run(steps)[0] for explorer in explorers)) == 1
+            edits = _random_edits(rng, explorers[0], rows, cols)
+            errors = []
+            for explorer in explorers:
+                before = _state(explorer)
+                try:
+                    explorer.apply_edits(edits)
+                    errors.append(None)
+                except ValueError as error:
+                    errors.append(str(error))
+                    assert _state(explorer) == before                           #Refused edits change nothing
+            assert len(set(errors)) == 1
+            assert len(set(_state(explorer) for explorer in explorers)) == 1
+            for explorer in explorers:
+                _check_knows_the_cave(explorer)
+        for explorer in explorers:
+            assert explorer.run()[0]
+            _check_knows_the_cave(explorer)
+            assert explorer.steps_taken.size() == 0
+        assert len(set(_state(explorer) for explorer in explorers)) == 1
+    finally:
+        tiled_map.close()
+
+
+def test_bad_edits_are_refused(make_cave):
+    the_map = load_map(make_cave(12, 13, 'cavern', 0))
+    start = divmod(the_map.cells.find(b'M'), 13)
+    explorer = Explorer(the_map.get_location(*start), the_map, build_neighbour_table(the_map))
+    explorer.add_position_to_diary(start)
+    before = _state(explorer)
+    for edits in ({(3, 3): 'M'}, {(3, 3): 'X'}, {(12, 3): 'W'}, {(3, -1): 'W'}, {(0, 3): '.'}, {(11, 5): 'T'}, {start: 'W'}):
+        with pytest.raises(ValueError):
+            explorer.apply_edits(edits)
+        assert _state(explorer) == before
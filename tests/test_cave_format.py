@@ -0,0 +1,203 @@
+#-------------------------------------------------------------------------------
+# Name:        test_cave_format.py
+# Purpose: To check that caves come back from the .cave format exactly as they
+#          went in, in tiles of any shape, with NumPy and without it, that
+#          caves written one way read back the other, that converting a .txt
+#          cave a band at a time writes the same file as saving it whole, and
+#          that tile sizes a .cave file can't hold (and .txt files that don't
+#          hold a cave) are refused before anything is written.
+#
+# Author:      odanielb (Bridget O'Daniel)
+#-------------------------------------------------------------------------------
+import random
+
+import pytest
+
+import CaveFormat
+from CaveFormat import CaveFile, cave_to_txt, find_treasures, load_cave, main, save_cave, txt_to_cave
+from conftest import every_cave
+from GridMap import GridMap
+from MapLoader import load_map
+
+TILES = ((CaveFormat.TILE_SIZE, CaveFormat.TILE_SIZE), (4, 4), (5, 7), (1, 3))
+PACKERS = ['numpy', 'python']
+
+
+@pytest.fixture(params=PACKERS)
+def packer(request, monkeypatch):
+    """Runs a test once with NumPy packing the cells and once without it."""
+    if request.param == 'numpy':
+        if CaveFormat.numpy is None:
+            pytest.skip("NumPy is not installed")
+    else:
+        monkeypatch.setattr(CaveFormat, 'numpy', None)
+    return request.param
+
+
+def _pack_slowly(codes, bits):
+    """Returns codes packed into bits per cell the simplest way: as one number,
+    the first code in its lowest bits."""
+    value = 0
+    for code in reversed(codes):
+        value = value << bits | code
+    return value.to_bytes((len(codes) * bits + 7) // 8, 'little')
+
+
+def _treasures(grid):
+    """Returns row*cols+col of every treasure in grid, in order."""
+    cells = bytes(grid.cells)
+    return [index for index in range(len(cells)) if cells[index] == ord('T')]
+
+
+def _start(grid):
+    """Returns the (row, col) of the explorer in grid, or None."""
+    start = bytes(grid.cells).find(b'M')
+    return None if start == -1 else divmod(start, grid.cols)
+
+
+@pytest.mark.parametrize('tile_rows, tile_cols', TILES)
+@pytest.mark.parametrize('rows, cols, style, seed', every_cave())
+def test_round_trip(make_cave, tmp_path, packer, rows, cols, style, seed, tile_rows, tile_cols):
+    grid = load_map(make_cave(rows, cols, style, seed))
+    cave_name = str(tmp_path / 'cave.cave')
+    save_cave(grid, cave_name, tile_rows, tile_cols)
+    loaded = load_cave(cave_name)
+    assert (loaded.rows, loaded.cols) == (rows, cols)
+    assert bytes(loaded.cells) == bytes(grid.cells)
+    assert loaded.start == _start(grid)
+    assert list(loaded.treasures) == _treasures(grid)
+
+
+@pytest.mark.parametrize('tile_rows, tile_cols', TILES)
+def test_round_trip_with_path_markers(tmp_path, packer, tile_rows, tile_cols):
+    rng = random.Random(tile_rows * 100 + tile_cols)
+    rows, cols = 13, 11
+    cells = bytearray(rng.choice(b'W.TX') for _ in range(rows * cols))
+    cells[rows * cols // 2] = ord('M')
+    grid = GridMap(rows, cols, cells)
+    cave_name = str(tmp_path / 'cave.cave')
+    save_cave(grid, cave_name, tile_rows, tile_cols)
+    loaded = load_cave(cave_name)
+    assert bytes(loaded.cells) == bytes(cells)
+    assert loaded.start == _start(grid)
+    assert list(loaded.treasures) == _treasures(grid)
+
+
+@pytest.mark.parametrize('write_with, read_with', [('numpy', 'python'), ('python', 'numpy')])
+def test_numpy_and_python_agree(make_cave, tmp_path, monkeypatch, write_with, read_with):
+    if CaveFormat.numpy is None:
+        pytest.skip("NumPy is not installed")
+    numpy = CaveFormat.numpy
+    grid = load_map(make_cave(31, 17, 'treasure', 2))
+    cave_name = str(tmp_path / 'cave.cave')
+    monkeypatch.setattr(CaveFormat, 'numpy', numpy if write_with == 'numpy' else None)
+    save_cave(grid, cave_name, 5, 7)
+    monkeypatch.setattr(CaveFormat, 'numpy', numpy if read_with == 'numpy' else None)
+    assert bytes(load_cave(cave_name).cells) == bytes(grid.cells)
+
+
+def test_regions_and_tiles(make_cave, tmp_path, packer):
+    grid = load_map(make_cave(31, 17, 'cavern', 0))
+    cave_name = str(tmp_path / 'cave.cave')
+    save_cave(grid, cave_name, 5, 7)
+    cave = CaveFile.open(cave_name, writable=True)
+    try:
+        for top, left, rows, cols in ((0, 0, 31, 17), (3, 2, 9, 11), (30, 16, 1, 1), (4, 6, 6, 2)):
+            region = cave.read_region(top, left, rows, cols)
+            assert [region.get_row_string(row) for row in range(rows)] == \
+                   [grid.get_row_string(top + row)[left:left + cols] for row in range(rows)]
+        tile = cave.read_tile(1, 1)
+        tile[0] = ord('T')
+        cave.write_tile(1, 1, tile)
+        assert cave.read_tile(1, 1) == tile
+    finally:
+        cave.close()
+
+
+def test_txt_conversion(make_cave, tmp_path, packer):
+    txt_name = make_cave(12, 13, 'treasure', 1)
+    cave_name = str(tmp_path / 'cave.cave')
+    back_name = str(tmp_path / 'back.txt')
+    txt_to_cave(txt_name, cave_name)
+    cave_to_txt(cave_name, back_name)
+    with open(txt_name) as txt_file, open(back_name) as back_file:
+        assert back_file.read() == txt_file.read()
+
+
+@pytest.mark.parametrize('tile_rows, tile_cols', TILES)
+@pytest.mark.parametrize('rows, cols, style, seed', every_cave())
+def test_streamed_conversion_matches_save_cave(make_cave, tmp_path, packer, rows, cols, style, seed, tile_rows, tile_cols):
+    txt_name = make_cave(rows, cols, style, seed)
+    streamed_name = str(tmp_path / 'streamed.cave')
+    saved_name = str(tmp_path / 'saved.cave')
+    txt_to_cave(txt_name, streamed_name, tile_rows, tile_cols)
+    save_cave(load_map(txt_name), saved_name, tile_rows, tile_cols)
+    with open(streamed_name, 'rb') as streamed, open(saved_name, 'rb') as saved:
+        assert streamed.read() == saved.read()
+
+
+def test_streamed_conversion_with_path_markers(tmp_path, packer):
+    rng = random.Random(5)
+    rows, cols = 13, 11
+    cells = bytearray(rng.choice(b'W.TX') for _ in range(rows * cols))
+    cells[40] = ord('M')
+    txt_name = str(tmp_path / 'cave.txt')
+    with open(txt_name, 'w') as txt_file:
+        txt_file.write(str(rows)+" "+str(cols)+"\n\n")                           #A blank line, and spaces between cells
+        for row in range(rows):
+            txt_file.write(' '.join(cells[row * cols:(row + 1) * cols].decode('ascii'))+"\n")
+    txt_to_cave(txt_name, str(tmp_path / 'cave.cave'), 5, 7)
+    loaded = load_cave(str(tmp_path / 'cave.cave'))
+    assert bytes(loaded.cells) == bytes(cells)
+    assert loaded.start == (40 // cols, 40 % cols)
+    assert list(loaded.treasures) == [index for index, cell in enumerate(cells) if cell == ord('T')]
+
+
+@pytest.mark.parametrize('text', ["3 3\nWWW\nWMW\n", "3 3\nWWW\nWMW\nWW\n", "3 3\nWWW\nWQW\nWWW\n", "WWW\n", ""])
+def test_bad_txt_files_are_refused_before_writing(tmp_path, text):
+    txt_name = str(tmp_path / 'cave.txt')
+    with open(txt_name, 'w') as txt_file:
+        txt_file.write(text)
+    with pytest.raises(ValueError):
+        txt_to_cave(txt_name, str(tmp_path / 'cave.cave'))
+    assert not (tmp_path / 'cave.cave').exists()
+
+
+def test_unknown_cells_are_refused(tmp_path, packer):
+    grid = GridMap(3, 3, bytearray(b'WWWWQWWWW'))
+    with pytest.raises(ValueError):
+        save_cave(grid, str(tmp_path / 'cave.cave'))
+
+
+@pytest.mark.parametrize('bits', [2, 3])
+@pytest.mark.parametrize('count', list(range(0, 26)) + [127, 128 * 128 + 5])
+def test_packing_matches_the_simplest_packing(packer, bits, count):
+    rng = random.Random(count * 10 + bits)
+    codes = bytes(rng.randrange(len(CaveFormat.CODES[bits])) for _ in range(count))
+    packed = CaveFormat._pack(codes, bits)
+    assert packed == _pack_slowly(codes, bits)
+    assert CaveFormat._unpack(packed, count, bits) == codes
+
+
+def test_find_treasures(packer):
+    cells = bytearray(random.Random(3).choice(b'W.TM') for _ in range(1000))
+    assert list(find_treasures(cells)) == [index for index, cell in enumerate(cells) if cell == ord('T')]
+    assert list(find_treasures(bytearray(b'W.M'))) == []
+
+
+@pytest.mark.parametrize('tile_rows, tile_cols', [(0, 0), (0, 4), (4, 0), (-1, 4), (70000, 4), (4, 65536)])
+def test_bad_tile_sizes_are_refused(make_cave, tmp_path, tile_rows, tile_cols):
+    txt_name = make_cave(12, 13, 'maze', 0)
+    cave_name = str(tmp_path / 'cave.cave')
+    with pytest.raises(ValueError):
+        save_cave(load_map(txt_name), cave_name, tile_rows, tile_cols)
+    with pytest.raises(SystemExit):
+        main(['--tile', str(tile_rows)+'x'+str(tile_cols), txt_name, cave_name])
+    assert not (tmp_path / 'cave.cave').exists()
+
+
+def test_largest_tiles(make_cave, tmp_path):
+    grid = load_map(make_cave(12, 13, 'maze', 0))
+    cave_name = str(tmp_path / 'cave.cave')
+    save_cave(grid, cave_name, CaveFormat.MAX_TILE_SIZE, 1)
+    assert bytes(load_cave(cave_name).cells) == bytes(grid.cells)
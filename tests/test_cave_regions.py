@@ -0,0 +1,87 @@
+#-------------------------------------------------------------------------------
+# Name:        test_cave_regions.py
+# Purpose: To check that CaveRegions labels the same regions, with the same
+#          treasure and sizes, as flooding out from every cell one at a time,
+#          and that an Explorer collects just the treasure it says is reachable.
+#
+# Author:      odanielb (Bridget O'Daniel)
+#-------------------------------------------------------------------------------
+import random
+from collections import deque
+
+import pytest
+
+from CaveRegions import CaveRegions
+from conftest import create_explorer, every_cave
+from GridMap import GridMap
+from MapLoader import load_map
+
+
+def _flood(grid):
+    """Returns the label of every cell, labelling each region from 1 up in the
+    order its first cell comes (row after row), by flooding out from it."""
+    labels = [0] * (grid.rows * grid.cols)
+    count = 0
+    for first in range(grid.rows * grid.cols):
+        if labels[first] or grid.cells[first] == ord('W'):
+            continue
+        count += 1
+        labels[first] = count
+        queue = deque([divmod(first, grid.cols)])
+        while queue:
+            row, col = queue.popleft()
+            for there_row, there_col in ((row - 1, col), (row, col + 1), (row, col - 1), (row + 1, col)):
+                if 0 <= there_row < grid.rows and 0 <= there_col < grid.cols:
+                    there = there_row * grid.cols + there_col
+                    if not labels[there] and grid.cells[there] != ord('W'):
+                        labels[there] = count
+                        queue.append((there_row, there_col))
+    return labels
+
+
+def _check_regions(grid):
+    """Checks every answer CaveRegions gives for grid against a flood fill."""
+    regions = CaveRegions(grid)
+    labels = _flood(grid)
+    assert list(regions.labels) == labels
+    assert regions.get_region_count() == max(labels + [0])
+    cells = bytes(grid.cells)
+    treasure = dict((label, 0) for label in labels)
+    size = dict((label, 0) for label in labels)
+    for index, label in enumerate(labels):
+        treasure[label] += cells[index] == ord('T')
+        size[label] += label != 0
+    assert list(regions.treasure_from_every_cell()) == [treasure[label] if label else 0 for label in labels]
+    for index, label in enumerate(labels):
+        row, col = divmod(index, grid.cols)
+        assert regions.get_region(row, col) == label
+        assert regions.reachable_treasure(row, col) == (treasure[label] if label else 0)
+        assert regions.reachable_cells(row, col) == (size[label] if label else 0)
+    return regions
+
+
+@pytest.mark.parametrize('seed', range(50))
+def test_random_grids_match_a_flood_fill(seed):
+    rng = random.Random(seed)
+    rows, cols = rng.randint(1, 15), rng.randint(1, 15)
+    walls = rng.random()
+    cells = bytearray(ord('W') if rng.random() < walls else rng.choice(b'..T') for _ in range(rows * cols))
+    _check_regions(GridMap(rows, cols, cells))
+
+
+@pytest.mark.parametrize('rows, cols, style, seed', every_cave())
+def test_explorer_collects_the_reachable_treasure(make_cave, rows, cols, style, seed):
+    grid = load_map(make_cave(rows, cols, style, seed))
+    regions = _check_regions(grid)
+    explorer = create_explorer(grid)
+    explorer.run()
+    assert explorer.get_treasure_count() == regions.reachable_treasure()
+
+
+def test_map_without_explorer_has_no_start():
+    regions = CaveRegions(GridMap(3, 3, bytearray(b'WWWW.WWWW')))
+    assert regions.reachable_cells(1, 1) == 1
+    with pytest.raises(ValueError):
+        regions.reachable_treasure()
+    with pytest.raises(ValueError):
+        regions.reachable_cells()
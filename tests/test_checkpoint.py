@@ -0,0 +1,120 @@
+#-------------------------------------------------------------------------------
+# Name:        test_checkpoint.py
+# Purpose: To check that every checkpoint Checkpointer writes resumes to exactly
+#          the Explorer that was saved, that resumed Explorers finish as
+#          move() would have, and that checkpoints of another cave or damaged
+#          ones are refused.
+#
+# Author:      odanielb (Bridget O'Daniel)
+#-------------------------------------------------------------------------------
+import os
+
+import pytest
+
+from Checkpoint import HEADER, RECORD, Checkpointer, resume
+from conftest import create_explorer, driver, every_cave, explore_by_moves
+from MapCache import hash_file
+from MapLoader import load_map
+
+INTERVAL = 5
+
+
+def _state(explorer):
+    """Returns everything about an Explorer that a checkpoint holds."""
+    return (explorer.get_pos(), explorer.steps, explorer.backtracks, explorer.treasure,
+            explorer.treasure_path_depth, explorer.steps_taken.size(), bytes(explorer.steps_taken.data),
+            bytes(explorer.map.cells), bytes(explorer.position_diary.possible), bytes(explorer.position_diary.visited))
+
+
+def _record_ends(file_name):
+    """Returns where each record in a checkpoint file ends."""
+    with open(file_name, 'rb') as checkpoint:
+        data = checkpoint.read()
+    ends = []
+    at = HEADER.size
+    while at < len(data):
+        at += RECORD.size + RECORD.unpack_from(data, at)[1]
+        ends.append(at)
+    return ends
+
+
+def _cut(file_name, size, cut_name):
+    """Copies the first size bytes of file_name to cut_name."""
+    with open(file_name, 'rb') as checkpoint:
+        data = checkpoint.read(size)
+    with open(cut_name, 'wb') as out:
+        out.write(data)
+
+
+@pytest.mark.parametrize('rows, cols, style, seed', every_cave())
+def test_every_checkpoint_resumes(make_cave, tmp_path, rows, cols, style, seed):
+    file_name = make_cave(rows, cols, style, seed)
+    checkpoint_file = str(tmp_path / 'cave.checkpoint')
+    cave_hash = hash_file(file_name)
+    Checkpointer(checkpoint_file, INTERVAL, cave_hash=cave_hash).run(create_explorer(load_map(file_name)))
+    by_moves = explore_by_moves(file_name)[0]
+    expected = create_explorer(load_map(file_name))                             #Stepped along beside the checkpoints
+    cut_file = str(tmp_path / 'cut.checkpoint')
+    for number, end in enumerate(_record_ends(checkpoint_file)):
+        if number > 0:
+            expected.run(INTERVAL)
+        _cut(checkpoint_file, end, cut_file)
+        resumed = resume(cut_file, cave_hash=cave_hash)
+        assert _state(resumed) == _state(expected)
+        resumed.run()
+        assert _state(resumed)[:4] == _state(by_moves)[:4]
+        assert bytes(resumed.map.cells) == bytes(by_moves.map.cells)
+
+
+def test_resumed_checkpointer_carries_on(make_cave, tmp_path):
+    file_name = make_cave(31, 17, 'maze', 1)
+    checkpoint_file = str(tmp_path / 'cave.checkpoint')
+    Checkpointer(checkpoint_file, INTERVAL).run(create_explorer(load_map(file_name)))
+    ends = _record_ends(checkpoint_file)
+    _cut(checkpoint_file, ends[3] + 2, checkpoint_file+'.cut')                  #Part of the fifth record was written
+    explorer = resume(checkpoint_file+'.cut')
+    assert explorer.steps == 3 * INTERVAL
+    Checkpointer(checkpoint_file+'.cut', INTERVAL, resuming=True).run(explorer)
+    finished = resume(checkpoint_file+'.cut')
+    assert _state(finished) == _state(resume(checkpoint_file))
+    assert _state(finished)[:4] == _state(explore_by_moves(file_name)[0])[:4]
+
+
+def test_checkpoint_of_another_cave_is_refused(make_cave, tmp_path):
+    file_name = make_cave(12, 13, 'maze', 0)
+    checkpoint_file = str(tmp_path / 'cave.checkpoint')
+    Checkpointer(checkpoint_file, INTERVAL, cave_hash=hash_file(file_name)).run(create_explorer(load_map(file_name)))
+    with pytest.raises(ValueError):
+        resume(checkpoint_file, cave_hash=hash_file(make_cave(12, 13, 'maze', 1)))
+
+
+@pytest.mark.parametrize('damage', ['empty', 'not a checkpoint', 'header only', 'garbled record'])
+def test_unusable_checkpoint_is_refused(make_cave, tmp_path, damage):
+    file_name = make_cave(12, 13, 'maze', 0)
+    checkpoint_file = str(tmp_path / 'cave.checkpoint')
+    Checkpointer(checkpoint_file, INTERVAL).run(create_explorer(load_map(file_name)))
+    with open(checkpoint_file, 'rb') as checkpoint:
+        data = bytearray(checkpoint.read())
+    if damage == 'empty':
+        data = bytearray()
+    elif damage == 'not a checkpoint':
+        data[:8] = b'NOTACAVE'
+    elif damage == 'header only':
+        data = data[:HEADER.size]
+    else:
+        data[HEADER.size + RECORD.size:HEADER.size + RECORD.size + 8] = b'\xff' * 8
+    with open(checkpoint_file, 'wb') as checkpoint:
+        checkpoint.write(data)
+    with pytest.raises(ValueError):
+        resume(checkpoint_file)
+
+
+def test_explore_with_checkpoints_starts_over_on_another_cave(make_cave):
+    file_name = make_cave(12, 13, 'maze', 0)
+    other_name = make_cave(12, 13, 'maze', 1)
+    Checkpointer(file_name+'.checkpoint', INTERVAL, cave_hash=hash_file(other_name)).run(create_explorer(load_map(other_name)))
+    explorer = driver.explore_with_checkpoints(file_name, INTERVAL)
+    by_moves = explore_by_moves(file_name)[0]
+    assert _state(explorer)[:4] == _state(by_moves)[:4]
+    assert bytes(explorer.map.cells) == bytes(by_moves.map.cells)
+    assert not os.path.exists(file_name+'.checkpoint')                          #Deleted once the cave was explored
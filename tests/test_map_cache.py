@@ -0,0 +1,121 @@
+#-------------------------------------------------------------------------------
+# Name:        test_map_cache.py
+# Purpose: To check that MapCache gives back the same maps as MapLoader, with the
+#          start and treasures set, from memory, from its grid files and after
+#          the cave changes, and that it only keeps what it is allowed to.
+#
+# Author:      odanielb (Bridget O'Daniel)
+#-------------------------------------------------------------------------------
+import os
+
+import pytest
+
+from CaveFormat import txt_to_cave
+from CaveGenerator import STYLES
+from MapCache import MapCache
+from MapLoader import load_map
+
+
+def _expected(file_name):
+    """Returns the cells, start and treasures of the cave in file_name, worked
+    out the slow way."""
+    grid = load_map(file_name)
+    cells = bytes(grid.cells)
+    start = cells.find(b'M')
+    return cells, None if start == -1 else divmod(start, grid.cols), [index for index, cell in enumerate(cells) if cell == ord('T')]
+
+
+def _got(grid):
+    """Returns the cells, start and treasures of a GridMap from the cache."""
+    return bytes(grid.cells), grid.start, list(grid.treasures)
+
+
+def _charged_size(file_name):
+    """Returns how many bytes of memory the cache charges for the cave in file_name."""
+    cache = MapCache()
+    cache.load_map(file_name)
+    return cache.size
+
+
+@pytest.mark.parametrize('style', STYLES)
+def test_memory_hits(make_cave, style):
+    file_name = make_cave(31, 17, style, 1)
+    cache = MapCache()
+    first = cache.load_map(file_name)
+    assert (cache.misses, cache.hits) == (1, 0)
+    first.cells[40] = ord('X')                                                  #Changing a loaded map leaves the cached one alone
+    second = cache.load_map(file_name)
+    assert (cache.misses, cache.hits) == (1, 1)
+    assert _got(second) == _expected(file_name)
+
+
+@pytest.mark.parametrize('style', STYLES)
+def test_disk_hits(make_cave, tmp_path, style):
+    file_name = make_cave(31, 17, style, 2)
+    cache_dir = str(tmp_path / 'cache')
+    assert _got(MapCache(cache_dir=cache_dir).load_map(file_name)) == _expected(file_name)
+    cache = MapCache(cache_dir=cache_dir)                                       #Another process, with nothing in memory
+    grid = cache.load_map(file_name)
+    assert (cache.misses, cache.disk_hits) == (0, 1)
+    assert _got(grid) == _expected(file_name)
+    grid.cells[40] = ord('X')                                                   #Copy-on-write, so the grid file is left alone
+    assert _got(MapCache(cache_dir=cache_dir).load_map(file_name)) == _expected(file_name)
+
+
+def test_same_contents_share_an_entry(make_cave, tmp_path):
+    file_name = make_cave(12, 13, 'treasure', 0)
+    copy_name = str(tmp_path / 'copy.txt')
+    with open(file_name, 'rb') as original, open(copy_name, 'wb') as copy:
+        copy.write(original.read())
+    cache = MapCache()
+    cache.load_map(file_name)
+    assert _got(cache.load_map(copy_name)) == _expected(file_name)
+    assert (cache.misses, len(cache.entries)) == (1, 1)
+
+
+def test_changed_file_is_parsed_again(make_cave, tmp_path):
+    file_name = str(tmp_path / 'cave.txt')
+    cache = MapCache(cache_dir=str(tmp_path / 'cache'))
+    for seed in range(3):
+        os.replace(make_cave(12, 13, 'maze', seed), file_name)
+        assert _got(cache.load_map(file_name)) == _expected(file_name)
+    assert cache.misses == 3
+
+
+def test_nothing_is_kept_in_memory_with_max_bytes_zero(make_cave, tmp_path):
+    cache = MapCache(max_bytes=0, cache_dir=str(tmp_path / 'cache'))
+    for seed in range(5):
+        file_name = make_cave(12, 13, 'treasure', seed)
+        cache.load_map(file_name)
+        assert _got(cache.load_map(file_name)) == _expected(file_name)
+    assert (len(cache.entries), cache.size) == (0, 0)
+    assert (cache.misses, cache.disk_hits) == (5, 5)
+
+
+def test_least_recently_used_is_forgotten(make_cave):
+    names = [make_cave(12, 13, 'maze', seed) for seed in range(3)]
+    cache = MapCache(max_bytes=2 * _charged_size(names[0]))
+    for file_name in names:
+        cache.load_map(file_name)
+    assert cache.size <= cache.max_bytes
+    cache.load_map(names[0])                                                    #Forgotten, so parsed again
+    assert cache.misses == 4
+
+
+def test_cave_files_keep_their_treasure_index(make_cave, tmp_path):
+    txt_name = make_cave(31, 17, 'treasure', 0)
+    cave_name = str(tmp_path / 'cave.cave')
+    txt_to_cave(txt_name, cave_name, 5, 7)
+    cache_dir = str(tmp_path / 'cache')
+    MapCache(cache_dir=cache_dir).load_map(cave_name)
+    assert _got(MapCache(cache_dir=cache_dir).load_map(cave_name)) == _expected(txt_name)
+
+
+def test_removed_grid_file_is_parsed_again(make_cave, tmp_path):
+    file_name = make_cave(12, 13, 'cavern', 0)
+    cache_dir = str(tmp_path / 'cache')
+    cache = MapCache(max_bytes=0, cache_dir=cache_dir)
+    cache.load_map(file_name)
+    for name in os.listdir(cache_dir):
+        os.remove(os.path.join(cache_dir, name))
+    assert _got(cache.load_map(file_name)) == _expected(file_name)
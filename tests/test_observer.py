@@ -0,0 +1,65 @@
+#-------------------------------------------------------------------------------
+# Name:        test_observer.py
+# Purpose: To check that an observer hears the same events, and RunStats counts
+#          the same moves, backtracks, treasure and diary lookups, whether the
+#          Explorer runs in its tight loop, one move() at a time or without a
+#          neighbour table.
+#
+# Author:      odanielb (Bridget O'Daniel)
+#-------------------------------------------------------------------------------
+import pytest
+
+from conftest import driver, every_cave
+from Explorer import Explorer
+from ExplorerObserver import ExplorerObserver, ObserverGroup, RunStats
+from MapLoader import load_map
+
+
+class EventLog(ExplorerObserver):
+    """Keeps every event it is told about, in order."""
+
+    def __init__(self):
+        self.events = []
+
+    def on_move(self, explorer, direction):
+        self.events.append(('move', direction, explorer.get_pos(), explorer.steps))
+
+    def on_backtrack(self, explorer, direction):
+        self.events.append(('backtrack', direction, explorer.get_pos(), explorer.steps))
+
+    def on_treasure(self, explorer, position):
+        self.events.append(('treasure', position, explorer.treasure))
+
+    def on_finished(self, explorer):
+        self.events.append(('finished', explorer.steps))
+
+
+def _observe(file_name, how):
+    """Explores the cave in file_name the way how says, returning its RunStats
+    counters and the events it heard."""
+    stats = RunStats()
+    log = EventLog()
+    the_map = load_map(file_name)
+    if how == 'no table':
+        start = divmod(the_map.cells.find(b'M'), the_map.cols)
+        explorer = Explorer(the_map.get_location(start[0], start[1]), the_map, None, ObserverGroup([stats, log]))
+        explorer.add_position_to_diary()
+    else:
+        explorer = driver.create_explorer(the_map, ObserverGroup([stats, log]))
+    if how == 'move':
+        while explorer.move():
+            pass
+    else:
+        assert explorer.run()[0]
+    assert stats.finished
+    return stats.counters, log.events
+
+
+@pytest.mark.parametrize('rows, cols, style, seed', every_cave())
+def test_every_way_of_exploring_is_observed_alike(make_cave, rows, cols, style, seed):
+    file_name = make_cave(rows, cols, style, seed)
+    counters, events = _observe(file_name, 'move')
+    assert _observe(file_name, 'run') == (counters, events)
+    assert _observe(file_name, 'no table') == (counters, events)
+    assert counters['moves'] == counters['backtracks']                          #Every move is backtracked to get back to the start
+    assert counters['diary_lookups'] == 2 * counters['moves'] + counters['backtracks'] + 2    #Two per move, one per backtrack, one at the start and one at the end
@@ -0,0 +1,82 @@
+#-------------------------------------------------------------------------------
+# Name:        test_packed_stack.py
+# Purpose: To check that PackedStack behaves exactly like a list used as a
+#          stack, through any mix of pushes, pops and truncations, and that its
+#          bytes only depend on the directions in it (the Explorer's checkpoints
+#          store them).
+#
+# Author:      odanielb (Bridget O'Daniel)
+#-------------------------------------------------------------------------------
+import random
+
+import pytest
+
+from PackedStack import CODES, DIRECTIONS, PackedStack
+
+
+def _packed(directions):
+    """Returns directions packed the simplest way: 2 bits each, the first in the
+    lowest bits of the first byte."""
+    data = bytearray((len(directions) + 3) // 4)
+    for index, direction in enumerate(directions):
+        data[index // 4] |= CODES[direction] << (2 * (index % 4))
+    return bytes(data)
+
+
+def _check(stack, expected):
+    """Checks that stack holds the directions in the list expected."""
+    assert stack.size() == len(expected)
+    assert list(stack.iter_from_top()) == expected[::-1]
+    assert bytes(stack.data) == _packed(expected)
+    if expected:
+        assert stack.top() == expected[-1]
+
+
+@pytest.mark.parametrize('seed', range(10))
+def test_matches_a_list(seed):
+    rng = random.Random(seed)
+    stack = PackedStack()
+    expected = []
+    for _ in range(2000):
+        action = rng.random()
+        if action < 0.45:
+            direction = rng.choice(DIRECTIONS)
+            stack.push(direction)
+            expected.append(direction)
+        elif action < 0.6:
+            code = rng.randrange(4)
+            stack.push_code(code)
+            expected.append(DIRECTIONS[code])
+        elif action < 0.8 and expected:
+            assert stack.pop() == expected.pop()
+        elif action < 0.95 and expected:
+            assert stack.pop_code() == CODES[expected.pop()]
+        else:
+            size = rng.randint(0, len(expected))
+            stack.truncate(size)
+            del expected[size:]
+        _check(stack, expected)
+
+
+@pytest.mark.parametrize('count', range(0, 13))
+def test_every_partial_byte(count):
+    directions = [DIRECTIONS[index % 4] for index in range(count)]
+    stack = PackedStack()
+    for direction in directions:
+        stack.push(direction)
+    _check(stack, directions)
+    for size in range(count, -1, -1):
+        stack.truncate(size)
+        _check(stack, directions[:size])
+
+
+def test_empty_stack_refuses_pop_and_top():
+    stack = PackedStack()
+    for method in (stack.pop, stack.pop_code, stack.top):
+        with pytest.raises(IndexError):
+            method()
+    stack.push('S')
+    stack.pop()
+    with pytest.raises(IndexError):
+        stack.pop()
+    _check(stack, [])
@@ -0,0 +1,148 @@
+#-------------------------------------------------------------------------------
+# Name:        test_renderer.py
+# Purpose: To check that the frames Renderer draws a cell at a time leave the
+#          screen showing exactly what a full redraw of the map would, after
+#          every move() and every run() of a few steps, with an overlay that
+#          changes from frame to frame and with cells the Explorer didn't change.
+#
+# Author:      odanielb (Bridget O'Daniel)
+#-------------------------------------------------------------------------------
+import io
+import random
+import re
+
+import pytest
+
+from conftest import create_explorer, every_cave
+from MapLoader import load_map
+from Renderer import CLEAR_SCREEN, Renderer
+
+_CURSOR = re.compile('\x1b\\[(\\d+);(\\d+)H')
+
+
+class Screen(object):
+    """A terminal that understands just what Renderer writes: clearing the
+    screen, moving the cursor and printing characters and new lines."""
+
+    def __init__(self):
+        self.cells = {}
+        self.row = self.col = 0
+
+    def write(self, text):
+        at = 0
+        while at < len(text):
+            if text.startswith(CLEAR_SCREEN, at):
+                self.cells = {}
+                self.row = self.col = 0
+                at += len(CLEAR_SCREEN)
+                continue
+            cursor = _CURSOR.match(text, at)
+            if cursor:
+                self.row, self.col = int(cursor.group(1)) - 1, int(cursor.group(2)) - 1
+                at = cursor.end()
+                continue
+            if text[at] == '\n':
+                self.row, self.col = self.row + 1, 0
+            else:
+                self.cells[(self.row, self.col)] = text[at]
+                self.col += 1
+            at += 1
+
+    def lines(self):
+        """Returns what is on the screen, as a list of strings."""
+        rows = max(row for row, col in self.cells) + 1 if self.cells else 0
+        cols = max(col for row, col in self.cells) + 1 if self.cells else 0
+        return [''.join(self.cells.get((row, col), ' ') for col in range(cols)) for row in range(rows)]
+
+
+def _expected(the_map, overlay):
+    """Returns the lines a full redraw of the map, with overlay, shows."""
+    lines = [list(the_map.get_row_string(row)) for row in range(len(the_map))]
+    for row, col in overlay:
+        lines[row][col] = 'X'
+    return [''.join(line) for line in lines]
+
+
+def _draw(renderer, out, screen, the_map, overlay=()):
+    """Draws a frame and shows what was written on the screen."""
+    out.seek(0)
+    out.truncate()
+    assert renderer.draw(the_map, overlay)
+    screen.write(out.getvalue())
+
+
+def _random_overlay(rng, the_map):
+    """Returns a few positions on the map, some of them on walls."""
+    return set((rng.randrange(len(the_map)), rng.randrange(len(the_map[0]))) for _ in range(rng.randint(0, 3)))
+
+
+@pytest.mark.parametrize('how', ['move', 'run'])
+@pytest.mark.parametrize('rows, cols, style, seed', every_cave())
+def test_changed_cells_match_a_full_redraw(make_cave, rows, cols, style, seed, how):
+    rng = random.Random(seed)
+    explorer = create_explorer(load_map(make_cave(rows, cols, style, seed)))
+    out = io.StringIO()
+    renderer = Renderer(out)
+    explorer.set_renderer(renderer)
+    screen = Screen()
+    _draw(renderer, out, screen, explorer.map)
+    assert out.getvalue().startswith(CLEAR_SCREEN)
+    assert screen.lines() == _expected(explorer.map, ())
+    finished = False
+    while not finished:
+        finished = not explorer.move() if how == 'move' else explorer.run(7)[0]
+        overlay = _random_overlay(rng, explorer.map)
+        _draw(renderer, out, screen, explorer.map, overlay)
+        assert CLEAR_SCREEN not in out.getvalue()
+        assert screen.lines() == _expected(explorer.map, overlay)
+        assert renderer.dirty == set()
+
+
+def test_edits_are_redrawn(make_cave):
+    rng = random.Random(1)
+    explorer = create_explorer(load_map(make_cave(31, 17, 'maze', 1)))
+    out = io.StringIO()
+    renderer = Renderer(out)
+    explorer.set_renderer(renderer)
+    screen = Screen()
+    _draw(renderer, out, screen, explorer.map)
+    for _ in range(20):
+        explorer.run(rng.randint(1, 30))
+        edits = dict(((rng.randint(1, 29), rng.randint(1, 15)), rng.choice('W.T')) for _ in range(4))
+        edits.pop(explorer.get_pos(), None)
+        try:
+            explorer.apply_edits(edits)
+        except ValueError:
+            pass
+        _draw(renderer, out, screen, explorer.map)
+        assert screen.lines() == _expected(explorer.map, ())
+
+
+def test_full_frames(make_cave):
+    small = load_map(make_cave(7, 9, 'maze', 0))
+    big = load_map(make_cave(12, 13, 'maze', 0))
+    out = io.StringIO()
+    renderer = Renderer(out)
+    screen = Screen()
+    _draw(renderer, out, screen, small)
+    big.set(1, 1, 'T')                                                          #Not marked, so only a full frame shows it
+    renderer.dirty.add((0, 0))
+    _draw(renderer, out, screen, big)                                           #Another size, so drawn in full
+    assert out.getvalue().startswith(CLEAR_SCREEN)
+    assert screen.lines() == _expected(big, ())
+    renderer.reset()
+    _draw(renderer, out, screen, big, [(2, 2)])
+    assert out.getvalue().startswith(CLEAR_SCREEN)
+    assert screen.lines() == _expected(big, [(2, 2)])
+
+
+def test_frames_over_the_cap_are_skipped(make_cave):
+    the_map = load_map(make_cave(7, 9, 'maze', 0))
+    out = io.StringIO()
+    renderer = Renderer(out, max_fps=0.001)                                     #One frame every 1000 seconds
+    assert renderer.draw(the_map)
+    renderer.mark_dirty(1, 1)
+    assert not renderer.draw(the_map)
+    assert renderer.dirty == set([(1, 1)])                                      #Kept for the next frame drawn
+    assert renderer.draw(the_map, force=True)
+    assert (renderer.frames_drawn, renderer.frames_skipped) == (2, 1)
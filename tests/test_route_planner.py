@@ -0,0 +1,140 @@
+#-------------------------------------------------------------------------------
+# Name:        test_route_planner.py
+# Purpose: To check that plan_route's routes stay in the cave, collect every
+#          treasure the explorer can reach and come back to the start, that
+#          with few treasures no order of them makes a shorter route (found by
+#          trying every order), and that with many each treasure it goes to is
+#          the nearest one left.
+#
+# Author:      odanielb (Bridget O'Daniel)
+#-------------------------------------------------------------------------------
+import itertools
+import random
+from collections import deque
+
+import pytest
+
+from conftest import every_cave
+from GridMap import GridMap
+from MapLoader import load_map
+from RoutePlanner import plan_route
+
+_MOVES = {'N': (-1, 0), 'E': (0, 1), 'W': (0, -1), 'S': (1, 0)}
+
+
+def _distances(grid, start):
+    """Returns the number of steps from start to every cell it can reach, as a
+    dictionary of (row, col) -> steps, searching the map itself."""
+    distances = {start: 0}
+    queue = deque([start])
+    while queue:
+        row, col = queue.popleft()
+        for step_row, step_col in _MOVES.values():
+            there = (row + step_row, col + step_col)
+            if 0 <= there[0] < grid.rows and 0 <= there[1] < grid.cols and there not in distances \
+                    and grid.get(there[0], there[1]) != 'W':
+                distances[there] = distances[(row, col)] + 1
+                queue.append(there)
+    return distances
+
+
+def _reachable_treasures(grid, start):
+    """Returns the treasures the explorer can reach, as a set of (row, col)."""
+    return set(pos for pos in _distances(grid, start) if grid.get(pos[0], pos[1]) == 'T')
+
+
+def _walk(grid, start, route):
+    """Follows route from start, checking it never leaves the cave or walks into
+    a wall, and returns every cell it stepped on."""
+    row, col = start
+    walked = [start]
+    for direction in route:
+        row += _MOVES[direction][0]
+        col += _MOVES[direction][1]
+        assert 0 <= row < grid.rows and 0 <= col < grid.cols
+        assert grid.get(row, col) != 'W'
+        walked.append((row, col))
+    return walked
+
+
+def _random_cave(rng, rows, cols, treasures):
+    """Returns a GridMap of open cells and walls at random, walled all round,
+    with the explorer and up to treasures treasures in it."""
+    cells = bytearray(b'W' * rows * cols)
+    for row in range(1, rows - 1):
+        for col in range(1, cols - 1):
+            cells[row * cols + col] = ord('W') if rng.random() < 0.3 else ord('.')
+    inside = [(row, col) for row in range(1, rows - 1) for col in range(1, cols - 1)]
+    places = rng.sample(inside, min(treasures + 1, len(inside)))
+    for row, col in places[1:]:
+        cells[row * cols + col] = ord('T')
+    row, col = places[0]
+    cells[row * cols + col] = ord('M')
+    return GridMap(rows, cols, cells)
+
+
+def _check_route(grid, exact_limit=None):
+    """Plans a route on grid, checks it goes where it should and returns it,
+    the treasures in the order collected and the start."""
+    start = divmod(bytes(grid.cells).find(b'M'), grid.cols)
+    if exact_limit is None:
+        route, treasures = plan_route(grid)
+    else:
+        route, treasures = plan_route(grid, exact_limit=exact_limit)
+    walked = _walk(grid, start, route)
+    assert walked[-1] == start
+    reachable = _reachable_treasures(grid, start)
+    assert sorted(treasures) == sorted(reachable)
+    assert reachable <= set(walked)
+    stops = [start] + list(treasures) + [start]
+    at = 0
+    for stop in stops[1:]:                                                      #Treasures are passed in the order given
+        at = walked.index(stop, at)
+    return route, treasures, start
+
+
+def _shortest_tour(grid, start, treasures):
+    """Returns the length of the shortest route from start through every
+    treasure and back, trying every order."""
+    distances = dict((stop, _distances(grid, stop)) for stop in [start] + list(treasures))
+    best = None
+    for order in itertools.permutations(treasures):
+        stops = [start] + list(order) + [start]
+        length = sum(distances[here][there] for here, there in zip(stops, stops[1:]))
+        best = length if best is None else min(best, length)
+    return best if best is not None else 0
+
+
+@pytest.mark.parametrize('seed', range(40))
+def test_few_treasures_take_the_shortest_route(seed):
+    rng = random.Random(seed)
+    grid = _random_cave(rng, rng.randint(3, 12), rng.randint(3, 12), rng.randint(0, 6))
+    route, treasures, start = _check_route(grid)
+    assert len(route) == _shortest_tour(grid, start, treasures)
+
+
+@pytest.mark.parametrize('seed', range(20))
+def test_many_treasures_go_to_the_nearest_first(seed):
+    rng = random.Random(seed)
+    grid = _random_cave(rng, 12, 13, rng.randint(2, 20))
+    route, treasures, start = _check_route(grid, exact_limit=1)
+    here = start
+    left = set(treasures)
+    for treasure in treasures:
+        distances = _distances(grid, here)
+        assert distances[treasure] == min(distances[other] for other in left)
+        left.discard(treasure)
+        here = treasure
+
+
+@pytest.mark.parametrize('rows, cols, style, seed', every_cave())
+def test_generated_caves(make_cave, rows, cols, style, seed):
+    grid = load_map(make_cave(rows, cols, style, seed))
+    route, treasures, start = _check_route(grid)
+    if len(treasures) <= 6:
+        assert len(route) == _shortest_tour(grid, start, treasures)
+
+
+def test_map_without_explorer_is_refused():
+    with pytest.raises(ValueError):
+        plan_route(GridMap(3, 3, bytearray(b'WWWW.WWWW')))
@@ -0,0 +1,103 @@
+#-------------------------------------------------------------------------------
+# Name:        test_run.py
+# Purpose: To check that Explorer.run (in its tight loop, _run_fast, and on maps
+#          it can't run that way) explores exactly as calling move() step by
+#          step does, and that replaying the trace it records takes the same
+#          steps again.
+#
+# Author:      odanielb (Bridget O'Daniel)
+#-------------------------------------------------------------------------------
+from array import array
+
+import pytest
+
+from conftest import create_explorer, every_cave, explore_by_moves
+from Explorer import Explorer, TRACE_BACKTRACK
+from MapLoader import load_map
+
+MOVES = ((-1, 0), (0, 1), (0, -1), (1, 0))                                      #By trace code, as in TRACE_DIRECTIONS
+
+
+def _result(explorer):
+    """Returns everything about an Explorer that exploring changes."""
+    return (explorer.get_pos(), explorer.steps, explorer.backtracks, explorer.treasure,
+            explorer.steps_taken.size(), bytes(explorer.map.cells),
+            bytes(explorer.position_diary.possible), bytes(explorer.position_diary.visited))
+
+
+def _walk(start, trace):
+    """Returns the position after every step of trace, from start."""
+    row, col = start
+    positions = []
+    for code in trace:
+        row += MOVES[code & 3][0]
+        col += MOVES[code & 3][1]
+        positions.append((row, col))
+    return positions
+
+
+@pytest.mark.parametrize('rows, cols, style, seed', every_cave())
+def test_run_matches_move(make_cave, rows, cols, style, seed):
+    file_name = make_cave(rows, cols, style, seed)
+    by_moves, positions = explore_by_moves(file_name)
+    explorer = create_explorer(load_map(file_name))
+    start = explorer.get_pos()
+    finished, trace = explorer.run(record_trace=True)
+    assert finished
+    assert _result(explorer) == _result(by_moves)
+    assert _walk(start, trace) == positions
+    assert sum(1 for code in trace if code & TRACE_BACKTRACK) == by_moves.backtracks
+
+
+@pytest.mark.parametrize('rows, cols, style, seed', every_cave())
+def test_run_in_pieces_matches_move(make_cave, rows, cols, style, seed):
+    file_name = make_cave(rows, cols, style, seed)
+    by_moves = explore_by_moves(file_name)[0]
+    explorer = create_explorer(load_map(file_name))
+    finished = False
+    while not finished:
+        steps = explorer.steps
+        finished = explorer.run(7)[0]
+        assert explorer.steps - steps <= 7
+    assert _result(explorer) == _result(by_moves)
+
+
+@pytest.mark.parametrize('rows, cols, style, seed', every_cave())
+def test_run_without_neighbour_table_matches_move(make_cave, rows, cols, style, seed):
+    file_name = make_cave(rows, cols, style, seed)
+    by_moves, positions = explore_by_moves(file_name)
+    the_map = load_map(file_name)
+    start = divmod(the_map.cells.find(b'M'), cols)
+    explorer = Explorer(the_map.get_location(start[0], start[1]), the_map)     #No neighbour table, so run() calls move()
+    explorer.add_position_to_diary()
+    finished, trace = explorer.run(record_trace=True)
+    assert finished
+    assert _result(explorer) == _result(by_moves)
+    assert _walk(start, trace) == positions
+
+
+@pytest.mark.parametrize('rows, cols, style, seed', every_cave())
+def test_replay_takes_the_same_steps(make_cave, rows, cols, style, seed):
+    file_name = make_cave(rows, cols, style, seed)
+    the_map = load_map(file_name)
+    treasures = [divmod(index, cols) for index, cell in enumerate(bytes(the_map.cells)) if cell == ord('T')]
+    explorer = create_explorer(the_map)
+    trace = explorer.run(record_trace=True)[1]
+    replayed = create_explorer(load_map(file_name))
+    replayed.replay(trace[:len(trace) // 2])                                    #In two pieces, as a viewer might
+    replayed.replay(trace[len(trace) // 2:])
+    assert _result(replayed) == _result(explorer)
+    assert replayed.get_pos() == explorer.get_pos()
+    collected = [pos for pos in treasures if replayed.map[pos[0]][pos[1]].get_contents() != 'T']
+    assert replayed.get_treasure_count() == len(collected)
+
+
+def test_replay_refuses_steps_the_explorer_would_not_take(make_cave):
+    file_name = make_cave(12, 13, 'maze', 0)
+    trace = create_explorer(load_map(file_name)).run(record_trace=True)[1]
+    for at in (0, len(trace) // 2, len(trace) - 1):
+        bad = array('B', trace)
+        bad[at] ^= 1                                                            #Another direction
+        replayed = create_explorer(load_map(file_name))
+        with pytest.raises(ValueError):
+            replayed.replay(bad)
@@ -0,0 +1,194 @@
+#-------------------------------------------------------------------------------
+# Name:        test_session_server.py
+# Purpose: To check SessionServer's protocol from a client's side: that step
+#          events follow the Explorer step for step, that summaries and frames
+#          end where exploring in one process does, that edits are applied
+#          between batches, that sessions can be closed, and that bad commands
+#          get errors without ending the connection.
+#
+# Author:      odanielb (Bridget O'Daniel)
+#-------------------------------------------------------------------------------
+import asyncio
+import json
+
+import pytest
+
+from conftest import create_explorer, explore_by_moves
+from MapLoader import load_map
+from Renderer import CLEAR_SCREEN
+from SessionServer import SessionServer
+from test_renderer import Screen
+
+ENDS = ('finished', 'closed', 'error')
+
+
+class Client(object):
+    """One connection to a SessionServer, sending commands and reading events."""
+
+    def __init__(self, reader, writer):
+        self.reader = reader
+        self.writer = writer
+
+    async def send(self, **command):
+        self.writer.write((json.dumps(command)+"\n").encode())
+        await self.writer.drain()
+
+    async def read(self):
+        """Returns the next event."""
+        return json.loads(await asyncio.wait_for(self.reader.readline(), 30))
+
+    async def read_until(self, names):
+        """Returns every event up to and including the first one named in names."""
+        events = [await self.read()]
+        while events[-1]['event'] not in names:
+            events.append(await self.read())
+        return events
+
+
+def _serve(test):
+    """Runs test(server, client) against a new SessionServer, with one client
+    connected to it, and returns what it returns."""
+    async def run():
+        server = SessionServer()
+        await server.start()
+        reader, writer = await asyncio.open_connection('127.0.0.1', server.get_port(), limit=2 ** 24)
+        try:
+            return await test(server, Client(reader, writer))
+        finally:
+            writer.close()
+            await server.close()
+    return asyncio.run(run())
+
+
+def _counts(explorer):
+    return {'treasure': explorer.treasure, 'steps': explorer.steps, 'backtracks': explorer.backtracks}
+
+
+@pytest.mark.parametrize('batch', [1, 7, 1000])
+def test_steps_follow_the_explorer(make_cave, batch):
+    file_name = make_cave(31, 17, 'treasure', 1)
+    by_moves, positions = explore_by_moves(file_name)
+
+    async def test(server, client):
+        await client.send(cmd='open', file=file_name, stream='steps', batch=batch)
+        return await client.read_until(ENDS)
+    events = _serve(test)
+    assert events[0] == {'event': 'opened', 'session': 1, 'file': file_name, 'rows': 31, 'cols': 17,
+                         'start': list(create_explorer(load_map(file_name)).get_pos())}
+    steps = [event for event in events if event['event'] == 'step']
+    assert [tuple(event['pos']) for event in steps] == positions
+    assert sum(event['backtrack'] for event in steps) == by_moves.backtracks
+    progress = [event for event in events if event['event'] == 'progress']
+    assert len(progress) in (-(-len(positions) // batch), len(positions) // batch + 1)   #One more if the last batch only found there was nothing left
+    assert events[-1] == dict(_counts(by_moves), event='finished', session=1)
+
+
+def test_summary_and_frames(make_cave):
+    file_name = make_cave(31, 17, 'maze', 2)
+    by_moves = explore_by_moves(file_name)[0]
+
+    async def test(server, client):
+        await client.send(cmd='open', file=file_name, stream='summary')
+        await client.send(cmd='open', file=file_name, stream='frames', batch=20)
+        events = {}
+        while len(events) < 2 or any(session[-1]['event'] not in ENDS for session in events.values()):
+            event = await client.read()
+            events.setdefault(event['session'], []).append(event)
+        return events[1], events[2], dict(server.store.users)
+    summary, frames, users = _serve(test)
+    assert [event['event'] for event in summary] == ['opened', 'finished']
+    assert summary[-1] == dict(_counts(by_moves), event='finished', session=1)
+    drawn = [event['frame'] for event in frames if event['event'] == 'frame']
+    assert drawn[0].startswith(CLEAR_SCREEN) and not any(CLEAR_SCREEN in frame for frame in drawn[1:])
+    screen = Screen()
+    for frame in drawn:
+        screen.write(frame)
+    assert screen.lines() == [by_moves.map.get_row_string(row) for row in range(31)]
+    assert frames[-1] == dict(_counts(by_moves), event='finished', session=2)
+    assert users == {}                                                          #Every session let go of the map
+
+
+def test_edits_between_batches(make_cave):
+    file_name = make_cave(31, 17, 'maze', 1)
+    the_map = load_map(file_name)
+    wall = next(divmod(index, 17) for index in range(17 * 2, 17 * 29) if the_map.cells[index] == ord('W')
+                and 0 < index % 17 < 16)
+
+    async def test(server, client):
+        await client.send(cmd='open', file=file_name, stream='steps', batch=5)
+        events = await client.read_until(['progress'])
+        await client.send(cmd='edit', session=1, cells=[[wall[0], wall[1], '.']])
+        return events + await client.read_until(ENDS)
+    events = _serve(test)
+    edited = [at for at, event in enumerate(events) if event['event'] == 'edited']
+    assert len(edited) == 1
+    before = sum(1 for event in events[:edited[0]] if event['event'] == 'step')
+    expected = create_explorer(load_map(file_name))                             #Edited after the same steps
+    expected.run(before)
+    expected.apply_edits({wall: '.'})
+    assert events[edited[0]] == {'event': 'edited', 'session': 1, 'cells': 1, 'pos': list(expected.get_pos())}
+    expected.run()
+    assert events[-1] == dict(_counts(expected), event='finished', session=1)
+
+
+def test_closing_a_session(make_cave):
+    file_name = make_cave(99, 101, 'cavern', 0)
+
+    async def test(server, client):
+        await client.send(cmd='open', file=file_name, stream='steps', batch=1)
+        await client.read_until(['progress'])
+        await client.send(cmd='close', session=1)
+        events = await client.read_until(ENDS)
+        await client.send(cmd='close', session=1)
+        events.append(await client.read())
+        return events, dict(server.store.users)
+    events, users = _serve(test)
+    assert events[-2] == {'event': 'closed', 'session': 1}
+    assert events[-1] == {'event': 'error', 'message': "No such session!", 'session': 1}
+    assert users == {}
+
+
+def test_bad_commands_get_errors(make_cave, tmp_path):
+    file_name = make_cave(12, 13, 'maze', 0)
+    no_explorer = str(tmp_path / 'empty.txt')
+    with open(no_explorer, 'w') as cave_file:
+        cave_file.write("3 3\nWWW\nW.W\nWWW\n")
+    commands = [b'not json\n', b'[1, 2]\n', {'cmd': 'dance'},
+                {'cmd': 'open', 'file': str(tmp_path / 'missing.txt')},
+                {'cmd': 'open', 'file': file_name, 'stream': 'smoke signals'},
+                {'cmd': 'open', 'file': file_name, 'batch': 0},
+                {'cmd': 'open', 'file': no_explorer},
+                {'cmd': 'edit', 'session': 7, 'cells': []},
+                {'cmd': 'close', 'session': True}]
+
+    async def test(server, client):
+        events = []
+        for command in commands:
+            if isinstance(command, bytes):
+                client.writer.write(command)
+            else:
+                await client.send(**command)
+            events.append(await client.read())
+        await client.send(cmd='open', file=file_name, stream='summary')         #The connection still works
+        events.extend(await client.read_until(ENDS))
+        return events
+    events = _serve(test)
+    assert [event['event'] for event in events[:len(commands)]] == ['error'] * len(commands)
+    assert events[-1]['event'] == 'finished'
+
+
+def test_bad_edits_get_errors(make_cave):
+    file_name = make_cave(99, 101, 'cavern', 0)
+
+    async def test(server, client):
+        await client.send(cmd='open', file=file_name, stream='steps', batch=1)
+        await client.read_until(['progress'])
+        events = []
+        for cells in ('all of them', [[1, 2]], [[1, 2, 'M']], [[0, 0, '.']]):
+            await client.send(cmd='edit', session=1, cells=cells)
+            events.append(next(event for event in await client.read_until(['error']) if event['event'] == 'error'))
+        await client.send(cmd='close', session=1)
+        await client.read_until(ENDS)
+        return events
+    for event in _serve(test):
+        assert event['session'] == 1
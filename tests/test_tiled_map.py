@@ -0,0 +1,110 @@
+#-------------------------------------------------------------------------------
+# Name:        test_tiled_map.py
+# Purpose: To check that an Explorer on a TiledMap explores exactly as it does
+#          in memory, keeping no more tiles or diary blocks in memory than it is
+#          allowed to, that a SpillingPositionDiary remembers everything a
+#          PositionDiary does, and that the driver explores caves out of core.
+#
+# Author:      odanielb (Bridget O'Daniel)
+#-------------------------------------------------------------------------------
+import random
+
+import pytest
+
+from CaveFormat import load_cave, save_cave
+from CaveGenerator import STYLES
+from conftest import create_explorer, driver
+from Explorer import Explorer
+from MapLoader import load_map
+from PositionDiary import DIRECTION_BITS, PositionDiary, SpillingPositionDiary
+from TiledMap import TiledMap
+
+
+def _result(explorer):
+    """Returns the counts an Explorer keeps, and where it is."""
+    return explorer.get_pos(), explorer.steps, explorer.backtracks, explorer.treasure
+
+
+def _diary(diary, rows, cols):
+    """Returns everything in a diary, cell by cell."""
+    return [(diary.is_noted(row, col), diary.get_unexplored_mask(row, col),
+             diary.get_possible_directions(row, col), diary.get_visited_directions(row, col))
+            for row in range(rows) for col in range(cols)]
+
+
+@pytest.mark.parametrize('style', STYLES)
+def test_explores_as_in_memory_with_the_diary_spilled(make_cave, tmp_path, style):
+    file_name = make_cave(100, 90, style, 0)
+    in_memory = create_explorer(load_map(file_name))
+    in_memory.run()
+    cave_name = str(tmp_path / 'cave.cave')
+    save_cave(load_map(file_name), cave_name, 64, 64)
+    tiled_map = TiledMap(cave_name, max_tiles=1)
+    try:
+        explorer = Explorer(tiled_map.get_location(*tiled_map.start), tiled_map)
+        explorer.add_position_to_diary(tiled_map.start)
+        assert explorer.run()[0]
+        assert len(tiled_map.tiles) <= 1
+        diary = explorer.position_diary
+        assert len(diary.blocks) <= diary.max_blocks == 1                       #64x64 tiles line up with the diary's blocks
+        assert _result(explorer) == _result(in_memory)
+        assert _diary(diary, 100, 90) == _diary(in_memory.position_diary, 100, 90)
+        assert diary.spills and diary.reloads
+    finally:
+        tiled_map.close()
+    assert bytes(load_cave(cave_name).cells) == bytes(in_memory.map.cells)
+
+
+def test_spilling_diary_matches_position_diary():
+    rng = random.Random(0)
+    rows, cols = 200, 150
+    diaries = [PositionDiary(rows, cols), SpillingPositionDiary(rows, cols, 2)]
+    for _ in range(20000):
+        row, col = rng.randrange(rows), rng.randrange(cols)
+        action = rng.randrange(6)
+        bit = DIRECTION_BITS[rng.choice('NEWS')]
+        mask = rng.randrange(16)
+        for diary in diaries:
+            if action == 0:
+                diary.add(row, col, mask)
+            elif action == 1:
+                diary.note_visited(row, col, bit)
+            elif action == 2:
+                diary.open_direction(row, col, bit)
+            elif action == 3:
+                diary.close_direction(row, col, bit)
+            elif action == 4:
+                diary.forget(row, col)
+        answers = [(diary.is_noted(row, col), diary.get_unexplored_mask(row, col),
+                    diary.get_possible_directions(row, col), diary.get_visited_directions(row, col)) for diary in diaries]
+        assert answers[0] == answers[1]
+        assert len(diaries[1].blocks) <= 2
+    assert _diary(diaries[1], rows, cols) == _diary(diaries[0], rows, cols)
+    diaries[1].close()
+
+
+def test_treasures_are_read_when_asked_for(make_cave, tmp_path):
+    grid = load_map(make_cave(31, 17, 'treasure', 0))
+    cave_name = str(tmp_path / 'cave.cave')
+    save_cave(grid, cave_name, 5, 7)
+    tiled_map = TiledMap(cave_name)
+    try:
+        assert tiled_map.treasures is None
+        cells = bytes(grid.cells)
+        assert list(tiled_map.get_treasures()) == [divmod(index, 17) for index in range(len(cells)) if cells[index] == ord('T')]
+    finally:
+        tiled_map.close()
+
+
+@pytest.mark.parametrize('convert', [True, False])
+def test_driver_explores_out_of_core(make_cave, tmp_path, convert):
+    file_name = make_cave(300, 170, 'maze', 1)
+    in_memory = create_explorer(load_map(file_name))
+    in_memory.run()
+    if not convert:
+        save_cave(load_map(file_name), str(tmp_path / 'cave.cave'))
+        file_name = str(tmp_path / 'cave.cave')
+    explorer = driver.explore_out_of_core(file_name, 1)
+    assert _result(explorer) == _result(in_memory)
+    assert explorer.position_diary.spill.closed
+    assert bytes(load_cave(file_name+'.explored.cave').cells) == bytes(in_memory.map.cells)